@@ -0,0 +1,35 @@
+from sqlalchemy import BigInteger, Column, Date, Integer, String, DateTime, Index
+from sqlalchemy.sql import func
+
+from ...models.base import Base
+
+class AnalyticsRollup(Base):
+    """時間・日単位の集計値（分析用エンドポイントはこのテーブルだけを読む）"""
+    __tablename__ = "analytics_rollups"
+
+    metric = Column(String(32), primary_key=True)  # troubles.created / messages.created / users.active
+    granularity = Column(String(8), primary_key=True)  # hour / day
+    bucket_start = Column(DateTime, primary_key=True)  # 集計期間の開始日時（UTC）
+    dimension = Column(String(255), primary_key=True, default="")  # カテゴリー・プロジェクトID など（無い場合は空文字）
+    value = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # 期間指定で全ディメンションを取得する用
+        Index("ix_analytics_rollups_bucket", "metric", "granularity", "bucket_start"),
+    )
+
+class AnalyticsWatermark(Base):
+    """集計済みの位置（ソース・シャードごと。この位置までの行は集計に反映済み）"""
+    __tablename__ = "analytics_watermarks"
+
+    source = Column(String(64), primary_key=True)  # 例: troubles:default, users.last_login
+    last_id = Column(BigInteger, nullable=True)  # ID で追う場合
+    last_time = Column(DateTime, nullable=True)  # 日時で追う場合
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class AnalyticsActiveUser(Base):
+    """日ごとのアクティブユーザー（last_login_at は上書きされるため、集計時に日ごとに記録しておく）"""
+    __tablename__ = "analytics_active_users"
+
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
@@ -0,0 +1,273 @@
+"""
+分析用の集計（ロールアップ）
+
+- 生データ（お困りごと・メッセージ・ユーザーの最終ログイン日時）を集計済みの位置（ウォーターマーク）から
+  差分だけ読み、時間・日単位の件数を analytics_rollups に加算する
+  - お困りごと: シャードごとに ID で追い、カテゴリー別の作成数を集計する
+  - メッセージ: シャードごとに ID で追い、プロジェクト別の作成数を集計する
+  - アクティブユーザー: last_login_at で追い、日ごとのログインユーザーを analytics_active_users に記録して数える
+    （last_login_at は次のログインで上書きされるため、集計を始めた時点より前の日は数えられない）
+- 集計値とウォーターマークは既定のデータベースの同じトランザクションで更新するため、
+  途中で失敗しても二重に加算されない。ウォーターマークの行は SELECT ... FOR UPDATE で取得し、
+  複数プロセスで動かしても同じソースを並行して集計しない
+- 未コミットのトランザクションや write-behind で遅れて書き込まれる行を取りこぼさないよう、
+  ANALYTICS_ROLLUP_LAG_SECONDS より新しい行は次回に回す
+- 作成後に削除されたお困りごと・メッセージも作成数には含める
+"""
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.orm import Session
+
+from ...core.config import settings
+from ...core.database import SessionLocal, shard_registry
+from ...services.periodic import PeriodicWorker
+from ..messages.models import Message
+from ..troubles.models import Trouble
+from ..users.models import User
+from .models import AnalyticsActiveUser, AnalyticsRollup, AnalyticsWatermark
+
+# 集計の種類
+TROUBLES_CREATED = "troubles.created"
+MESSAGES_CREATED = "messages.created"
+USERS_ACTIVE = "users.active"
+
+# 集計の単位
+HOUR = "hour"
+DAY = "day"
+
+rollups_table = AnalyticsRollup.__table__
+active_users_table = AnalyticsActiveUser.__table__
+
+# (単位, 期間の開始日時, ディメンション) -> 件数
+Counts = Dict[Tuple[str, datetime, str], int]
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    """タイムゾーン付きの日時は UTC に変換してタイムゾーンを外す（集計値は UTC の naive な日時で持つ）"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def bucket_start(value: datetime, granularity: str) -> datetime:
+    value = to_naive_utc(value).replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0) if granularity == DAY else value
+
+
+def lock_watermark(db: Session, source: str) -> AnalyticsWatermark:
+    """ウォーターマークの行をロックして取得する（無ければ作成する）"""
+    watermark = (
+        db.query(AnalyticsWatermark)
+        .filter(AnalyticsWatermark.source == source)
+        .with_for_update()
+        .first()
+    )
+    if watermark is None:
+        watermark = AnalyticsWatermark(source=source)
+        db.add(watermark)
+        db.flush()
+    return watermark
+
+
+def add_counts(db: Session, metric: str, counts: Counts) -> None:
+    """集計値に加算する（既存の行は1回の executemany で UPDATE、無い行はまとめて INSERT）"""
+    if not counts:
+        return
+    buckets = [bucket for _, bucket, _ in counts]
+    existing = {
+        (granularity, bucket, dimension)
+        for granularity, bucket, dimension in
+        db.query(AnalyticsRollup.granularity, AnalyticsRollup.bucket_start, AnalyticsRollup.dimension)
+        .filter(
+            AnalyticsRollup.metric == metric,
+            AnalyticsRollup.bucket_start >= min(buckets),
+            AnalyticsRollup.bucket_start <= max(buckets),
+        )
+    }
+
+    updates = [
+        {"b_granularity": granularity, "b_bucket": bucket, "b_dimension": dimension, "b_value": value}
+        for (granularity, bucket, dimension), value in counts.items()
+        if (granularity, bucket, dimension) in existing
+    ]
+    inserts = [
+        {"metric": metric, "granularity": granularity, "bucket_start": bucket, "dimension": dimension, "value": value}
+        for (granularity, bucket, dimension), value in counts.items()
+        if (granularity, bucket, dimension) not in existing
+    ]
+    if updates:
+        db.execute(
+            update(rollups_table)
+            .where(
+                rollups_table.c.metric == metric,
+                rollups_table.c.granularity == bindparam("b_granularity"),
+                rollups_table.c.bucket_start == bindparam("b_bucket"),
+                rollups_table.c.dimension == bindparam("b_dimension"),
+            )
+            .values(value=rollups_table.c.value + bindparam("b_value")),
+            updates,
+        )
+    if inserts:
+        db.execute(insert(rollups_table), inserts)
+
+
+def _until_cutoff(rows, cutoff: datetime):
+    """
+    ID 順の行を cutoff より新しい最初の行の手前までに絞る
+    （それより後ろを先に集計するとウォーターマークが追い越し、手前の行を取りこぼすため）
+    """
+    for i, row in enumerate(rows):
+        if row.created_at is None or to_naive_utc(row.created_at) > cutoff:
+            return rows[:i]
+    return rows
+
+
+# ───────── お困りごと・メッセージ（シャードごとに ID で追う） ─────────
+def rollup_troubles(db: Session, sdb: Session, shard: str, cutoff: datetime, batch_size: int) -> int:
+    """
+    シャードの未集計のお困りごとを最大 batch_size 件集計する
+
+    :param db: 既定のデータベースのセッション（集計値・ウォーターマーク）
+    :param sdb: シャードのセッション（生データ）
+    :return: 集計した行数
+    """
+    watermark = lock_watermark(db, f"troubles:{shard}")
+    rows = _until_cutoff(
+        sdb.query(Trouble.id, Trouble.category, Trouble.created_at)
+        .filter(Trouble.id > (watermark.last_id or 0))
+        .order_by(Trouble.id)
+        .limit(batch_size)
+        .all(),
+        cutoff,
+    )
+    counts: Counts = Counter()
+    for row in rows:
+        for granularity in (HOUR, DAY):
+            counts[(granularity, bucket_start(row.created_at, granularity), row.category)] += 1
+    add_counts(db, TROUBLES_CREATED, counts)
+    if rows:
+        watermark.last_id = rows[-1].id
+    db.commit()
+    return len(rows)
+
+
+def rollup_messages(db: Session, sdb: Session, shard: str, cutoff: datetime, batch_size: int) -> int:
+    """シャードの未集計のメッセージを最大 batch_size 件、プロジェクト別に集計する"""
+    watermark = lock_watermark(db, f"messages:{shard}")
+    rows = _until_cutoff(
+        sdb.query(Message.id, Trouble.project_id, Message.created_at)
+        .join(Trouble, Trouble.id == Message.trouble_id)
+        .filter(Message.id > (watermark.last_id or 0))
+        .order_by(Message.id)
+        .limit(batch_size)
+        .all(),
+        cutoff,
+    )
+    counts: Counts = Counter()
+    for row in rows:
+        for granularity in (HOUR, DAY):
+            counts[(granularity, bucket_start(row.created_at, granularity), str(row.project_id))] += 1
+    add_counts(db, MESSAGES_CREATED, counts)
+    if rows:
+        watermark.last_id = rows[-1].id
+    db.commit()
+    return len(rows)
+
+
+# ───────── アクティブユーザー（最終ログイン日時で追う） ─────────
+def rollup_active_users(db: Session, cutoff: datetime) -> int:
+    """
+    前回からログインしたユーザーを日ごとのアクティブユーザーに記録し、日別の人数に加算する
+    同じ日時のログインがバッチの境目で分かれないよう、件数で区切らずに全件処理する
+
+    :return: 新たに記録したアクティブユーザーの数
+    """
+    watermark = lock_watermark(db, "users.last_login")
+    query = db.query(User.user_id, User.last_login_at).filter(User.last_login_at <= cutoff)
+    if watermark.last_time is not None:
+        query = query.filter(User.last_login_at > watermark.last_time)
+    rows = query.all()
+    logins = {(bucket_start(logged_in_at, DAY).date(), user_id) for user_id, logged_in_at in rows}
+    if not logins:
+        db.commit()
+        return 0
+
+    days = {day for day, _ in logins}
+    existing = {
+        (day, user_id) for day, user_id in
+        db.query(AnalyticsActiveUser.day, AnalyticsActiveUser.user_id)
+        .filter(AnalyticsActiveUser.day.in_(days), AnalyticsActiveUser.user_id.in_({user_id for _, user_id in logins}))
+    }
+    new_logins = logins - existing
+    if new_logins:
+        db.execute(insert(active_users_table), [{"day": day, "user_id": user_id} for day, user_id in new_logins])
+    counts: Counts = Counter()
+    for day, _ in new_logins:
+        counts[(DAY, datetime(day.year, day.month, day.day), "")] += 1
+    add_counts(db, USERS_ACTIVE, counts)
+    watermark.last_time = max(to_naive_utc(logged_in_at) for _, logged_in_at in rows)
+    db.commit()
+    return len(new_logins)
+
+
+class AnalyticsRollupWorker(PeriodicWorker):
+    """生データの差分を定期的に集計テーブルへ反映する"""
+
+    def __init__(
+        self,
+        interval: float = 300.0,
+        batch_size: int = 5000,
+        lag_seconds: int = 120,
+        session_factory: Callable[[], Session] = SessionLocal,
+        shard_session_factories: Optional[Dict[str, Callable[[], Session]]] = None,
+    ):
+        super().__init__("analytics-rollup", interval, run_on_start=True)
+        self._batch_size = batch_size
+        self._lag = timedelta(seconds=lag_seconds)
+        self._session_factory = session_factory
+        # シャード名 -> セッションファクトリー（未指定の場合は登録済みの全シャード）
+        self._shard_session_factories = shard_session_factories or shard_registry.session_factories()
+
+    def run_once(self) -> None:
+        self.rollup_pending()
+
+    def rollup_pending(self, now: Optional[datetime] = None) -> int:
+        """
+        全シャードの未集計の行をすべて集計する
+
+        :return: 集計した行数
+        """
+        cutoff = (now or datetime.utcnow()) - self._lag
+        total = 0
+        db = self._session_factory()
+        try:
+            for shard, session_factory in self._shard_session_factories.items():
+                sdb = session_factory()
+                try:
+                    for step in (rollup_troubles, rollup_messages):
+                        while not self.stopping:
+                            count = step(db, sdb, shard, cutoff, self._batch_size)
+                            total += count
+                            if count < self._batch_size:
+                                break
+                finally:
+                    sdb.close()
+            if not self.stopping:
+                total += rollup_active_users(db, cutoff)
+        except Exception as e:
+            print(f"分析用の集計エラー: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+        return total
+
+
+# アプリ全体で共有する集計処理
+analytics_rollup = AnalyticsRollupWorker(
+    interval=settings.ANALYTICS_ROLLUP_INTERVAL_SECONDS,
+    batch_size=settings.ANALYTICS_ROLLUP_BATCH_SIZE,
+    lag_seconds=settings.ANALYTICS_ROLLUP_LAG_SECONDS,
+)
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from ...core.config import settings
+from ...core.database import get_db
+from ...api.auth.jwt import get_current_user
+from ...api.users.models import User
+from .models import AnalyticsRollup
+from .rollup import TROUBLES_CREATED, MESSAGES_CREATED, USERS_ACTIVE, HOUR, DAY, bucket_start, to_naive_utc
+from . import schemas
+
+router = APIRouter()
+
+# 1回で取得できる期間
+MAX_RANGE = {HOUR: timedelta(days=14), DAY: timedelta(days=366)}
+# 期間を指定しなかった場合
+DEFAULT_RANGE = {HOUR: timedelta(hours=48), DAY: timedelta(days=30)}
+
+def admin_user_ids() -> set:
+    return {int(user_id) for user_id in settings.ADMIN_USER_IDS.split(",") if user_id.strip()}
+
+def require_admin(current_user: User = Depends(get_current_user)) -> User:
+    """ADMIN_USER_IDS に含まれるユーザーのみ許可する"""
+    if current_user.user_id not in admin_user_ids():
+        raise HTTPException(status_code=403, detail="管理者のみ利用できます")
+    return current_user
+
+def get_series(
+    db: Session,
+    metric: str,
+    granularity: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    dimension: Optional[str] = None,
+) -> schemas.RollupSeriesResponse:
+    """集計テーブルから期間 [start, end) の集計値を取得する（生データは読まない）"""
+    end = to_naive_utc(end) if end else datetime.utcnow()
+    start = to_naive_utc(start) if start else end - DEFAULT_RANGE[granularity]
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start は end より前の日時を指定してください")
+    if end - start > MAX_RANGE[granularity]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"期間は{MAX_RANGE[granularity].days}日以内で指定してください",
+        )
+
+    query = db.query(AnalyticsRollup.bucket_start, AnalyticsRollup.dimension, AnalyticsRollup.value).filter(
+        AnalyticsRollup.metric == metric,
+        AnalyticsRollup.granularity == granularity,
+        AnalyticsRollup.bucket_start >= bucket_start(start, granularity),
+        AnalyticsRollup.bucket_start < end,
+    )
+    if dimension is not None:
+        query = query.filter(AnalyticsRollup.dimension == dimension)
+    points = [
+        schemas.RollupPoint(bucket_start=row.bucket_start, dimension=row.dimension, value=row.value)
+        for row in query.order_by(AnalyticsRollup.bucket_start, AnalyticsRollup.dimension)
+    ]
+    return schemas.RollupSeriesResponse(
+        metric=metric,
+        granularity=granularity,
+        start=start,
+        end=end,
+        points=points,
+        total=sum(point.value for point in points),
+    )
+
+@router.get("/troubles", response_model=schemas.RollupSeriesResponse)
+def get_trouble_stats(
+    granularity: str = Query(DAY, pattern="^(hour|day)$"),
+    start: Optional[datetime] = Query(None, description="開始日時（UTC。未指定の場合は日単位で30日前、時間単位で48時間前）"),
+    end: Optional[datetime] = Query(None, description="終了日時（UTC。この日時を含まない。未指定の場合は現在）"),
+    category: Optional[str] = Query(None, description="指定した場合はこのカテゴリーのみ"),
+    admin: User = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """カテゴリー別の新規お困りごと数（dimension はカテゴリー）"""
+    return get_series(db, TROUBLES_CREATED, granularity, start, end, category)
+
+@router.get("/messages", response_model=schemas.RollupSeriesResponse)
+def get_message_stats(
+    granularity: str = Query(DAY, pattern="^(hour|day)$"),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    project_id: Optional[int] = Query(None, description="指定した場合はこのプロジェクトのみ"),
+    admin: User = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """プロジェクト別のメッセージ数（dimension はプロジェクトID）"""
+    dimension = str(project_id) if project_id is not None else None
+    return get_series(db, MESSAGES_CREATED, granularity, start, end, dimension)
+
+@router.get("/active-users", response_model=schemas.RollupSeriesResponse)
+def get_active_user_stats(
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    admin: User = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """日ごとのアクティブユーザー数（その日にログインしたユーザーの数）"""
+    return get_series(db, USERS_ACTIVE, DAY, start, end)
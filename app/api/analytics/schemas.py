@@ -0,0 +1,17 @@
+from datetime import datetime
+from typing import List
+
+from ...schemas.base import BaseSchemaModel
+
+class RollupPoint(BaseSchemaModel):
+    bucket_start: datetime  # 集計期間の開始日時（UTC）
+    dimension: str  # カテゴリー・プロジェクトID（無い場合は空文字）
+    value: int
+
+class RollupSeriesResponse(BaseSchemaModel):
+    metric: str
+    granularity: str  # hour / day
+    start: datetime
+    end: datetime
+    points: List[RollupPoint]
+    total: int  # points の合計
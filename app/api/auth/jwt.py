@@ -4,13 +4,26 @@ from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 # 相対インポートに変更
-from ...core.security import verify_password, SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
-from ...core.database import get_db
+from ...core.security import (
+    verify_password,
+    create_access_token,
+    create_refresh_token,
+    SECRET_KEY,
+    ALGORITHM,
+    REFRESH_TOKEN_TYPE,
+)
+from ...core.config import settings
+from ...core.database import SessionLocal, get_db
+from ...core.query_cache import cached
+from ...core.token_denylist import token_denylist
+from ...services.periodic import PeriodicWorker
 from ..users.models import User
 from ..users.schemas import TokenData
+from .models import RevokedToken
 
 # OAuth2のパスワードベアラースキーマを定義
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
@@ -48,28 +61,91 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[Use
         traceback.print_exc()
         return None
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+def revoke_token(db: Session, payload: dict) -> None:
     """
-    アクセストークンを生成する
+    トークンを失効させる
+    デナイリストに登録し、再起動後・他のプロセスでも復元できるようDBにも記録する
     
-    :param data: トークンに含めるデータ
-    :param expires_delta: トークンの有効期限
-    :return: JWTトークン
+    :param db: データベースセッション
+    :param payload: デコード済みのトークンペイロード
     """
-    to_encode = data.copy()
+    jti = payload.get("jti")
+    exp = payload.get("exp")
+    if jti is None or exp is None or jti in token_denylist:
+        return
     
-    # 有効期限の設定
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    token_denylist.add(jti, float(exp))
+    try:
+        db.merge(RevokedToken(jti=jti, expires_at=datetime.utcfromtimestamp(exp), revoked_at=datetime.utcnow()))
+        db.commit()
+    except Exception as e:
+        print(f"トークン失効の記録エラー: {str(e)}")
+        db.rollback()
+
+def consume_refresh_token(db: Session, payload: dict) -> bool:
+    """
+    リフレッシュトークンを使用済み（失効）として記録する
+    主キーの重複で判定するため、複数のワーカーで同時に使用された場合も成功するのは1回だけ
     
-    to_encode.update({"exp": expire})
+    :return: 記録できた場合は True、使用済み・失効済みの場合は False
+    """
+    jti = payload.get("jti")
+    exp = payload.get("exp")
+    if jti is None or exp is None or jti in token_denylist:
+        return False
+    
+    try:
+        db.add(RevokedToken(jti=jti, expires_at=datetime.utcfromtimestamp(exp), revoked_at=datetime.utcnow()))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        token_denylist.add(jti, float(exp))
+        return False
+    token_denylist.add(jti, float(exp))
+    return True
+
+def load_revoked_tokens(db: Session, since: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    DBに記録された失効トークンをデナイリストに読み込む
+    since を省略した場合はすべて読み込み（起動時）、期限切れの行はこのタイミングで削除する
+    since を指定した場合はそれ以降に失効したものだけを読み込む（他のプロセスで失効させた分の取り込み）
     
-    # トークンをエンコード
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    :return: 読み込んだ行の最新の失効日時（無い場合は since）
+    """
+    query = db.query(RevokedToken.jti, RevokedToken.expires_at, RevokedToken.revoked_at)
+    if since is None:
+        db.query(RevokedToken).filter(RevokedToken.expires_at <= datetime.utcnow()).delete(synchronize_session=False)
+        db.commit()
+    else:
+        query = query.filter(RevokedToken.revoked_at >= since)
     
-    return encoded_jwt
+    latest = since
+    for jti, expires_at, revoked_at in query:
+        token_denylist.add(jti, (expires_at - datetime(1970, 1, 1)).total_seconds())
+        if revoked_at is not None and (latest is None or revoked_at > latest):
+            latest = revoked_at
+    return latest
+
+class RevokedTokenSync(PeriodicWorker):
+    """
+    他のプロセスで失効させたトークンを定期的にデナイリストへ取り込む
+    認証の判定はデナイリスト（メモリ）だけで行い、リクエストごとにDBを参照しない
+    """
+
+    # 失効日時はコミット前に決まるため、前回の位置より少し前から読み直してコミットの遅れ・時計のずれを吸収する
+    OVERLAP = timedelta(seconds=30)
+
+    def __init__(self, interval: float):
+        super().__init__("revoked-token-sync", interval)
+        self._since = datetime.utcnow() - self.OVERLAP
+
+    def run_once(self) -> None:
+        db = SessionLocal()
+        try:
+            latest = load_revoked_tokens(db, since=self._since)
+        finally:
+            db.close()
+        self._since = max(self._since, latest - self.OVERLAP)
 
 # jwt.py の修正箇所
 def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> User:
@@ -95,14 +171,25 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_
         if user_id is None:
             raise credentials_exception
         
+        # リフレッシュトークンはAPIの認証に使用させない
+        if payload.get("type") == REFRESH_TOKEN_TYPE:
+            raise credentials_exception
+        
+        # 失効済み（ログアウト済み）のトークンを拒否
+        if payload.get("jti") in token_denylist:
+            raise credentials_exception
+        
         token_data = TokenData(user_id=user_id)
     except JWTError:
         raise credentials_exception
     
-    # user.id ではなく user.user_id を使用
-    user = db.query(User).filter(User.user_id == token_data.user_id).first()
+    # user.id ではなく user.user_id を使用（全リクエストで発行されるためクエリ結果キャッシュを使う）
+    user = cached(db.query(User).filter(User.user_id == token_data.user_id)).first()
     
     if user is None:
         raise credentials_exception
     
-    return user
\ No newline at end of file
+    return user
+
+# 失効トークンの取り込み（startup で起動する）
+revoked_token_sync = RevokedTokenSync(interval=settings.TOKEN_REVOCATION_SYNC_INTERVAL_SECONDS)
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, String, DateTime
+
+from ...models.base import Base
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    # 失効したトークンの jti（再起動後にデナイリストを復元するために永続化）
+    jti = Column(String(32), primary_key=True)
+    expires_at = Column(DateTime, index=True, nullable=False)  # 期限切れの行は起動時に削除
+    revoked_at = Column(DateTime, index=True)  # 他のプロセスが差分を取り込むための失効日時
@@ -7,10 +7,20 @@ from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
 from ...core.database import get_db
-from ...core.security import get_password_hash, ACCESS_TOKEN_EXPIRE_MINUTES
-from .jwt import authenticate_user, create_access_token
+from ...core.security import get_password_hash, decode_token, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_TYPE
+from .jwt import (
+    authenticate_user,
+    consume_refresh_token,
+    create_access_token,
+    create_refresh_token,
+    get_current_user,
+    oauth2_scheme,
+    revoke_token,
+)
 from ..users.models import User
-from ..users.schemas import UserCreate, UserResponse, Token
+from ..users.tasks import LAST_LOGIN
+from ...services.write_behind import write_behind
+from ..users.schemas import UserCreate, UserResponse, Token, RefreshTokenRequest, LogoutRequest
 
 router = APIRouter()
 
@@ -39,20 +49,24 @@ def login(
         print(f"認証成功: ユーザー '{form_data.username}' (ID: {user.user_id})")
         
         # 最終ログイン時間を更新
-        try:
-            user.last_login_at = datetime.utcnow()
-            db.commit()
-        except Exception as e:
-            print(f"ログイン時間の更新エラー: {str(e)}")
-            db.rollback()  # エラー時はロールバック
+        # 即時反映は不要なためバックグラウンドでまとめて書き込み、キューが使えない場合のみ同期更新する
+        logged_in_at = datetime.utcnow()
+        if not write_behind.enqueue(LAST_LOGIN, user.user_id, logged_in_at.isoformat()):
+            try:
+                user.last_login_at = logged_in_at
+                db.commit()
+            except Exception as e:
+                print(f"ログイン時間の更新エラー: {str(e)}")
+                db.rollback()  # エラー時はロールバック
         
-        # アクセストークンを生成
+        # アクセストークン・リフレッシュトークンを生成
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         try:
             access_token = create_access_token(
                 data={"sub": str(user.user_id)},  # 文字列に変換して確実に処理できるようにする
                 expires_delta=access_token_expires
             )
+            refresh_token = create_refresh_token(data={"sub": str(user.user_id)})
         except Exception as e:
             print(f"トークン生成エラー: {str(e)}")
             import traceback
@@ -65,6 +79,7 @@ def login(
         return {
             "access_token": access_token, 
             "token_type": "bearer",
+            "refresh_token": refresh_token,
             "user_id": user.user_id,
             "user_name": user.name
         }
@@ -116,16 +131,91 @@ def register_user(
     db.commit()
     db.refresh(user)
     
-    # アクセストークンを生成
+    # アクセストークン・リフレッシュトークンを生成
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.user_id},
+        data={"sub": str(user.user_id)},  # JWT の sub は文字列である必要がある
         expires_delta=access_token_expires
     )
+    refresh_token = create_refresh_token(data={"sub": str(user.user_id)})
     
     return {
         "access_token": access_token, 
         "token_type": "bearer",
+        "refresh_token": refresh_token,
         "user_id": user.user_id,
         "user_name": user.name
-    }
\ No newline at end of file
+    }
+
+@router.post("/refresh", response_model=Token)
+def refresh_access_token(
+    request: RefreshTokenRequest,
+    db: Session = Depends(get_db)
+) -> Any:
+    """
+    リフレッシュトークンでアクセストークンを再発行する
+    使用したリフレッシュトークンは失効させ、新しいリフレッシュトークンを発行する（ローテーション）
+    """
+    invalid_token_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="リフレッシュトークンが無効です",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    
+    payload = decode_token(request.refresh_token)
+    if (
+        payload is None
+        or payload.get("type") != REFRESH_TOKEN_TYPE
+        or payload.get("sub") is None
+    ):
+        raise invalid_token_exception
+    
+    user = db.query(User).filter(User.user_id == int(payload["sub"])).first()
+    if user is None:
+        raise invalid_token_exception
+    
+    # 使用済みのリフレッシュトークンを失効させる（他のワーカーを含め使用済みの場合は拒否）
+    if not consume_refresh_token(db, payload):
+        raise invalid_token_exception
+    
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": str(user.user_id)},
+        expires_delta=access_token_expires
+    )
+    refresh_token = create_refresh_token(data={"sub": str(user.user_id)})
+    
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "user_id": user.user_id,
+        "user_name": user.name
+    }
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+def logout(
+    request: LogoutRequest = None,
+    token: str = Depends(oauth2_scheme),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    ログアウト
+    現在のアクセストークン（指定があればリフレッシュトークンも）を失効させる
+    """
+    payload = decode_token(token)
+    if payload:
+        revoke_token(db, payload)
+    
+    if request and request.refresh_token:
+        refresh_payload = decode_token(request.refresh_token)
+        # 他人のリフレッシュトークンは失効させない
+        if (
+            refresh_payload
+            and refresh_payload.get("type") == REFRESH_TOKEN_TYPE
+            and refresh_payload.get("sub") == str(current_user.user_id)
+        ):
+            revoke_token(db, refresh_payload)
+    
+    return None
\ No newline at end of file
@@ -0,0 +1,82 @@
+from typing import Dict, List, Tuple
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from ...core.database import ShardSessions, get_db, get_shards
+from ...api.auth.jwt import get_current_user
+from ...api.users.models import User
+from ...api.users.schemas import UserSummary
+from ...api.projects.models import Project
+from ...api.projects.router import convert_projects
+from ...api.troubles.models import Trouble
+from ...api.troubles.router import build_trouble_responses
+from . import schemas
+
+router = APIRouter()
+
+def _unique(ids: List[int]) -> List[int]:
+    """重複を除いて、最初に現れた順序を保つ"""
+    return list(dict.fromkeys(ids))
+
+def _split_found(ids: List[int], found: Dict[int, object]) -> Tuple[list, List[int]]:
+    """要求順に並べた取得結果と、見つからなかったIDに分ける"""
+    items = [found[i] for i in ids if i in found]
+    missing = [i for i in ids if i not in found]
+    return items, missing
+
+def _get_users(db: Session, ids: List[int]) -> schemas.BatchUsers:
+    if not ids:
+        return schemas.BatchUsers()
+    users = db.query(User).filter(User.user_id.in_(ids)).all()
+    found = {
+        u.user_id: UserSummary(
+            id=u.user_id,
+            name=u.name,
+            categories=u.get_categories_list(),
+            points=u.get_points(),
+        )
+        for u in users
+    }
+    items, missing = _split_found(ids, found)
+    return schemas.BatchUsers(items=items, missing=missing)
+
+def _get_projects(db: Session, ids: List[int], current_user: User) -> schemas.BatchProjects:
+    if not ids:
+        return schemas.BatchProjects()
+    # 一覧・詳細と同じ変換（いいね数・コメント数は集計値。お気に入り状態・作者名は IN 句の1クエリずつ）
+    projects = db.query(Project).filter(Project.project_id.in_(ids)).all()
+    found = {project.id: project for project in convert_projects(projects, db, current_user.user_id)}
+    items, missing = _split_found(ids, found)
+    return schemas.BatchProjects(items=items, missing=missing)
+
+def _get_troubles(db: Session, shards: ShardSessions, ids: List[int]) -> schemas.BatchTroubles:
+    if not ids:
+        return schemas.BatchTroubles()
+    troubles = [
+        trouble
+        for sdb, shard_ids in shards.group_by_id(ids)
+        for trouble in sdb.query(Trouble).filter(Trouble.id.in_(shard_ids), Trouble.deleted_at.is_(None)).all()
+    ]
+    found = {response.id: response for response in build_trouble_responses(db, shards, troubles)}
+    items, missing = _split_found(ids, found)
+    return schemas.BatchTroubles(items=items, missing=missing)
+
+@router.post("/", response_model=schemas.BatchGetResponse)
+def batch_get(
+    request: schemas.BatchGetRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards)
+):
+    """
+    ユーザー・プロジェクト・お困りごとをIDでまとめて取得する
+    - リソース種別ごとに IN 句の1クエリで取得（関連情報も種別ごとにまとめて取得）
+    - 重複したIDは1件にまとめ、指定された順序で返す
+    - 見つからなかったIDは missing に含める
+    """
+    return schemas.BatchGetResponse(
+        users=_get_users(db, _unique(request.users)),
+        projects=_get_projects(db, _unique(request.projects), current_user),
+        troubles=_get_troubles(db, shards, _unique(request.troubles)),
+    )
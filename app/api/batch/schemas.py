@@ -0,0 +1,32 @@
+from typing import List
+from pydantic import Field
+
+from ...schemas.base import BaseSchemaModel
+from ..users.schemas import UserSummary
+from ..projects.schemas import ProjectResponse
+from ..troubles.schemas import TroubleResponse
+
+# 1リクエストで指定できるリソース種別ごとのID数の上限
+BATCH_MAX_IDS = 100
+
+class BatchGetRequest(BaseSchemaModel):
+    users: List[int] = Field(default=[], max_length=BATCH_MAX_IDS, description="取得するユーザーID")
+    projects: List[int] = Field(default=[], max_length=BATCH_MAX_IDS, description="取得するプロジェクトID")
+    troubles: List[int] = Field(default=[], max_length=BATCH_MAX_IDS, description="取得するお困りごとID")
+
+class BatchUsers(BaseSchemaModel):
+    items: List[UserSummary] = []
+    missing: List[int] = []
+
+class BatchProjects(BaseSchemaModel):
+    items: List[ProjectResponse] = []
+    missing: List[int] = []
+
+class BatchTroubles(BaseSchemaModel):
+    items: List[TroubleResponse] = []
+    missing: List[int] = []
+
+class BatchGetResponse(BaseSchemaModel):
+    users: BatchUsers
+    projects: BatchProjects
+    troubles: BatchTroubles
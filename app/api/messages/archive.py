@@ -0,0 +1,292 @@
+"""
+古いメッセージのアーカイブ（ホット / アーカイブの2層構成）
+
+一定期間書き込みの無いスレッド（最新メッセージが MESSAGE_ARCHIVE_AFTER_DAYS 日より古いお困りごと）の
+メッセージを messages から message_archives に移動する。
+アーカイブはお困りごとごとに MESSAGE_ARCHIVE_PAGE_SIZE 件ずつのページにまとめ、
+JSON を zlib 圧縮して1行に保存するため、messages テーブルとそのインデックスは
+活発なスレッドの分だけの大きさに保たれる。
+
+- アーカイブ済みのメッセージは常にそのスレッドのホットなメッセージより古い
+  （スレッドの先頭からアーカイブ分 → ホット分の順に並ぶ）
+- 一覧取得ではページのメタデータ（件数）だけを読み、要求範囲に掛かるページの本体だけを読み込む
+- アーカイブ後にスレッドへ新しい書き込みがあれば、それはホット側に追加され、
+  再び一定期間書き込みが無くなった時点で次のページとして追記される
+- アーカイブはお困りごとと同じシャードに置く（MessageArchiver は全シャードを処理する）
+"""
+import json
+import zlib
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import case, delete, func, select
+from sqlalchemy.orm import Session
+
+from ...core.config import settings
+from ...core.database import shard_registry
+from ...services.periodic import PeriodicWorker
+from ..troubles.models import Trouble
+from .models import Message, MessageArchive
+
+messages_table = Message.__table__
+
+# 1トランザクションで移動するページ数
+PAGES_PER_TRANSACTION = 50
+
+
+class ArchivedMessage(NamedTuple):
+    """アーカイブから復元したメッセージ"""
+    id: int
+    user_id: int
+    trouble_id: int
+    content: str
+    created_at: Optional[datetime]
+
+
+class ArchivePage(NamedTuple):
+    """アーカイブページのメタデータ（本体は含まない）"""
+    page_no: int
+    message_count: int
+    last_message_id: int
+    last_created_at: Optional[datetime]
+
+
+# ───────── ページの圧縮・展開 ─────────
+def encode_page(rows: Iterable[tuple]) -> bytes:
+    """(id, user_id, content, created_at) の列をページの本体に変換する"""
+    data = [
+        [message_id, user_id, content, created_at.isoformat() if created_at else None]
+        for message_id, user_id, content, created_at in rows
+    ]
+    return zlib.compress(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+def decode_page(trouble_id: int, payload: bytes) -> List[ArchivedMessage]:
+    """ページの本体をメッセージの列に戻す"""
+    return [
+        ArchivedMessage(
+            id=message_id,
+            user_id=user_id,
+            trouble_id=trouble_id,
+            content=content,
+            created_at=datetime.fromisoformat(created_at) if created_at else None,
+        )
+        for message_id, user_id, content, created_at in json.loads(zlib.decompress(payload))
+    ]
+
+
+# ───────── 件数 ─────────
+def archived_count_subquery(trouble_id_column):
+    """お困りごとごとのアーカイブ済みメッセージ数（相関スカラーサブクエリ）"""
+    return (
+        select(func.coalesce(func.sum(MessageArchive.message_count), 0))
+        .where(MessageArchive.trouble_id == trouble_id_column)
+        .scalar_subquery()
+    )
+
+
+def get_archived_counts(db: Session, trouble_ids: Iterable[int]) -> Dict[int, int]:
+    """お困りごとごとのアーカイブ済みメッセージ数をまとめて取得する"""
+    trouble_ids = list(trouble_ids)
+    if not trouble_ids:
+        return {}
+    return {
+        trouble_id: int(count) for trouble_id, count in
+        db.query(MessageArchive.trouble_id, func.sum(MessageArchive.message_count))
+        .filter(MessageArchive.trouble_id.in_(trouble_ids))
+        .group_by(MessageArchive.trouble_id)
+    }
+
+
+def count_archived_upto(db: Session, trouble_id: int, message_id: int) -> int:
+    """お困りごとのアーカイブ済みメッセージのうち、ID が message_id 以下のものの数"""
+    total = 0
+    for first_message_id, last_message_id, message_count, payload in (
+        db.query(
+            MessageArchive.first_message_id,
+            MessageArchive.last_message_id,
+            MessageArchive.message_count,
+            # ページ全体が範囲内なら本体は読まない
+            case((MessageArchive.last_message_id > message_id, MessageArchive.payload), else_=None),
+        )
+        .filter(MessageArchive.trouble_id == trouble_id, MessageArchive.first_message_id <= message_id)
+    ):
+        if last_message_id <= message_id:
+            total += message_count
+        else:
+            total += sum(1 for message in decode_page(trouble_id, payload) if message.id <= message_id)
+    return total
+
+
+# ───────── 読み込み ─────────
+def get_archive_index(db: Session, trouble_id: int) -> List[ArchivePage]:
+    """お困りごとのアーカイブページ一覧（古い順、本体は読み込まない）"""
+    return [
+        ArchivePage(*row) for row in
+        db.query(
+            MessageArchive.page_no,
+            MessageArchive.message_count,
+            MessageArchive.last_message_id,
+            MessageArchive.last_created_at,
+        )
+        .filter(MessageArchive.trouble_id == trouble_id)
+        .order_by(MessageArchive.page_no)
+    ]
+
+
+def load_archived_messages(
+    db: Session, trouble_id: int, index: List[ArchivePage], skip: int, limit: int
+) -> List[ArchivedMessage]:
+    """
+    スレッド先頭から skip 件目以降 limit 件のうち、アーカイブに含まれる分を返す
+    要求範囲に掛かるページの本体だけを読み込む
+    """
+    needed: Dict[int, int] = {}  # ページ番号 -> ページ先頭のスレッド内位置
+    start = 0
+    for page in index:
+        end = start + page.message_count
+        if end > skip and start < skip + limit:
+            needed[page.page_no] = start
+        start = end
+    if not needed:
+        return []
+
+    payloads = dict(
+        db.query(MessageArchive.page_no, MessageArchive.payload)
+        .filter(MessageArchive.trouble_id == trouble_id, MessageArchive.page_no.in_(list(needed)))
+    )
+    result: List[ArchivedMessage] = []
+    for page_no in sorted(needed):
+        page_start = needed[page_no]
+        messages = decode_page(trouble_id, payloads[page_no])
+        result.extend(messages[max(0, skip - page_start):skip + limit - page_start])
+    return result
+
+
+# ───────── アーカイブ ─────────
+def archive_trouble(db: Session, trouble_id: int, cutoff: datetime, page_size: int) -> int:
+    """
+    お困りごとの cutoff より古いメッセージをアーカイブに移動する
+    PAGES_PER_TRANSACTION ページ分ずつ、ページの追加とメッセージの削除を同じトランザクションで行う
+
+    :return: 移動したメッセージ数
+    """
+    moved = 0
+    last_id = 0
+    next_page = (
+        db.query(func.max(MessageArchive.page_no)).filter(MessageArchive.trouble_id == trouble_id).scalar()
+    )
+    next_page = 0 if next_page is None else next_page + 1
+
+    while True:
+        rows = (
+            db.query(Message.id, Message.user_id, Message.content, Message.created_at)
+            .filter(Message.trouble_id == trouble_id, Message.created_at < cutoff, Message.id > last_id)
+            .order_by(Message.id)
+            .limit(page_size * PAGES_PER_TRANSACTION)
+            .all()
+        )
+        if not rows:
+            return moved
+
+        for i in range(0, len(rows), page_size):
+            page = rows[i:i + page_size]
+            db.add(MessageArchive(
+                trouble_id=trouble_id,
+                page_no=next_page,
+                first_message_id=page[0].id,
+                last_message_id=page[-1].id,
+                message_count=len(page),
+                last_created_at=page[-1].created_at,
+                payload=encode_page(page),
+            ))
+            next_page += 1
+
+        last_id = rows[-1].id
+        db.execute(
+            delete(messages_table).where(
+                messages_table.c.trouble_id == trouble_id,
+                messages_table.c.id.between(rows[0].id, last_id),
+                messages_table.c.created_at < cutoff,
+            )
+        )
+        db.commit()
+        moved += len(rows)
+
+
+def find_quiet_troubles(db: Session, cutoff: datetime, limit: int) -> List[int]:
+    """最新メッセージが cutoff より古い（書き込みが止まった）お困りごとを探す"""
+    return [
+        trouble_id for (trouble_id,) in
+        db.query(Message.trouble_id)
+        .join(Trouble, Trouble.id == Message.trouble_id)
+        .filter(Trouble.deleted_at.is_(None))
+        .group_by(Message.trouble_id)
+        .having(func.max(Message.created_at) < cutoff)
+        .limit(limit)
+    ]
+
+
+class MessageArchiver(PeriodicWorker):
+    """書き込みの止まったスレッドのメッセージを定期的にアーカイブする"""
+
+    def __init__(
+        self,
+        interval: float = 3600.0,
+        after_days: int = 90,
+        page_size: int = 200,
+        troubles_per_run: int = 50,
+        session_factories: Optional[Dict[str, Callable[[], Session]]] = None,
+    ):
+        super().__init__("message-archiver", interval, run_on_start=True)
+        self._after_days = after_days
+        self._page_size = page_size
+        self._troubles_per_run = troubles_per_run
+        # シャード名 -> セッションファクトリー（未指定の場合は登録済みの全シャード）
+        self._session_factories = session_factories or shard_registry.session_factories()
+
+    def run_once(self) -> None:
+        self.archive_pending()
+
+    def archive_pending(self) -> int:
+        """
+        シャードごとにアーカイブ対象のスレッドを最大 troubles_per_run 件処理する
+
+        :return: 移動したメッセージ数
+        """
+        cutoff = datetime.utcnow() - timedelta(days=self._after_days)
+        moved = 0
+        for session_factory in self._session_factories.values():
+            if self.stopping:
+                break
+            moved += self._archive_shard(session_factory, cutoff)
+        return moved
+
+    def _archive_shard(self, session_factory: Callable[[], Session], cutoff: datetime) -> int:
+        db = session_factory()
+        try:
+            trouble_ids = find_quiet_troubles(db, cutoff, self._troubles_per_run)
+            db.commit()
+            moved = 0
+            for trouble_id in trouble_ids:
+                if self.stopping:
+                    break
+                try:
+                    moved += archive_trouble(db, trouble_id, cutoff, self._page_size)
+                except Exception as e:
+                    print(f"メッセージのアーカイブエラー（お困りごと {trouble_id}）: {str(e)}")
+                    db.rollback()
+            if moved:
+                print(f"メッセージをアーカイブしました: {len(trouble_ids)}スレッド・{moved}件")
+            return moved
+        finally:
+            db.close()
+
+
+# アプリ全体で共有するアーカイブ処理
+message_archiver = MessageArchiver(
+    interval=settings.MESSAGE_ARCHIVE_INTERVAL_SECONDS,
+    after_days=settings.MESSAGE_ARCHIVE_AFTER_DAYS,
+    page_size=settings.MESSAGE_ARCHIVE_PAGE_SIZE,
+    troubles_per_run=settings.MESSAGE_ARCHIVE_TROUBLES_PER_RUN,
+)
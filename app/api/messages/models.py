@@ -1,6 +1,7 @@
 # app/api/messages/models.py を以下のように修正
-from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, LargeBinary
+from sqlalchemy.dialects.mysql import MEDIUMBLOB
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 
 from ...models.base import Base
@@ -14,9 +15,33 @@ class Message(Base):
     # users.id を users.user_id に修正
     user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
     # troubles.id が正しい参照先
-    trouble_id = Column(Integer, ForeignKey("troubles.id"), nullable=False)
+    trouble_id = Column(Integer, ForeignKey("troubles.id"), nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # リレーションシップ
     user = relationship("User", back_populates="messages")
-    trouble = relationship("Trouble", back_populates="messages")
\ No newline at end of file
+    trouble = relationship("Trouble", back_populates="messages")
+
+class MessageArchive(Base):
+    __tablename__ = "message_archives"
+
+    # 古いメッセージをお困りごとごと・ページ単位にまとめて圧縮保存したもの（messages から移動する）
+    trouble_id = Column(Integer, ForeignKey("troubles.id"), primary_key=True)
+    page_no = Column(Integer, primary_key=True)  # 0 から始まる連番（古い順）
+    first_message_id = Column(Integer, nullable=False)
+    last_message_id = Column(Integer, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    last_created_at = Column(DateTime(timezone=True), nullable=True)
+    # zlib 圧縮した JSON（[[id, user_id, content, created_at], ...]）。ページの本体は必要なときだけ読み込む
+    payload = deferred(Column(LargeBinary().with_variant(MEDIUMBLOB(), "mysql"), nullable=False))
+
+class TroubleReadMarker(Base):
+    __tablename__ = "trouble_read_markers"
+
+    # ユーザーごと・お困りごとごとの既読位置（1組につき1行。ユーザー単位の範囲検索で全件を取得できる主キー順）
+    # 既定のデータベースにのみ置く（お困りごとの ID はシャードをまたいで一意のため外部キーは張らない）
+    user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
+    trouble_id = Column(Integer, primary_key=True, autoincrement=False, index=True)  # お困りごとの削除時に使う
+    last_read_message_id = Column(Integer, nullable=False, default=0)  # ここまで読んだメッセージのID
+    read_count = Column(Integer, nullable=False, default=0)  # 既読位置までのスレッド内のメッセージ数（未読数 = 総数 - これ）
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,13 +1,20 @@
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.orm import Session
+from sqlalchemy import func
 
 # 相対インポートに修正
-from ...core.database import get_db
+from ...core.database import ShardSessions, get_db, get_shards
+from ...core.query_cache import cached
+from ...core.http_cache import conditional_response, make_etag
 from ...api.auth.jwt import get_current_user
 from ...api.users.models import User
 from ...api.troubles.models import Trouble
-from .models import Message
+from ...api.points.service import award_points, MESSAGE_REPLIED
+from ...services.outbox import record_change, MESSAGE, CREATED
+from .models import Message, TroubleReadMarker
+from .archive import get_archive_index, load_archived_messages
+from .unread import ThreadHead, count_messages_upto, latest_messages, mark_read
 from . import schemas
 
 router = APIRouter()
@@ -16,13 +23,17 @@ router = APIRouter()
 def create_message(
     message: schemas.MessageCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards)
 ):
     """
-    新しいメッセージを作成する
+    新しいメッセージを作成する（お困りごとと同じシャードに保存する）
     """
     # お困りごとの存在確認
-    trouble = db.query(Trouble).filter(Trouble.id == message.trouble_id).first()
+    sdb = shards.for_id(message.trouble_id)
+    trouble = cached(
+        sdb.query(Trouble).filter(Trouble.id == message.trouble_id, Trouble.deleted_at.is_(None))
+    ).first() if sdb is not None else None
     if not trouble:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -32,13 +43,34 @@ def create_message(
     # 新しいメッセージを作成
     new_message = Message(
         content=message.content,
-        user_id=current_user.id,
+        user_id=current_user.user_id,
         trouble_id=message.trouble_id
     )
     
-    db.add(new_message)
-    db.commit()
-    db.refresh(new_message)
+    sdb.add(new_message)
+    sdb.flush()
+    record_change(sdb, MESSAGE, new_message.id, CREATED, {
+        "id": new_message.id,
+        "content": new_message.content,
+        "user_id": new_message.user_id,
+        "trouble_id": new_message.trouble_id,
+        "project_id": trouble.project_id,
+        "trouble_author_id": trouble.author_id,
+        "trouble_title": trouble.title,
+    })
+    sdb.commit()
+    sdb.refresh(new_message)
+    
+    # 未読管理: スレッドの最新位置を更新し、投稿者自身はそこまで既読にする
+    head = latest_messages.record(sdb, new_message.trouble_id, new_message.id)
+    if head.last_message_id != new_message.id:
+        # 同時に投稿された後続のメッセージまでは既読にしない
+        head = ThreadHead(new_message.id, count_messages_upto(sdb, new_message.trouble_id, new_message.id))
+    mark_read(db, current_user.user_id, new_message.trouble_id, head, background=True)
+    
+    # 他の人のお困りごとへの返信にポイントを付与（自分のお困りごとへの書き込みは対象外）
+    if trouble.author_id != current_user.user_id:
+        award_points(db, current_user.user_id, MESSAGE_REPLIED, new_message.id)
     
     return schemas.MessageResponse(
         id=new_message.id,
@@ -52,36 +84,71 @@ def create_message(
 @router.get("/trouble/{trouble_id}", response_model=schemas.MessagesListResponse)
 def get_messages_by_trouble(
     trouble_id: int,
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
     db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards),
     current_user: User = Depends(get_current_user)
 ):
     """
     特定のお困りごとに関するメッセージの一覧を取得する
+    メッセージは追記のみのため、件数・最大ID・最新投稿日時から ETag を計算し、
+    変更が無ければ本体を読み込まずに 304 を返す
     """
-    # お困りごとの存在確認
-    trouble = db.query(Trouble).filter(Trouble.id == trouble_id).first()
-    if not trouble:
+    # お困りごとの存在確認（メッセージはお困りごとと同じシャードから読む）
+    sdb = shards.for_id(trouble_id)
+    trouble_exists = cached(
+        sdb.query(Trouble.id).filter(Trouble.id == trouble_id, Trouble.deleted_at.is_(None))
+    ).first() if sdb is not None else None
+    if not trouble_exists:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="指定されたお困りごとが見つかりません"
         )
     
-    # メッセージの取得
-    query = db.query(Message).filter(Message.trouble_id == trouble_id)
-    total = query.count()
-    messages = query.order_by(Message.created_at).offset(skip).limit(limit).all()
+    # スレッドのバージョン情報を取得（アーカイブ済みの分はページのメタデータから数える）
+    archive_index = get_archive_index(sdb, trouble_id)
+    archived_total = sum(page.message_count for page in archive_index)
+    hot_total, max_message_id, last_posted_at = (
+        sdb.query(func.count(Message.id), func.max(Message.id), func.max(Message.created_at))
+        .filter(Message.trouble_id == trouble_id)
+        .one()
+    )
+    total = archived_total + hot_total
+    if archive_index:
+        max_message_id = max_message_id or archive_index[-1].last_message_id
+        last_posted_at = last_posted_at or archive_index[-1].last_created_at
+    not_modified = conditional_response(
+        request,
+        response,
+        make_etag("messages", trouble_id, skip, limit, total, max_message_id),
+        last_posted_at,
+    )
+    if not_modified:
+        return not_modified
+    
+    # メッセージの取得（スレッド先頭のアーカイブ分 → ホットな messages の順に読む）
+    messages = load_archived_messages(sdb, trouble_id, archive_index, skip, limit)
+    remaining = limit - len(messages)
+    if remaining > 0:
+        query = sdb.query(Message).filter(Message.trouble_id == trouble_id)
+        messages += query.order_by(Message.created_at).offset(max(0, skip - archived_total)).limit(remaining).all()
+    
+    # 投稿者名はまとめて取得
+    user_names = dict(
+        db.query(User.user_id, User.name).filter(User.user_id.in_({msg.user_id for msg in messages})).all()
+    ) if messages else {}
     
     # レスポンスの作成
     message_responses = []
     for msg in messages:
-        user = db.query(User).filter(User.id == msg.user_id).first()
         message_responses.append(schemas.MessageResponse(
             id=msg.id,
             content=msg.content,
             user_id=msg.user_id,
-            user_name=user.name if user else "Unknown",
+            user_name=user_names.get(msg.user_id, "Unknown"),
             trouble_id=msg.trouble_id,
             created_at=msg.created_at
         ))
@@ -89,4 +156,82 @@ def get_messages_by_trouble(
     return schemas.MessagesListResponse(
         messages=message_responses,
         total=total
-    )
\ No newline at end of file
+    )
+
+@router.get("/unread", response_model=schemas.UnreadCountsResponse)
+def get_unread_counts(
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    ログインユーザーが追跡しているお困りごと（自分のお困りごと・読んだ / 書き込んだお困りごと）の未読数を取得する
+    既読位置は1クエリで取得し、未読数はスレッドの総数との引き算で求める
+    """
+    markers = {
+        trouble_id: (last_read_message_id, read_count)
+        for trouble_id, last_read_message_id, read_count in
+        db.query(TroubleReadMarker.trouble_id, TroubleReadMarker.last_read_message_id, TroubleReadMarker.read_count)
+        .filter(TroubleReadMarker.user_id == current_user.user_id)
+    }
+    heads = {}
+    for sdb, trouble_ids in shards.group_by_id(markers):
+        heads.update(latest_messages.get_many(sdb, trouble_ids))
+    
+    # 削除済みのお困りごとは含めない
+    counts = [
+        schemas.UnreadCount(
+            trouble_id=trouble_id,
+            last_message_id=heads[trouble_id].last_message_id,
+            last_read_message_id=last_read_message_id,
+            unread=max(0, heads[trouble_id].message_count - read_count),
+        )
+        for trouble_id, (last_read_message_id, read_count) in markers.items()
+        if trouble_id in heads
+    ]
+    return schemas.UnreadCountsResponse(
+        troubles=counts,
+        total_unread=sum(c.unread for c in counts),
+    )
+
+@router.put("/trouble/{trouble_id}/read", response_model=schemas.UnreadCount)
+def mark_trouble_read(
+    trouble_id: int,
+    marker: schemas.ReadMarkerUpdate,
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    お困りごとのスレッドを既読にする（message_id 指定時はそのメッセージまで）
+    既読位置は後退しない
+    """
+    sdb = shards.for_id(trouble_id)
+    head = latest_messages.get_many(sdb, [trouble_id]).get(trouble_id) if sdb is not None else None
+    if head is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="指定されたお困りごとが見つかりません"
+        )
+    
+    read = head
+    if marker.message_id is not None and marker.message_id < head.last_message_id:
+        read = ThreadHead(marker.message_id, count_messages_upto(sdb, trouble_id, marker.message_id))
+    
+    current = (
+        db.query(TroubleReadMarker.last_read_message_id, TroubleReadMarker.read_count)
+        .filter(TroubleReadMarker.user_id == current_user.user_id, TroubleReadMarker.trouble_id == trouble_id)
+        .first()
+    )
+    if current is not None and current.last_read_message_id >= read.last_message_id:
+        # 既に先まで読んでいる場合は更新しない
+        read = ThreadHead(*current)
+    else:
+        mark_read(db, current_user.user_id, trouble_id, read)
+    
+    return schemas.UnreadCount(
+        trouble_id=trouble_id,
+        last_message_id=head.last_message_id,
+        last_read_message_id=read.last_message_id,
+        unread=head.message_count - read.message_count,
+    )
@@ -19,4 +19,17 @@ class MessageResponse(MessageBase):
 
 class MessagesListResponse(BaseSchemaModel):
     messages: List[MessageResponse]
-    total: int
\ No newline at end of file
+    total: int
+
+class ReadMarkerUpdate(BaseSchemaModel):
+    message_id: Optional[int] = Field(None, description="ここまで読んだメッセージのID（未指定の場合はスレッドの最新まで）")
+
+class UnreadCount(BaseSchemaModel):
+    trouble_id: int
+    last_message_id: int
+    last_read_message_id: int
+    unread: int
+
+class UnreadCountsResponse(BaseSchemaModel):
+    troubles: List[UnreadCount]
+    total_unread: int
@@ -0,0 +1,204 @@
+"""
+お困りごとスレッドの未読管理
+
+- ユーザーごと・お困りごとごとの既読位置を trouble_read_markers に1行で保持する
+  （既読にした最後のメッセージID と、そこまでのスレッド内のメッセージ数）
+- お困りごとごとの「最新メッセージID・総メッセージ数」をメモリ上のインデックスに保持し、
+  未読数は COUNT を使わず「総数 - 既読位置までの件数」の引き算で求める
+- インデックスは初回参照時（および TTL 経過後）に DB から読み込み、
+  メッセージ作成時はルーターから record を呼んで DB から読み込み直す
+- 既読位置は後退しない（大きい方を残す）。メッセージ投稿時の投稿者の既読更新は
+  write-behind キューでまとめて反映する
+- お困りごとの作成者には作成時に既読位置 0 の行を作るため、
+  「自分のお困りごと」と「読んだ・書き込んだお困りごと」がユーザーの追跡対象になる
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, NamedTuple, Tuple
+
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from ...core.config import settings
+from ...services.write_behind import write_behind
+from ..troubles.models import Trouble
+from .models import Message, MessageArchive, TroubleReadMarker
+from .archive import count_archived_upto
+
+# write-behind キューの書き込み種別（キー: (user_id, trouble_id), 値: [last_read_message_id, read_count]）
+READ_MARKER = "messages.read_marker"
+
+markers_table = TroubleReadMarker.__table__
+
+
+class ThreadHead(NamedTuple):
+    """スレッドの最新メッセージIDと総メッセージ数（アーカイブ分を含む）"""
+    last_message_id: int
+    message_count: int
+
+
+def merge_marker(old: Any, new: Any) -> Any:
+    """既読位置は後退させない（[メッセージID, 件数] の大きい方を残す）"""
+    return new if tuple(new) > tuple(old) else old
+
+
+# ───────── 最新メッセージのインデックス ─────────
+class LatestMessageIndex:
+    """お困りごとごとの最新メッセージID・総メッセージ数（LRU で件数の上限を設ける）"""
+
+    def __init__(self, max_troubles: int = 100000, ttl: float = 300.0):
+        self._max_troubles = max_troubles
+        self._ttl = ttl
+        self._heads: "OrderedDict[int, Tuple[ThreadHead, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, db: Session, trouble_ids: Iterable[int]) -> Dict[int, ThreadHead]:
+        """
+        お困りごとのスレッド情報をまとめて取得する（インデックスに無いものは1クエリで読み込む）
+        削除済み・存在しないお困りごとは結果に含まれない
+
+        :param db: お困りごとを保存しているシャードのセッション
+        """
+        now = time.monotonic()
+        heads: Dict[int, ThreadHead] = {}
+        missing = []
+        with self._lock:
+            for trouble_id in trouble_ids:
+                entry = self._heads.get(trouble_id)
+                if entry is not None and now - entry[1] < self._ttl:
+                    self._heads.move_to_end(trouble_id)
+                    heads[trouble_id] = entry[0]
+                else:
+                    missing.append(trouble_id)
+        if missing:
+            loaded = load_thread_heads(db, missing)
+            with self._lock:
+                for trouble_id, head in loaded.items():
+                    self._put(trouble_id, head, now)
+            heads.update(loaded)
+        return heads
+
+    def record(self, db: Session, trouble_id: int, message_id: int) -> ThreadHead:
+        """
+        メッセージの追加を反映し、最新のスレッド情報を返す（メッセージのコミット後に呼ぶ）
+
+        インデックスの値は他のプロセスでの投稿を含まず古い可能性があるため、件数を足さずに
+        DB から読み込み直す（戻り値は投稿者の既読位置として保存されるため正確な件数にする）
+        """
+        now = time.monotonic()
+        head = load_thread_heads(db, [trouble_id]).get(trouble_id, ThreadHead(message_id, 1))
+        with self._lock:
+            entry = self._heads.get(trouble_id)
+            # 同時に record した別のリクエストがより新しい位置を反映済みの場合は残す
+            if entry is None or head.last_message_id >= entry[0].last_message_id:
+                self._put(trouble_id, head, now)
+        return head
+
+    def remove(self, trouble_id: int) -> None:
+        with self._lock:
+            self._heads.pop(trouble_id, None)
+
+    def _put(self, trouble_id: int, head: ThreadHead, loaded_at: float) -> None:
+        self._heads[trouble_id] = (head, loaded_at)
+        self._heads.move_to_end(trouble_id)
+        while len(self._heads) > self._max_troubles:
+            self._heads.popitem(last=False)
+
+
+def load_thread_heads(db: Session, trouble_ids: Iterable[int]) -> Dict[int, ThreadHead]:
+    """お困りごとごとの最新メッセージID・総メッセージ数を DB から取得する（相関サブクエリで1クエリ）"""
+    hot_count = select(func.count(Message.id)).where(Message.trouble_id == Trouble.id).scalar_subquery()
+    hot_max = select(func.max(Message.id)).where(Message.trouble_id == Trouble.id).scalar_subquery()
+    archived_count = (
+        select(func.coalesce(func.sum(MessageArchive.message_count), 0))
+        .where(MessageArchive.trouble_id == Trouble.id)
+        .scalar_subquery()
+    )
+    archived_max = select(func.max(MessageArchive.last_message_id)).where(MessageArchive.trouble_id == Trouble.id).scalar_subquery()
+    return {
+        trouble_id: ThreadHead(hot_max_id or archived_max_id or 0, hot_total + int(archived_total))
+        for trouble_id, hot_total, hot_max_id, archived_total, archived_max_id in
+        db.query(Trouble.id, hot_count, hot_max, archived_count, archived_max)
+        .filter(Trouble.id.in_(list(trouble_ids)), Trouble.deleted_at.is_(None))
+    }
+
+
+def count_messages_upto(db: Session, trouble_id: int, message_id: int) -> int:
+    """スレッド先頭から message_id までのメッセージ数（既読位置をスレッドの途中に設定する場合に使う）"""
+    hot = (
+        db.query(func.count(Message.id))
+        .filter(Message.trouble_id == trouble_id, Message.id <= message_id)
+        .scalar()
+    )
+    return hot + count_archived_upto(db, trouble_id, message_id)
+
+
+# ───────── 既読位置 ─────────
+def apply_read_markers(db: Session, items: Dict[Hashable, Any]) -> None:
+    """
+    既読位置をまとめて反映する（既存行は位置が進む場合だけ UPDATE、無い行は INSERT）
+    キー: (user_id, trouble_id), 値: [last_read_message_id, read_count]
+    """
+    user_ids = {user_id for user_id, _ in items}
+    trouble_ids = {trouble_id for _, trouble_id in items}
+    existing = {
+        (row.user_id, row.trouble_id)
+        for row in db.query(TroubleReadMarker.user_id, TroubleReadMarker.trouble_id)
+        .filter(TroubleReadMarker.user_id.in_(user_ids), TroubleReadMarker.trouble_id.in_(trouble_ids))
+    }
+
+    updates = [
+        {"b_user_id": user_id, "b_trouble_id": trouble_id, "b_message_id": message_id, "b_read_count": read_count}
+        for (user_id, trouble_id), (message_id, read_count) in items.items()
+        if (user_id, trouble_id) in existing
+    ]
+    inserts = [
+        {"user_id": user_id, "trouble_id": trouble_id, "last_read_message_id": message_id, "read_count": read_count}
+        for (user_id, trouble_id), (message_id, read_count) in items.items()
+        if (user_id, trouble_id) not in existing
+    ]
+
+    if updates:
+        db.execute(
+            update(markers_table)
+            .where(
+                markers_table.c.user_id == bindparam("b_user_id"),
+                markers_table.c.trouble_id == bindparam("b_trouble_id"),
+                markers_table.c.last_read_message_id <= bindparam("b_message_id"),
+            )
+            .values(last_read_message_id=bindparam("b_message_id"), read_count=bindparam("b_read_count")),
+            updates,
+        )
+    if inserts:
+        db.execute(insert(markers_table), inserts)
+
+
+def mark_read(db: Session, user_id: int, trouble_id: int, head: ThreadHead, background: bool = False) -> None:
+    """
+    既読位置を更新する
+
+    :param db: 既定のデータベースのセッション
+    :param head: 既読にした位置（メッセージIDとそこまでの件数）
+    :param background: True の場合は write-behind キューでまとめて反映する（キューが使えない場合は同期的に反映）
+    """
+    key = (user_id, trouble_id)
+    value = [head.last_message_id, head.message_count]
+    if background and write_behind.enqueue(READ_MARKER, key, value):
+        return
+
+    try:
+        apply_read_markers(db, {key: value})
+        db.commit()
+    except Exception as e:
+        print(f"既読位置の更新エラー: {str(e)}")
+        db.rollback()
+
+
+# アプリ全体で共有するインデックス
+latest_messages = LatestMessageIndex(
+    max_troubles=settings.UNREAD_INDEX_MAX_TROUBLES,
+    ttl=settings.UNREAD_INDEX_TTL_SECONDS,
+)
+
+write_behind.register(READ_MARKER, apply_read_markers, merge=merge_marker)
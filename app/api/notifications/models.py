@@ -0,0 +1,44 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.sql import func
+
+from ...models.base import Base
+
+class Notification(Base):
+    """通知のきっかけになった出来事（ダイジェストにまとめるまでは digest_id が NULL）"""
+    __tablename__ = "notifications"
+
+    id = Column(Integer, primary_key=True, index=True)
+    recipient_user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    trouble_id = Column(Integer, nullable=False)  # お困りごとはシャードに置かれるため外部キーは張らない
+    trouble_title = Column(String(255), nullable=False, default="")
+    message_id = Column(Integer, nullable=False)
+    actor_user_id = Column(Integer, nullable=False)  # 返信したユーザー
+    created_at = Column(DateTime, nullable=False)  # メッセージの作成日時
+    digest_id = Column(Integer, ForeignKey("notification_digests.id"), nullable=True)
+
+    __table_args__ = (
+        # 変更イベントが再配信されても同じメッセージの通知を二重に作らない
+        UniqueConstraint("recipient_user_id", "message_id", name="uq_notifications_message"),
+        # 受信者ごとの未集約の通知（ダイジェスト作成対象の検索）用
+        Index("ix_notifications_pending", "digest_id", "recipient_user_id", "created_at"),
+    )
+
+class NotificationDigest(Base):
+    """受信者ごとに一定期間の通知をまとめたもの"""
+    __tablename__ = "notification_digests"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    window_start = Column(DateTime, nullable=False)  # まとめた通知のうち最も古いものの日時
+    window_end = Column(DateTime, nullable=False)  # まとめた通知のうち最も新しいものの日時
+    item_count = Column(Integer, nullable=False)
+    summary = Column(Text, nullable=False)  # お困りごとごとの件数・返信者など（JSON）
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    delivered_at = Column(DateTime, nullable=True)  # 配信ワーカーが送信した日時
+
+    __table_args__ = (
+        # ユーザーごとのダイジェスト一覧（新しい順）用
+        Index("ix_notification_digests_user", "user_id", "id"),
+        # 未配信のダイジェストの検索用
+        Index("ix_notification_digests_undelivered", "delivered_at", "id"),
+    )
@@ -0,0 +1,52 @@
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from ...core.database import get_db
+from ...api.auth.jwt import get_current_user
+from ...api.users.models import User
+from .models import Notification, NotificationDigest
+from . import schemas
+
+router = APIRouter()
+
+@router.get("/digests", response_model=schemas.DigestListResponse)
+def get_my_digests(
+    before_id: Optional[int] = Query(None, description="前のページの next_before_id"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    ログインユーザー宛ての通知ダイジェストを新しい順に取得する
+    （自分のお困りごとへの返信を、一定期間ごとにお困りごと単位でまとめたもの）
+    """
+    query = db.query(NotificationDigest).filter(NotificationDigest.user_id == current_user.user_id)
+    if before_id is not None:
+        query = query.filter(NotificationDigest.id < before_id)
+    digests = query.order_by(NotificationDigest.id.desc()).limit(limit).all()
+    
+    pending = (
+        db.query(Notification.id)
+        .filter(Notification.recipient_user_id == current_user.user_id, Notification.digest_id.is_(None))
+        .count()
+    )
+    
+    return schemas.DigestListResponse(
+        digests=[
+            schemas.DigestResponse(
+                id=digest.id,
+                window_start=digest.window_start,
+                window_end=digest.window_end,
+                item_count=digest.item_count,
+                troubles=json.loads(digest.summary),
+                created_at=digest.created_at,
+                delivered_at=digest.delivered_at,
+            )
+            for digest in digests
+        ],
+        pending=pending,
+        next_before_id=digests[-1].id if len(digests) == limit else None,
+    )
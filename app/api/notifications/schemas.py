@@ -0,0 +1,25 @@
+from datetime import datetime
+from typing import List, Optional
+
+from ...schemas.base import BaseSchemaModel
+
+class DigestTroubleSummary(BaseSchemaModel):
+    trouble_id: int
+    trouble_title: str
+    messages: int
+    actor_user_ids: List[int]
+    last_message_id: int
+
+class DigestResponse(BaseSchemaModel):
+    id: int
+    window_start: datetime
+    window_end: datetime
+    item_count: int
+    troubles: List[DigestTroubleSummary]
+    created_at: Optional[datetime] = None
+    delivered_at: Optional[datetime] = None
+
+class DigestListResponse(BaseSchemaModel):
+    digests: List[DigestResponse]
+    pending: int  # まだダイジェストにまとめられていない通知の数
+    next_before_id: Optional[int] = None
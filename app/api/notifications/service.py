@@ -0,0 +1,266 @@
+"""
+新着メッセージの通知ダイジェスト
+
+1. 記録: create_message と同じトランザクションで書かれた変更イベント（アウトボックス）を
+   コンシューマー "notifications" が受け取り、お困りごとの作成者宛ての通知を notifications に追記する
+   （通知の作成は配信スレッドで行うため、create_message の応答時間には影響しない）
+2. 集約: NotificationDigester が、最も古い未集約の通知から NOTIFICATION_DIGEST_WINDOW_SECONDS 以上
+   経過した受信者ごとに、未集約の通知をお困りごと単位にまとめてダイジェストを1件作成する
+3. 配信: 未配信のダイジェストをバッチで送信関数に渡し、成功したら delivered_at を設定する
+   送信関数は register_sender で差し替える（既定はログ出力のみ）
+
+通知・ダイジェストは既定のデータベースに置く。変更イベントは再配信されることがあるため、
+受信者とメッセージIDの組で重複を除く
+"""
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.orm import Session
+
+from ...core.config import settings
+from ...core.database import SessionLocal
+from ...services.outbox import outbox_dispatcher, ChangeEvent, MESSAGE, CREATED
+from ...services.periodic import PeriodicWorker
+from .models import Notification, NotificationDigest
+
+# アウトボックスのコンシューマー名（オフセットの保存キー）
+CONSUMER_NAME = "notifications"
+
+notifications_table = Notification.__table__
+digests_table = NotificationDigest.__table__
+
+# 送信関数: 未配信のダイジェストのリストを受け取って送信する（例外を投げた場合は次回再送する）
+Sender = Callable[[List[NotificationDigest]], None]
+
+
+# ───────── 記録 ─────────
+def handle_change_events(db: Session, events: List[ChangeEvent]) -> None:
+    """
+    メッセージ作成イベントからお困りごとの作成者宛ての通知を作る
+    db はイベントを記録したシャードのセッションのため、通知は既定のデータベースに別のセッションで書き込む
+    """
+    rows = {}
+    for event in events:
+        if event.aggregate_type != MESSAGE or event.event_type != CREATED:
+            continue
+        payload = event.payload
+        recipient = payload.get("trouble_author_id")
+        if recipient is None or recipient == payload["user_id"]:
+            continue
+        rows[(recipient, payload["id"])] = {
+            "recipient_user_id": recipient,
+            "trouble_id": payload["trouble_id"],
+            "trouble_title": (payload.get("trouble_title") or "")[:255],
+            "message_id": payload["id"],
+            "actor_user_id": payload["user_id"],
+            "created_at": event.created_at or datetime.utcnow(),
+        }
+    if not rows:
+        return
+
+    session = SessionLocal()
+    try:
+        existing = {
+            (recipient, message_id) for recipient, message_id in
+            session.query(Notification.recipient_user_id, Notification.message_id)
+            .filter(Notification.message_id.in_([message_id for _, message_id in rows]))
+        }
+        new_rows = [row for key, row in rows.items() if key not in existing]
+        if new_rows:
+            session.execute(insert(notifications_table), new_rows)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+# ───────── 集約 ─────────
+def build_summary(notifications: List[Notification]) -> List[Dict[str, Any]]:
+    """通知をお困りごと単位にまとめる（最後に返信があったお困りごとから順に並べる）"""
+    troubles: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+    for n in sorted(notifications, key=lambda n: n.message_id, reverse=True):
+        item = troubles.get(n.trouble_id)
+        if item is None:
+            item = troubles[n.trouble_id] = {
+                "trouble_id": n.trouble_id,
+                "trouble_title": n.trouble_title,
+                "messages": 0,
+                "actor_user_ids": [],
+                "last_message_id": n.message_id,
+            }
+        item["messages"] += 1
+        if n.actor_user_id not in item["actor_user_ids"]:
+            item["actor_user_ids"].append(n.actor_user_id)
+    return list(troubles.values())
+
+
+def build_digests(db: Session, window: timedelta, batch_size: int, now: datetime) -> int:
+    """
+    集約期間を過ぎた受信者の未集約の通知をダイジェストにまとめる（最大 batch_size 人分）
+
+    :return: 作成したダイジェストの数
+    """
+    recipients = [
+        user_id for (user_id,) in
+        db.query(Notification.recipient_user_id)
+        .filter(Notification.digest_id.is_(None))
+        .group_by(Notification.recipient_user_id)
+        .having(func.min(Notification.created_at) <= now - window)
+        .limit(batch_size)
+    ]
+    if not recipients:
+        return 0
+
+    # 全ワーカープロセスで実行されるため、他のプロセスが集約中の通知は行ロックで読み飛ばす
+    pending: Dict[int, List[Notification]] = {user_id: [] for user_id in recipients}
+    for n in (
+        db.query(Notification)
+        .filter(Notification.digest_id.is_(None), Notification.recipient_user_id.in_(recipients))
+        .order_by(Notification.id)
+        .with_for_update(skip_locked=True)
+    ):
+        pending[n.recipient_user_id].append(n)
+
+    created = 0
+    for user_id, notifications in pending.items():
+        if not notifications:
+            continue
+        digest = NotificationDigest(
+            user_id=user_id,
+            window_start=min(n.created_at for n in notifications),
+            window_end=max(n.created_at for n in notifications),
+            item_count=len(notifications),
+            summary=json.dumps(build_summary(notifications), ensure_ascii=False),
+        )
+        db.add(digest)
+        db.flush()
+        # 行ロックの無い SQLite などでも二重に集約しないよう、未集約の通知だけを対応付けて件数を確認する
+        result = db.execute(
+            update(notifications_table)
+            .where(
+                notifications_table.c.id.in_([n.id for n in notifications]),
+                notifications_table.c.digest_id.is_(None),
+            )
+            .values(digest_id=digest.id)
+        )
+        if result.rowcount != len(notifications):
+            print(f"通知ダイジェストの作成を中止しました（他のプロセスが集約済み）: ユーザー {user_id}")
+            db.rollback()
+            return 0
+        created += 1
+    db.commit()
+    return created
+
+
+# ───────── 配信 ─────────
+def log_sender(digests: List[NotificationDigest]) -> None:
+    """既定の送信関数（送信手段が設定されるまではログに出力するだけ）"""
+    for digest in digests:
+        print(f"通知ダイジェスト: ユーザー {digest.user_id} に {digest.item_count}件")
+
+
+def deliver_digests(db: Session, sender: Sender, batch_size: int) -> int:
+    """
+    未配信のダイジェストを最大 batch_size 件まとめて送信する
+
+    :return: 送信したダイジェストの数
+    """
+    digests = (
+        db.query(NotificationDigest)
+        .filter(NotificationDigest.delivered_at.is_(None))
+        .order_by(NotificationDigest.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not digests:
+        db.commit()
+        return 0
+    sender(digests)
+    db.execute(
+        update(digests_table)
+        .where(digests_table.c.id.in_([d.id for d in digests]))
+        .values(delivered_at=datetime.utcnow())
+    )
+    db.commit()
+    return len(digests)
+
+
+class NotificationDigester(PeriodicWorker):
+    """通知をダイジェストにまとめて配信する"""
+
+    def __init__(
+        self,
+        interval: float = 60.0,
+        window_seconds: float = 300.0,
+        digest_batch_size: int = 200,
+        delivery_batch_size: int = 100,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ):
+        super().__init__("notification-digester", interval)
+        self._window = timedelta(seconds=window_seconds)
+        self._digest_batch_size = digest_batch_size
+        self._delivery_batch_size = delivery_batch_size
+        self._session_factory = session_factory
+        self._sender: Sender = log_sender
+
+    def register_sender(self, sender: Sender) -> None:
+        """ダイジェストの送信関数を設定する"""
+        self._sender = sender
+
+    def run_once(self) -> None:
+        self.build_pending()
+        self.deliver_pending()
+
+    def build_pending(self, now: Optional[datetime] = None) -> int:
+        """集約期間を過ぎた受信者のダイジェストをすべて作成する"""
+        now = now or datetime.utcnow()
+        built = 0
+        db = self._session_factory()
+        try:
+            while not self.stopping:
+                count = build_digests(db, self._window, self._digest_batch_size, now)
+                built += count
+                if count < self._digest_batch_size:
+                    break
+        except Exception as e:
+            print(f"通知ダイジェストの作成エラー: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+        return built
+
+    def deliver_pending(self) -> int:
+        """未配信のダイジェストをバッチ単位ですべて送信する"""
+        delivered = 0
+        db = self._session_factory()
+        try:
+            while not self.stopping:
+                count = deliver_digests(db, self._sender, self._delivery_batch_size)
+                delivered += count
+                if count < self._delivery_batch_size:
+                    break
+        except Exception as e:
+            # 送信に失敗したバッチは delivered_at を設定せず、次回再送する
+            print(f"通知ダイジェストの配信エラー: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+        return delivered
+
+
+# アプリ全体で共有するダイジェスト処理
+notification_digester = NotificationDigester(
+    interval=settings.NOTIFICATION_DIGEST_INTERVAL_SECONDS,
+    window_seconds=settings.NOTIFICATION_DIGEST_WINDOW_SECONDS,
+    digest_batch_size=settings.NOTIFICATION_DIGEST_BATCH_SIZE,
+    delivery_batch_size=settings.NOTIFICATION_DELIVERY_BATCH_SIZE,
+)
+
+if settings.NOTIFICATIONS_ENABLED:
+    outbox_dispatcher.register(CONSUMER_NAME, handle_change_events)
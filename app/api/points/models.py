@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Index, UniqueConstraint
+
+from ...models.base import Base
+
+class PointEvent(Base):
+    """ポイント付与イベントの台帳（追記のみ）"""
+    __tablename__ = "point_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.user_id"), index=True, nullable=False)
+    event_type = Column(String(50), nullable=False)  # trouble_posted / message_replied / project_created
+    source_id = Column(Integer, nullable=True)  # 付与のきっかけになったお困りごと・メッセージ・プロジェクトのID
+    points = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        # 同じイベントで二重にポイントを付与しない
+        UniqueConstraint("event_type", "source_id", name="uq_point_events_source"),
+    )
+
+class PointAggregate(Base):
+    """期間ごと（週・月）のポイント集計。台帳への追記と同じトランザクションで更新する"""
+    __tablename__ = "point_aggregates"
+
+    user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
+    period_type = Column(String(10), primary_key=True)  # weekly / monthly
+    period_start = Column(Date, primary_key=True)  # 週は月曜日、月は1日
+    points = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # 期間ランキング用
+        Index("ix_point_aggregates_ranking", "period_type", "period_start", "points"),
+    )
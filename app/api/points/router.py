@@ -0,0 +1,34 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from ...core.database import get_db
+from ...api.auth.jwt import get_current_user
+from ...api.users.models import User
+from ...api.projects.schemas import RankingUser
+from . import schemas
+from .service import get_point_summary, get_ranking
+
+router = APIRouter()
+
+@router.get("/me", response_model=schemas.PointSummaryResponse)
+def get_my_points(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    現在のログインユーザーの累計・今週・今月のポイントを取得する
+    """
+    return schemas.PointSummaryResponse(**get_point_summary(db, current_user))
+
+@router.get("/ranking", response_model=List[RankingUser])
+def get_point_ranking(
+    period: Optional[str] = Query(None, pattern="^(weekly|monthly)$", description="集計期間（未指定の場合は累計）"),
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """
+    ポイントランキングを取得する
+    """
+    return [RankingUser(**row) for row in get_ranking(db, period, limit)]
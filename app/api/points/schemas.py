@@ -0,0 +1,11 @@
+from datetime import date
+from pydantic import Field
+
+from ...schemas.base import BaseSchemaModel
+
+class PointSummaryResponse(BaseSchemaModel):
+    total: int = Field(0, description="累計ポイント")
+    weekly: int = Field(0, description="今週のポイント")
+    monthly: int = Field(0, description="今月のポイント")
+    week_start: date
+    month_start: date
@@ -0,0 +1,198 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.orm import Session
+
+from ...services.write_behind import write_behind
+from ..users.models import User
+from ..users.tasks import apply_point_increments
+from .models import PointEvent, PointAggregate
+
+# ポイント付与イベントの種別
+TROUBLE_POSTED = "trouble_posted"
+MESSAGE_REPLIED = "message_replied"
+PROJECT_CREATED = "project_created"
+
+# イベントごとの付与ポイント
+POINT_RULES: Dict[str, int] = {
+    TROUBLE_POSTED: 10,
+    MESSAGE_REPLIED: 5,
+    PROJECT_CREATED: 20,
+}
+
+# 集計期間
+WEEKLY = "weekly"
+MONTHLY = "monthly"
+PERIOD_TYPES = (WEEKLY, MONTHLY)
+
+# write-behind キューの書き込み種別（キー: (event_type, source_id), 値: [user_id, points, 発生時刻]）
+LEDGER = "points.ledger"
+
+aggregates_table = PointAggregate.__table__
+
+def period_start(period_type: str, at: date) -> date:
+    """指定日が属する集計期間の開始日を返す（週は月曜日、月は1日）"""
+    if period_type == WEEKLY:
+        return at - timedelta(days=at.weekday())
+    return at.replace(day=1)
+
+def award_points(db: Session, user_id: int, event_type: str, source_id: Optional[int]) -> None:
+    """
+    ポイントを付与する
+    台帳への追記と集計はバックグラウンドでまとめて行い、キューが使えない場合のみ同期的に反映する
+
+    :param db: データベースセッション（同期反映時に使用）
+    :param user_id: 付与対象のユーザーID
+    :param event_type: イベント種別（POINT_RULES のキー）
+    :param source_id: 付与のきっかけになったエンティティのID
+    """
+    key = (event_type, source_id)
+    value = [user_id, POINT_RULES[event_type], datetime.utcnow().isoformat()]
+    if write_behind.enqueue(LEDGER, key, value):
+        return
+
+    try:
+        apply_point_events(db, {key: value})
+        db.commit()
+    except Exception as e:
+        print(f"ポイント付与エラー: {str(e)}")
+        db.rollback()
+
+def apply_point_events(db: Session, items: Dict[Hashable, Any]) -> None:
+    """
+    ポイント付与イベントをまとめて反映する
+    台帳への追記・累計（users.point_total）・期間集計を同じトランザクションで更新する
+    台帳に記録済みのイベント（クラッシュ後のスプールの再実行など）は読み飛ばし、
+    一意制約の違反でバッチ全体が失敗しないようにする
+    """
+    applied = _applied_keys(db, items.keys())
+    ledger_rows = []
+    totals: Dict[int, int] = defaultdict(int)
+    aggregates: Dict[Tuple[int, str, date], int] = defaultdict(int)
+
+    for (event_type, source_id), (user_id, points, created_at) in items.items():
+        if (event_type, source_id) in applied:
+            continue
+        created_at = datetime.fromisoformat(created_at)
+        ledger_rows.append({
+            "user_id": user_id,
+            "event_type": event_type,
+            "source_id": source_id,
+            "points": points,
+            "created_at": created_at,
+        })
+        totals[user_id] += points
+        for period_type in PERIOD_TYPES:
+            aggregates[(user_id, period_type, period_start(period_type, created_at.date()))] += points
+
+    if not ledger_rows:
+        return
+    db.execute(insert(PointEvent.__table__), ledger_rows)
+    apply_point_increments(db, totals)
+    _upsert_aggregates(db, aggregates)
+
+def _applied_keys(db: Session, keys: Iterable[Tuple[str, Optional[int]]]) -> Set[Tuple[str, Optional[int]]]:
+    """台帳に記録済みの (event_type, source_id) を1回の IN クエリで取得する"""
+    event_types = {event_type for event_type, source_id in keys if source_id is not None}
+    source_ids = {source_id for _, source_id in keys if source_id is not None}
+    if not source_ids:
+        return set()
+    rows = (
+        db.query(PointEvent.event_type, PointEvent.source_id)
+        .filter(PointEvent.source_id.in_(source_ids), PointEvent.event_type.in_(event_types))
+        .all()
+    )
+    return {(event_type, source_id) for event_type, source_id in rows}
+
+def _upsert_aggregates(db: Session, aggregates: Dict[Tuple[int, str, date], int]) -> None:
+    """期間集計を加算する（既存行は UPDATE、無い行は INSERT）"""
+    user_ids = {user_id for user_id, _, _ in aggregates}
+    starts = {start for _, _, start in aggregates}
+    existing = {
+        (row.user_id, row.period_type, row.period_start)
+        for row in db.query(PointAggregate.user_id, PointAggregate.period_type, PointAggregate.period_start)
+        .filter(PointAggregate.user_id.in_(user_ids), PointAggregate.period_start.in_(starts))
+    }
+
+    updates = [
+        {"b_user_id": user_id, "b_period_type": period_type, "b_period_start": start, "b_delta": points}
+        for (user_id, period_type, start), points in aggregates.items()
+        if (user_id, period_type, start) in existing
+    ]
+    inserts = [
+        {"user_id": user_id, "period_type": period_type, "period_start": start, "points": points}
+        for (user_id, period_type, start), points in aggregates.items()
+        if (user_id, period_type, start) not in existing
+    ]
+
+    if updates:
+        db.execute(
+            update(aggregates_table)
+            .where(
+                aggregates_table.c.user_id == bindparam("b_user_id"),
+                aggregates_table.c.period_type == bindparam("b_period_type"),
+                aggregates_table.c.period_start == bindparam("b_period_start"),
+            )
+            .values(points=aggregates_table.c.points + bindparam("b_delta")),
+            updates,
+        )
+    if inserts:
+        db.execute(insert(aggregates_table), inserts)
+
+def get_point_summary(db: Session, user: User) -> Dict[str, Any]:
+    """累計・今週・今月のポイントを取得する（集計テーブルの主キー検索のみ）"""
+    today = datetime.utcnow().date()
+    week_start = period_start(WEEKLY, today)
+    month_start = period_start(MONTHLY, today)
+
+    rows = (
+        db.query(PointAggregate.period_type, PointAggregate.period_start, PointAggregate.points)
+        .filter(
+            PointAggregate.user_id == user.user_id,
+            PointAggregate.period_start.in_([week_start, month_start]),
+        )
+        .all()
+    )
+    current = {(period_type, start): points for period_type, start, points in rows}
+
+    return {
+        "total": user.get_points(),
+        "weekly": current.get((WEEKLY, week_start), 0),
+        "monthly": current.get((MONTHLY, month_start), 0),
+        "week_start": week_start,
+        "month_start": month_start,
+    }
+
+def get_ranking(db: Session, period: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    ポイントランキングを取得する
+
+    :param period: None の場合は累計、weekly / monthly の場合は今期間の集計
+    :param limit: 取得件数
+    """
+    if period is None:
+        rows = (
+            db.query(User.name, User.point_total)
+            .order_by(User.point_total.desc())
+            .limit(limit)
+            .all()
+        )
+    else:
+        start = period_start(period, datetime.utcnow().date())
+        rows = (
+            db.query(User.name, PointAggregate.points)
+            .join(User, User.user_id == PointAggregate.user_id)
+            .filter(PointAggregate.period_type == period, PointAggregate.period_start == start)
+            .order_by(PointAggregate.points.desc())
+            .limit(limit)
+            .all()
+        )
+
+    return [
+        {"name": name, "points": points or 0, "rank": rank}
+        for rank, (name, points) in enumerate(rows, start=1)
+    ]
+
+write_behind.register(LEDGER, apply_point_events)
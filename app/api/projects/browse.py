@@ -0,0 +1,90 @@
+"""
+プロジェクト一覧（絞り込み・並び替え・キーセットページング）
+
+- 並び順は新着・お気に入り数（favorite_count）・活動数（activity_count）の降順で、
+  同じ値の場合は project_id の降順
+  新着は作成順に採番される project_id の降順とする（created_at は秒単位で同じ値が多く、
+  SQLite では server_default の値とバインドした日時の文字列表現が異なり正しく比較できないため）
+- 次のページは OFFSET ではなく、前のページの最後の (並び順の値, project_id) より後ろから取得する
+  （深いページでも読み飛ばす行が増えない）
+- カテゴリー・作成者で絞り込む場合も並び順の列との複合インデックスを使う（models.Project の __table_args__）
+"""
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from .models import Project
+
+NEWEST = "newest"
+FAVORITES = "favorites"
+ACTIVE = "active"
+
+SORT_COLUMNS = {
+    NEWEST: Project.project_id,
+    FAVORITES: Project.favorite_count,
+    ACTIVE: Project.activity_count,
+}
+
+# (並び順の値, project_id)
+BrowseKey = Tuple[int, int]
+
+
+def encode_cursor(sort: str, project: Project) -> str:
+    """カーソル（最後に返したプロジェクトの並び順の値と ID）を文字列にする"""
+    return f"{getattr(project, SORT_COLUMNS[sort].key)}_{project.project_id}"
+
+
+def decode_cursor(sort: str, cursor: str) -> Optional[BrowseKey]:
+    """カーソル文字列をキーに戻す。不正な場合は None"""
+    try:
+        value, project_id = cursor.split("_", 1)
+        return int(value), int(project_id)
+    except ValueError:
+        return None
+
+
+def browse_projects(
+    db: Session,
+    sort: str = NEWEST,
+    category: Optional[str] = None,
+    creator_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    after: Optional[BrowseKey] = None,
+    limit: int = 20,
+) -> Tuple[List[Project], Optional[str]]:
+    """
+    条件に合うプロジェクトを1ページ分取得する
+
+    :param created_to: この日時を含まない
+    :param after: 前のページの最後のキー（decode_cursor の結果）
+    :return: (プロジェクト, 次のページのカーソル。最後のページの場合は None)
+    """
+    column = SORT_COLUMNS[sort]
+    query = db.query(Project)
+    if category is not None:
+        query = query.filter(Project.category == category)
+    if creator_id is not None:
+        query = query.filter(Project.creator_user_id == creator_id)
+    if created_from is not None:
+        query = query.filter(Project.created_at >= created_from)
+    if created_to is not None:
+        query = query.filter(Project.created_at < created_to)
+    if after is not None:
+        value, project_id = after
+        # 行値式 (a, b) < (x, y) は MySQL でインデックスの範囲検索にならないことがあるため展開して書く
+        # column <= value を別に付け、OR だけの条件でインデックスの先頭から読み直さないようにする
+        if sort == NEWEST:
+            query = query.filter(Project.project_id < project_id)
+        else:
+            query = query.filter(column <= value, or_(column < value, Project.project_id < project_id))
+
+    # 次のページの有無を判定するため1件多く取得する
+    order_by = [Project.project_id.desc()] if sort == NEWEST else [column.desc(), Project.project_id.desc()]
+    projects = query.order_by(*order_by).limit(limit + 1).all()
+    if len(projects) <= limit:
+        return projects, None
+    projects = projects[:limit]
+    return projects, encode_cursor(sort, projects[-1])
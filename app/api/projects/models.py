@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import BigInteger, Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -14,10 +14,32 @@ class Project(Base):
     creator_user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)  # users.id から users.user_id に変更
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    category = Column(String(100), nullable=True)  # 以前は summary に保存していた（ProjectStatsRefresher が移し替える）
+    # 一覧の並び替え用の集計値（ProjectStatsRefresher・アウトボックスのコンシューマーが更新する）
+    favorite_count = Column(Integer, nullable=False, default=0, server_default="0")
+    activity_count = Column(Integer, nullable=False, default=0, server_default="0")  # お困りごと・メッセージの作成数
+    # メッセージ数（アーカイブ済みを含み、削除済みのお困りごとを除く）。NULL は未集計（ProjectStatsRefresher が数える）
+    message_count = Column(Integer, nullable=True, default=0)
 
     creator = relationship("User", back_populates="projects")
     troubles = relationship("Trouble", back_populates="project")
     user_favorites = relationship("UserFavoriteProject", back_populates="project")
+
+    __table_args__ = (
+        # 一覧（/browse）のキーセットページング用（並び順の列 + project_id）
+        # （新着順は project_id の降順。作成日時の範囲指定用に created_at にもインデックスを作る）
+        Index("ix_projects_created", "created_at"),
+        Index("ix_projects_category", "category", "project_id"),
+        Index("ix_projects_creator", "creator_user_id", "project_id"),
+        Index("ix_projects_favorites", "favorite_count", "project_id"),
+        Index("ix_projects_category_favorites", "category", "favorite_count", "project_id"),
+        Index("ix_projects_activity", "activity_count", "project_id"),
+        Index("ix_projects_category_activity", "category", "activity_count", "project_id"),
+    )
+
+    def get_category(self) -> str:
+        """カテゴリー（category 列への移し替え前の行は summary から取得）"""
+        return self.category or self.summary or ""
     
 class UserFavoriteProject(Base):
     __tablename__ = "user_project_favorites"  # テーブル名を修正
@@ -29,3 +51,10 @@ class UserFavoriteProject(Base):
 
     user = relationship("User", back_populates="favorite_projects")
     project = relationship("Project", back_populates="user_favorites")
+
+class ProjectActivityOffset(Base):
+    """プロジェクトの活動数に反映済みの変更イベントの位置（シャードごと。再配信されたイベントを二重に数えない）"""
+    __tablename__ = "project_activity_offsets"
+
+    shard = Column(String(64), primary_key=True)
+    last_event_id = Column(BigInteger, nullable=False, default=0)
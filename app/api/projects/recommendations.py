@@ -0,0 +1,204 @@
+"""
+お気に入りの共起によるプロジェクトのおすすめ
+
+- user_project_favorites を1回走査し、ユーザーごとのお気に入りから
+  プロジェクト同士の共起回数を疎な行列（プロジェクト -> {プロジェクト: 回数}）として集計する
+- 類似度はコサイン類似度（共起回数 / sqrt(お気に入り数 × お気に入り数)）とし、
+  プロジェクトごとの上位 K件と、ユーザーごとの上位 K件（お気に入りの類似プロジェクトの類似度の合計、
+  お気に入り済みは除く）を事前に計算してメモリ上に保持する
+- RecommendationRefresher が定期的にお気に入りの件数・チェックサムを確認し、
+  変化があった場合だけ作り直して差し替える（作り直している間は前回の結果を返す）
+- お気に入りの無いユーザーには、お気に入り数の多いプロジェクトを返す
+"""
+import heapq
+import math
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ...core.config import settings
+from ...core.database import SessionLocal
+from ...services.periodic import PeriodicWorker
+from .models import UserFavoriteProject
+
+# (プロジェクトID, スコア) のリスト（スコアの高い順）
+Ranking = List[Tuple[int, float]]
+
+
+class RecommendationModel:
+    """ある時点のお気に入りから計算したおすすめ（作成後は変更しない）"""
+
+    def __init__(
+        self,
+        similar: Dict[int, Ranking],
+        for_users: Dict[int, Ranking],
+        popular: Ranking,
+        fingerprint: Tuple[int, int, int],
+    ):
+        self.similar = similar
+        self.for_users = for_users
+        self.popular = popular
+        self.fingerprint = fingerprint
+        self.generated_at = datetime.utcnow()
+
+
+# お気に入りの行ごとのハッシュに使う (乗数, 法)。法は 2^31 未満の素数で、2乗しても 64bit 整数に収まる
+FINGERPRINT_HASHES = ((1000003, 2147483647), (999983, 2147483629))
+
+
+def _row_hash(multiplier: int, modulus: int):
+    """(user_id, project_id) の組ごとの値 ((user_id * 乗数 + project_id) mod 法)^2 mod 法"""
+    key = (UserFavoriteProject.user_id * multiplier + UserFavoriteProject.project_id) % modulus
+    return key * key % modulus
+
+
+def favorites_fingerprint(db: Session) -> Tuple[int, int, int]:
+    """
+    お気に入りが変わったかを判定するための件数と、行ごとのハッシュの合計（順序に依存しないチェックサム）
+
+    user_id・project_id をそれぞれ合計すると、(u1, p2) を外して (u2, p1) を追加した場合のように
+    組み合わせだけが入れ替わった変更を見分けられないため、組をまとめてハッシュしてから合計する
+    """
+    (first_multiplier, first_modulus), (second_multiplier, second_modulus) = FINGERPRINT_HASHES
+    count, first_sum, second_sum = db.query(
+        func.count(),
+        func.coalesce(func.sum(_row_hash(first_multiplier, first_modulus)), 0),
+        func.coalesce(func.sum(_row_hash(second_multiplier, second_modulus)), 0),
+    ).one()
+    return int(count), int(first_sum), int(second_sum)
+
+
+def load_favorites(db: Session, max_per_user: int) -> Dict[int, List[int]]:
+    """
+    ユーザーごとのお気に入りプロジェクト
+    共起の集計はお気に入り数の2乗に比例するため、max_per_user を超える分は新しいプロジェクトから切り捨てる
+    """
+    favorites: Dict[int, List[int]] = defaultdict(list)
+    for user_id, project_id in (
+        db.query(UserFavoriteProject.user_id, UserFavoriteProject.project_id)
+        .order_by(UserFavoriteProject.user_id, UserFavoriteProject.project_id)
+        .yield_per(10000)
+    ):
+        projects = favorites[user_id]
+        if len(projects) < max_per_user:
+            projects.append(project_id)
+    return favorites
+
+
+def build_model(
+    favorites: Dict[int, List[int]],
+    top_k: int,
+    fingerprint: Tuple[int, int, int],
+) -> RecommendationModel:
+    """ユーザーごとのお気に入りからおすすめを計算する"""
+    counts: Dict[int, int] = defaultdict(int)
+    cooccurrence: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    for projects in favorites.values():
+        for i, a in enumerate(projects):
+            counts[a] += 1
+            row = cooccurrence[a]
+            for b in projects[i + 1:]:
+                row[b] += 1
+                cooccurrence[b][a] += 1
+
+    similar: Dict[int, Ranking] = {}
+    for a, row in cooccurrence.items():
+        scores = ((b, n / math.sqrt(counts[a] * counts[b])) for b, n in row.items())
+        ranking = heapq.nlargest(top_k, scores, key=lambda item: (item[1], -item[0]))
+        if ranking:
+            similar[a] = ranking
+
+    for_users: Dict[int, Ranking] = {}
+    for user_id, projects in favorites.items():
+        owned = set(projects)
+        scores: Dict[int, float] = defaultdict(float)
+        for a in projects:
+            for b, score in similar.get(a, ()):
+                if b not in owned:
+                    scores[b] += score
+        ranking = heapq.nlargest(top_k, scores.items(), key=lambda item: (item[1], -item[0]))
+        if ranking:
+            for_users[user_id] = ranking
+
+    popular = heapq.nlargest(top_k, ((a, float(n)) for a, n in counts.items()), key=lambda item: (item[1], -item[0]))
+    return RecommendationModel(similar, for_users, popular, fingerprint)
+
+
+class ProjectRecommender:
+    """最新のおすすめを保持し、作り直しを行う"""
+
+    def __init__(
+        self,
+        top_k: int = 20,
+        max_favorites_per_user: int = 500,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ):
+        self._top_k = top_k
+        self._max_favorites_per_user = max_favorites_per_user
+        self._session_factory = session_factory
+        self._model: Optional[RecommendationModel] = None
+        self._build_lock = threading.Lock()
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        お気に入りに変化があればおすすめを作り直す
+
+        :return: 作り直した場合は True
+        """
+        with self._build_lock:
+            db = self._session_factory()
+            try:
+                fingerprint = favorites_fingerprint(db)
+                if not force and self._model is not None and self._model.fingerprint == fingerprint:
+                    return False
+                favorites = load_favorites(db, self._max_favorites_per_user)
+            finally:
+                db.close()
+            self._model = build_model(favorites, self._top_k, fingerprint)
+            return True
+
+    def model(self) -> RecommendationModel:
+        """おすすめを返す（まだ作成されていない場合はその場で作成する）"""
+        if self._model is None:
+            self.refresh()
+        return self._model
+
+    def for_user(self, user_id: int, limit: int) -> Ranking:
+        """ユーザーへのおすすめ（お気に入りが無い・共起が無い場合はお気に入り数の多いプロジェクト）"""
+        model = self.model()
+        ranking = model.for_users.get(user_id)
+        if ranking is None:
+            ranking = model.popular
+        return ranking[:limit]
+
+    def similar_to(self, project_id: int, limit: int) -> Ranking:
+        """プロジェクトと一緒にお気に入りされているプロジェクト"""
+        return self.model().similar.get(project_id, [])[:limit]
+
+
+class RecommendationRefresher(PeriodicWorker):
+    """お気に入りの変化を定期的に確認し、おすすめを作り直す"""
+
+    def __init__(self, recommender: ProjectRecommender, interval: float = 600.0):
+        super().__init__("project-recommendations", interval, run_on_start=True)
+        self._recommender = recommender
+
+    def run_once(self) -> None:
+        if self._recommender.refresh():
+            model = self._recommender.model()
+            print(f"プロジェクトのおすすめを更新しました: プロジェクト {len(model.similar)}件・ユーザー {len(model.for_users)}人")
+
+
+# アプリ全体で共有するおすすめ
+project_recommender = ProjectRecommender(
+    top_k=settings.RECOMMENDATION_TOP_K,
+    max_favorites_per_user=settings.RECOMMENDATION_MAX_FAVORITES_PER_USER,
+)
+recommendation_refresher = RecommendationRefresher(
+    project_recommender,
+    interval=settings.RECOMMENDATION_REFRESH_INTERVAL_SECONDS,
+)
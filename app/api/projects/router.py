@@ -1,64 +1,81 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from typing import List
-from sqlalchemy import text
+from sqlalchemy import func, desc, select
+from datetime import datetime
+from typing import List, Optional
 
-from app.core.database import get_db
+from app.core.database import ShardSessions, get_db, get_shards, shard_registry
+from app.core.http_cache import conditional_response, make_etag, public_cache_control
 from app.api.projects.models import Project, UserFavoriteProject
 from app.api.projects.schemas import (
     ProjectResponse, 
     ProjectListResponse, 
     ProjectCreate, 
     ProjectCategoryResponse,
-    RankingUser
+    RankingUser,
+    ProjectStats,
+    MessagePreview,
+    ProjectTroubleSummary,
+    ProjectDetailAggregateResponse,
+    RecommendedProject,
+    ProjectRecommendationsResponse,
+    ProjectBrowseResponse
 )
 from app.api.users.models import User  # プロジェクトの作者情報等を取得する前提
+from app.api.auth.jwt import get_current_user
+from app.api.troubles.models import Trouble
+from app.api.messages.models import Message, MessageArchive
+from app.api.messages.archive import archived_count_subquery
+from app.api.points.service import award_points, get_ranking, PROJECT_CREATED
+from app.api.projects.recommendations import Ranking, project_recommender
+from app.api.projects.browse import browse_projects, decode_cursor
+from app.services.outbox import record_change, PROJECT, CREATED
 
 router = APIRouter()
 
-def convert_project(project: Project, db: Session, user_id: int) -> ProjectResponse:
+def project_response(project: Project, author_name: Optional[str], is_favorite: bool) -> ProjectResponse:
     """
-    プロジェクトモデルからProjectResponseに変換する補助関数です。
-    - いいね数やコメント数はダミーで設定しています。
-    - お気に入り情報と作者名は直接SQLで取得しています。
+    プロジェクトモデルをProjectResponseに変換します（一覧・詳細・一括取得で共通）。
+    - いいね数はお気に入り数（favorite_count）、コメント数はメッセージ数（message_count）です。
     """
-    likes = 24  
-    comments = 8  
-    
-    is_favorite = False
-    try:
-        favorite_result = db.execute(
-            text("SELECT 1 FROM user_project_favorites WHERE user_id = :user_id AND project_id = :project_id"),
-            {"user_id": user_id, "project_id": project.project_id}
-        ).fetchone()
-        is_favorite = favorite_result is not None
-    except Exception as e:
-        print(f"お気に入り情報の取得エラー: {e}")
-    
-    author_name = "Unknown"
-    try:
-        author_result = db.execute(
-            text("SELECT name FROM users WHERE user_id = :user_id"),
-            {"user_id": project.creator_user_id}
-        ).fetchone()
-        if author_result:
-            author_name = author_result[0]
-    except Exception as e:
-        print(f"作者名の取得エラー: {e}")
-    
     return ProjectResponse(
         id=project.project_id,
         title=project.title,
         description=project.description,
-        category=project.summary or "",
+        category=project.get_category(),
         author_id=project.creator_user_id,
-        author=author_name,
+        author=author_name or "Unknown",
         created_at=project.created_at,
-        likes=likes,
-        comments=comments,
-        is_favorite=is_favorite
+        likes=project.favorite_count or 0,
+        comments=project.message_count or 0,
+        is_favorite=is_favorite,
+        favorite_count=project.favorite_count or 0,
+        activity_count=project.activity_count or 0
+    )
+
+def convert_projects(projects: List[Project], db: Session, user_id: Optional[int]) -> List[ProjectResponse]:
+    """
+    プロジェクトモデルのリストをProjectResponseに変換する補助関数です。
+    - お気に入り情報と作者名はそれぞれ1回の IN クエリでまとめて取得します。
+      （DB エラーは握りつぶさずに呼び出し元へ伝え、行ごとにタイムアウトを待たないようにする）
+    """
+    if not projects:
+        return []
+    
+    project_ids = {p.project_id for p in projects}
+    favorite_ids = {
+        project_id for (project_id,) in
+        db.query(UserFavoriteProject.project_id)
+        .filter(UserFavoriteProject.user_id == user_id, UserFavoriteProject.project_id.in_(project_ids))
+    } if user_id is not None else set()
+    author_names = dict(
+        db.query(User.user_id, User.name).filter(User.user_id.in_({p.creator_user_id for p in projects})).all()
     )
+    
+    return [
+        project_response(project, author_names.get(project.creator_user_id), project.project_id in favorite_ids)
+        for project in projects
+    ]
 
 # ユーザーIDを元に、新着プロジェクト・お気に入りプロジェクト一覧を返すエンドポイント
 @router.get("/", response_model=ProjectListResponse)
@@ -71,53 +88,24 @@ def get_projects(user_id: int, db: Session = Depends(get_db)):
         .all()
     )
 
-    # お気に入りプロジェクトを直接SQLで取得
-    favorite_projects_query = """
-    SELECT p.* FROM co_creation_projects p
-    JOIN user_project_favorites f ON p.project_id = f.project_id
-    WHERE f.user_id = :user_id
-    ORDER BY p.created_at DESC
-    LIMIT 8
-    """
-    favorite_projects = []
-    try:
-        result = db.execute(text(favorite_projects_query), {"user_id": user_id})
-        # SQLAlchemyの場合、result.all()はRow型のリストになるので、Projectインスタンスに
-        # 自動的に変換されていない可能性があります。
-        # ここではシンプルに各行からIDなどを使って変換するか、
-        # ORM経由で再度取得する方法も考えられますが、ここでは仮の実装とします。
-        favorite_projects = [row for row in result.all()]
-    except Exception as e:
-        print(f"お気に入りプロジェクト取得エラー: {e}")
+    # お気に入りプロジェクトを取得
+    favorite_projects = (
+        db.query(Project)
+        .join(UserFavoriteProject, UserFavoriteProject.project_id == Project.project_id)
+        .filter(UserFavoriteProject.user_id == user_id)
+        .order_by(Project.created_at.desc())
+        .limit(8)
+        .all()
+    )
 
     total_projects = db.query(Project).count()
 
     return ProjectListResponse(
-        new_projects=[convert_project(p, db, user_id) for p in new_projects],
-        favorite_projects=[convert_project(p, db, user_id) for p in favorite_projects],
+        new_projects=convert_projects(new_projects, db, user_id),
+        favorite_projects=convert_projects(favorite_projects, db, user_id),
         total_projects=total_projects
     )
 
-# プロジェクトIDを指定して、個別プロジェクトの詳細を返すエンドポイント
-@router.get("/{project_id}", response_model=ProjectResponse)
-def get_project_by_id(project_id: int, db: Session = Depends(get_db)):
-    project = db.query(Project).filter(Project.project_id == project_id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-    # プロジェクト詳細取得ではユーザーコンテキストが無い場合は、いいねなどはダミー値やfalseに設定
-    return ProjectResponse(
-        id=project.project_id,
-        title=project.title,
-        description=project.description,
-        category=project.summary or "",
-        author_id=project.creator_user_id,
-        author="Unknown",  # 作者名取得のために必要なら、上記convert_projectと同様にSQLで取得するか、リレーションを利用
-        created_at=project.created_at,
-        likes=0,
-        comments=0,
-        is_favorite=False
-    )
-
 @router.get("/categories", response_model=ProjectCategoryResponse)
 def get_project_categories(db: Session = Depends(get_db)):
     categories = [
@@ -134,25 +122,300 @@ def get_project_categories(db: Session = Depends(get_db)):
 
 @router.get("/ranking", response_model=List[RankingUser])
 def get_activity_ranking(db: Session = Depends(get_db)):
-    ranking_data = [
-        RankingUser(name="キツネ", points=1250, rank=1),
-        RankingUser(name="パンダ", points=980, rank=2),
-        RankingUser(name="ウサギ", points=875, rank=3)
-    ]
-    return ranking_data
+    # 累計ポイントの上位3名（users.point_total から取得し、台帳は参照しない）
+    return [RankingUser(**row) for row in get_ranking(db, limit=3)]
+
+def build_recommendations(db: Session, ranking: Ranking) -> ProjectRecommendationsResponse:
+    """おすすめの (プロジェクトID, スコア) のリストを、順序を保ったままプロジェクトの情報に変換する（1クエリ）"""
+    projects = {
+        p.project_id: p
+        for p in db.query(Project).filter(Project.project_id.in_([project_id for project_id, _ in ranking]))
+    } if ranking else {}
+    return ProjectRecommendationsResponse(
+        projects=[
+            RecommendedProject(
+                id=project_id,
+                title=projects[project_id].title,
+                category=projects[project_id].get_category(),
+                author_id=projects[project_id].creator_user_id,
+                score=score,
+            )
+            for project_id, score in ranking
+            if project_id in projects
+        ],
+        generated_at=project_recommender.model().generated_at,
+    )
+
+# 絞り込み・並び替えができるプロジェクト一覧（キーセットページング）
+@router.get("/browse", response_model=ProjectBrowseResponse)
+def get_project_browse(
+    sort: str = Query("newest", pattern="^(newest|favorites|active)$", description="newest: 新着順 / favorites: お気に入り数順 / active: 活動数順"),
+    category: Optional[str] = Query(None, description="カテゴリーで絞り込む"),
+    creator_id: Optional[int] = Query(None, description="作成者で絞り込む"),
+    created_from: Optional[datetime] = Query(None, description="この日時以降に作成されたもの"),
+    created_to: Optional[datetime] = Query(None, description="この日時より前に作成されたもの"),
+    cursor: Optional[str] = Query(None, description="前のページの next_cursor"),
+    limit: int = Query(20, ge=1, le=100),
+    user_id: Optional[int] = Query(None, description="指定した場合は is_favorite を設定する"),
+    db: Session = Depends(get_db)
+):
+    after = None
+    if cursor:
+        after = decode_cursor(sort, cursor)
+        if after is None:
+            raise HTTPException(status_code=400, detail="カーソルが不正です")
+    projects, next_cursor = browse_projects(
+        db, sort, category, creator_id, created_from, created_to, after, limit
+    )
+    return ProjectBrowseResponse(
+        projects=convert_projects(projects, db, user_id),
+        next_cursor=next_cursor
+    )
+
+# お気に入りの共起から計算したユーザーへのおすすめ（計算済みの結果をメモリから返す）
+@router.get("/recommendations", response_model=ProjectRecommendationsResponse)
+def get_recommendations(
+    user_id: int,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db)
+):
+    return build_recommendations(db, project_recommender.for_user(user_id, limit))
 
 @router.post("/create")
-def create_project(project: ProjectCreate, db: Session = Depends(get_db)):
+def create_project(
+    project: ProjectCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     if not project.title or not project.description or not project.category:
         raise HTTPException(status_code=400, detail="全ての項目を入力してください")
     # プロジェクト作成処理（例）
     new_project = Project(
         title=project.title,
         description=project.description,
-        summary=project.category,
-        creator_user_id=project.author_id
+        category=project.category,
+        # 作成ポイントを付与するため、本文の author_id ではなくログイン中のユーザーを作成者にする
+        creator_user_id=current_user.user_id
     )
     db.add(new_project)
+    db.flush()
+    # お困りごと・メッセージの保存先シャードを決めておく（お困りごとが作成されてからは変更しない）
+    shard_registry.assign_new_project(db, new_project.project_id)
+    record_change(db, PROJECT, new_project.project_id, CREATED, {
+        "id": new_project.project_id,
+        "title": new_project.title,
+        "description": new_project.description,
+        "category": new_project.category,
+        "creator_user_id": new_project.creator_user_id,
+    })
     db.commit()
     db.refresh(new_project)
-    return {"message": "Project created successfully", "project_id": new_project.project_id}
\ No newline at end of file
+    
+    # プロジェクト作成者にポイントを付与
+    award_points(db, new_project.creator_user_id, PROJECT_CREATED, new_project.project_id)
+    return {"message": "Project created successfully", "project_id": new_project.project_id}
+
+# 固定パス（/categories, /ranking, /browse, /recommendations）より後に定義し、パスパラメータとして解釈されないようにする
+# プロジェクトIDを指定して、個別プロジェクトの詳細を返すエンドポイント
+@router.get("/{project_id}", response_model=ProjectResponse)
+def get_project_by_id(project_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    # 本体を読み込む前に作成・更新日時だけを取得し、変更が無ければ 304 を返す
+    # （ユーザーに依存しないレスポンスのため、ブラウザ・CDN で共有キャッシュ可能）
+    # （集計値・作者名も応答に含まれるため ETag に含める）
+    version = (
+        db.query(
+            Project.created_at, Project.updated_at,
+            Project.favorite_count, Project.activity_count, Project.message_count, User.name,
+        )
+        .outerjoin(User, User.user_id == Project.creator_user_id)
+        .filter(Project.project_id == project_id)
+        .first()
+    )
+    if not version:
+        raise HTTPException(status_code=404, detail="Project not found")
+    not_modified = conditional_response(
+        request,
+        response,
+        make_etag("project", project_id, *version),
+        version.updated_at or version.created_at,
+        public_cache_control(),
+    )
+    if not_modified:
+        return not_modified
+    
+    project = db.query(Project).filter(Project.project_id == project_id).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    # ユーザーコンテキストが無いため、お気に入り状態は false
+    return project_response(project, version.name, False)
+
+# このプロジェクトと一緒にお気に入りされているプロジェクト
+@router.get("/{project_id}/similar", response_model=ProjectRecommendationsResponse)
+def get_similar_projects(
+    project_id: int,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db)
+):
+    return build_recommendations(db, project_recommender.similar_to(project_id, limit))
+
+# 集約エンドポイントで選択できる項目
+DETAIL_FIELDS = {"favorite", "stats", "troubles", "messages"}
+# メッセージプレビューの最大文字数
+MESSAGE_PREVIEW_LENGTH = 100
+
+# プロジェクト詳細画面に必要な情報（作者・お気に入り状態・統計・お困りごと一覧・最新メッセージ）を
+# 1回のリクエストで返すエンドポイント。クエリ数は要求された項目数に応じて最大7回で固定
+# （お困りごと・メッセージはプロジェクトのシャードから読み、ユーザー名は最後にまとめて既定のデータベースから取得する）
+@router.get(
+    "/{project_id}/detail",
+    response_model=ProjectDetailAggregateResponse,
+    response_model_exclude_none=True
+)
+def get_project_detail(
+    project_id: int,
+    user_id: Optional[int] = Query(None, description="お気に入り状態を判定するユーザーID"),
+    fields: Optional[str] = Query(None, description="取得する項目（カンマ区切り: favorite,stats,troubles,messages）。未指定の場合はすべて"),
+    troubles_limit: int = Query(20, ge=1, le=100),
+    messages_per_trouble: int = Query(3, ge=1, le=10),
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards)
+):
+    if fields:
+        requested = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = requested - DETAIL_FIELDS
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"不明な項目です: {', '.join(sorted(unknown))}")
+    else:
+        requested = set(DETAIL_FIELDS)
+    # メッセージプレビューはお困りごと一覧に含めて返す
+    if "messages" in requested:
+        requested.add("troubles")
+    
+    # 1. プロジェクトと作者名
+    row = (
+        db.query(Project, User.name)
+        .outerjoin(User, User.user_id == Project.creator_user_id)
+        .filter(Project.project_id == project_id)
+        .first()
+    )
+    if not row:
+        raise HTTPException(status_code=404, detail="Project not found")
+    project, author_name = row
+    sdb = shards.for_project(project_id)
+    
+    # 2. お気に入り状態
+    is_favorite = False
+    if "favorite" in requested and user_id is not None:
+        is_favorite = db.query(
+            db.query(UserFavoriteProject)
+            .filter(UserFavoriteProject.user_id == user_id, UserFavoriteProject.project_id == project_id)
+            .exists()
+        ).scalar()
+    
+    # 3. 統計（お困りごと数・メッセージ数をシャードから、お気に入り数を既定のデータベースから取得）
+    stats = None
+    if "stats" in requested:
+        troubles_count, messages_count, archived_messages_count = sdb.execute(
+            select(
+                select(func.count(Trouble.id))
+                .where(Trouble.project_id == project_id, Trouble.deleted_at.is_(None))
+                .scalar_subquery(),
+                select(func.count(Message.id))
+                .join(Trouble, Trouble.id == Message.trouble_id)
+                .where(Trouble.project_id == project_id, Trouble.deleted_at.is_(None))
+                .scalar_subquery(),
+                select(func.coalesce(func.sum(MessageArchive.message_count), 0))
+                .join(Trouble, Trouble.id == MessageArchive.trouble_id)
+                .where(Trouble.project_id == project_id, Trouble.deleted_at.is_(None))
+                .scalar_subquery(),
+            )
+        ).one()
+        favorites_count = (
+            db.query(func.count()).select_from(UserFavoriteProject)
+            .filter(UserFavoriteProject.project_id == project_id)
+            .scalar()
+        )
+        stats = ProjectStats(
+            troubles=troubles_count,
+            messages=messages_count + archived_messages_count,
+            favorites=favorites_count,
+        )
+    
+    # 4. お困りごと一覧（コメント数をサブクエリで同時に取得）
+    troubles = None
+    if "troubles" in requested:
+        comments_count = (
+            select(func.count(Message.id)).where(Message.trouble_id == Trouble.id).scalar_subquery()
+            + archived_count_subquery(Trouble.id)
+        )
+        trouble_rows = (
+            sdb.query(Trouble.id, Trouble.title, Trouble.category, Trouble.author_id, Trouble.created_at,
+                      comments_count.label("comments"))
+            .filter(Trouble.project_id == project_id, Trouble.deleted_at.is_(None))
+            .order_by(Trouble.created_at.desc(), Trouble.id.desc())
+            .limit(troubles_limit)
+            .all()
+        )
+        troubles = [
+            ProjectTroubleSummary(
+                id=r.id,
+                title=r.title,
+                category=r.category,
+                author_id=r.author_id,
+                author="Unknown User",
+                created_at=r.created_at,
+                comments=r.comments,
+            )
+            for r in trouble_rows
+        ]
+    
+    # 5. お困りごとごとの最新メッセージ（ウィンドウ関数で各スレッドの上位 N 件を1クエリで取得）
+    if "messages" in requested and troubles:
+        ranked = (
+            select(
+                Message.id,
+                Message.trouble_id,
+                Message.user_id,
+                Message.content,
+                Message.created_at,
+                func.row_number().over(
+                    partition_by=Message.trouble_id,
+                    order_by=(Message.created_at.desc(), Message.id.desc()),
+                ).label("rn"),
+            )
+            .where(Message.trouble_id.in_([t.id for t in troubles]))
+            .subquery()
+        )
+        message_rows = sdb.execute(
+            select(ranked)
+            .where(ranked.c.rn <= messages_per_trouble)
+            .order_by(ranked.c.trouble_id, ranked.c.rn)
+        ).all()
+        
+        previews = {t.id: [] for t in troubles}
+        for r in message_rows:
+            previews[r.trouble_id].append(MessagePreview(
+                id=r.id,
+                user_id=r.user_id,
+                user_name="Unknown",
+                content=r.content[:MESSAGE_PREVIEW_LENGTH],
+                created_at=r.created_at,
+            ))
+        for trouble in troubles:
+            trouble.recent_messages = previews[trouble.id]
+    
+    # 6. お困りごと・メッセージの投稿者名（シャードとは別のデータベースにあるため、まとめて1クエリで取得）
+    if troubles:
+        user_ids = {t.author_id for t in troubles}
+        user_ids.update(m.user_id for t in troubles for m in (t.recent_messages or []))
+        user_names = dict(db.query(User.user_id, User.name).filter(User.user_id.in_(user_ids)).all())
+        for trouble in troubles:
+            trouble.author = user_names.get(trouble.author_id) or "Unknown User"
+            for message in trouble.recent_messages or []:
+                message.user_name = user_names.get(message.user_id) or "Unknown"
+    
+    return ProjectDetailAggregateResponse(
+        project=project_response(project, author_name, is_favorite),
+        stats=stats,
+        troubles=troubles,
+    )
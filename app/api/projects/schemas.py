@@ -1,14 +1,16 @@
-from pydantic import BaseModel, Field
+from pydantic import Field
 from datetime import datetime
 from typing import List, Optional
 
-class ProjectBase(BaseModel):
+from ...schemas.base import BaseSchemaModel
+
+class ProjectBase(BaseSchemaModel):
     title: str = Field(..., min_length=1, max_length=100, description="プロジェクトのタイトル")
     description: str = Field(..., min_length=10, max_length=1000, description="プロジェクトの詳細説明")
     category: str = Field(..., description="プロジェクトのカテゴリー")
 
 class ProjectCreate(ProjectBase):
-    author_id: int
+    author_id: Optional[int] = None  # 互換性のため受け付けるが使用しない（作成者はログイン中のユーザー）
 
 class ProjectUpdate(ProjectBase):
     pass
@@ -18,26 +20,67 @@ class ProjectResponse(ProjectBase):
     author_id: int
     author: str
     created_at: datetime
-    likes: int = 0
-    comments: int = 0
+    likes: int = 0  # お気に入り数
+    comments: int = 0  # メッセージ数（message_count）
     is_favorite: bool = False
+    favorite_count: int = 0
+    activity_count: int = 0  # お困りごと・メッセージの作成数
 
-    class Config:
-        from_attributes = True
-
-class ProjectListResponse(BaseModel):
+class ProjectListResponse(BaseSchemaModel):
     new_projects: List[ProjectResponse]
     favorite_projects: List[ProjectResponse]
     total_projects: int
 
-class ProjectCategoryResponse(BaseModel):
+class ProjectBrowseResponse(BaseSchemaModel):
+    projects: List[ProjectResponse]
+    next_cursor: Optional[str] = None  # 次のページを取得する場合に cursor に指定する（最後のページの場合は None）
+
+class ProjectCategoryResponse(BaseSchemaModel):
     categories: List[str]
 
-class UserFavoriteProjectCreate(BaseModel):
+class UserFavoriteProjectCreate(BaseSchemaModel):
     user_id: int
     project_id: int
 
-class RankingUser(BaseModel):
+class RankingUser(BaseSchemaModel):
     name: str
     points: int
     rank: int
+
+class ProjectStats(BaseSchemaModel):
+    troubles: int = 0
+    messages: int = 0
+    favorites: int = 0
+
+class MessagePreview(BaseSchemaModel):
+    id: int
+    user_id: int
+    user_name: str
+    content: str = Field(..., description="先頭部分のみ（プレビュー）")
+    created_at: datetime
+
+class ProjectTroubleSummary(BaseSchemaModel):
+    id: int
+    title: str
+    category: str
+    author_id: int
+    author: str
+    created_at: datetime
+    comments: int = 0
+    recent_messages: Optional[List[MessagePreview]] = None
+
+class ProjectDetailAggregateResponse(BaseSchemaModel):
+    project: ProjectResponse
+    stats: Optional[ProjectStats] = None
+    troubles: Optional[List[ProjectTroubleSummary]] = None
+
+class RecommendedProject(BaseSchemaModel):
+    id: int
+    title: str
+    category: str
+    author_id: int
+    score: float = Field(..., description="おすすめ度（お気に入りの共起によるコサイン類似度。人気順の場合はお気に入り数）")
+
+class ProjectRecommendationsResponse(BaseSchemaModel):
+    projects: List[RecommendedProject]
+    generated_at: datetime  # おすすめを計算した日時
@@ -0,0 +1,252 @@
+"""
+プロジェクト一覧の並び替え用の集計値
+
+- activity_count（お困りごと・メッセージの作成数）: コンシューマー "project_activity" が
+  変更イベント（アウトボックス）を受け取り、既定のデータベースのプロジェクトに加算する
+  反映済みのイベントIDをシャードごとに project_activity_offsets に保持し、加算と同じトランザクションで
+  進めるため、再配信されたイベントを二重に数えない
+- message_count（メッセージ数）: 同じコンシューマーがメッセージの作成イベントで加算し、
+  お困りごとの削除イベントに記録したメッセージ数を減算する。列の追加前からある行は NULL のままで
+  加算されず、ProjectStatsRefresher がシャードから数えて設定する
+- favorite_count: お気に入りはアプリの外からも追加されるため、ProjectStatsRefresher が
+  定期的に user_project_favorites の件数・チェックサムを確認し、変化があった場合だけ集計し直す
+- category: 以前は summary に保存していたため、category が空の行に summary を移し替える
+"""
+from collections import Counter
+from typing import Callable, Dict, List
+
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.orm import Session
+
+from ...core.config import settings
+from ...core.database import DEFAULT_SHARD, SessionLocal, ShardSessions
+from ...core.query_cache import SHARD_INFO_KEY
+from ...services.outbox import outbox_dispatcher, ChangeEvent, TROUBLE, MESSAGE, CREATED, DELETED
+from ...services.periodic import PeriodicWorker
+from ..messages.models import Message, MessageArchive
+from ..troubles.models import Trouble
+from .models import Project, ProjectActivityOffset, UserFavoriteProject
+from .recommendations import favorites_fingerprint
+
+# アウトボックスのコンシューマー名（オフセットの保存キー）
+CONSUMER_NAME = "project_activity"
+
+projects_table = Project.__table__
+
+
+# ───────── 活動数 ─────────
+def handle_change_events(db: Session, events: List[ChangeEvent]) -> None:
+    """
+    お困りごと・メッセージの作成イベントをプロジェクトの活動数に加算する
+    既定のデータベースのイベントは db（配信用のセッション）でオフセットと同時にコミットし、
+    他のシャードのイベントは既定のデータベースに別のセッションで書き込む
+    """
+    if not events:
+        return
+    shard = db.info.get(SHARD_INFO_KEY, DEFAULT_SHARD)
+    own_session = shard != DEFAULT_SHARD
+    session = SessionLocal() if own_session else db
+    try:
+        offset = (
+            session.query(ProjectActivityOffset)
+            .filter(ProjectActivityOffset.shard == shard)
+            .with_for_update()
+            .first()
+        )
+        if offset is None:
+            offset = ProjectActivityOffset(shard=shard, last_event_id=0)
+            session.add(offset)
+            session.flush()
+
+        counts: Dict[int, int] = Counter()
+        message_counts: Dict[int, int] = Counter()
+        for event in events:
+            if event.id <= offset.last_event_id:
+                continue
+            # project_id を含まない以前のメッセージのイベントは数えない
+            project_id = event.payload.get("project_id")
+            if project_id is None:
+                continue
+            if event.event_type == CREATED and event.aggregate_type in (TROUBLE, MESSAGE):
+                counts[project_id] += 1
+                if event.aggregate_type == MESSAGE:
+                    message_counts[project_id] += 1
+            elif event.event_type == DELETED and event.aggregate_type == TROUBLE:
+                message_counts[project_id] -= event.payload.get("message_count", 0)
+        changes = [
+            {"b_project_id": project_id, "b_count": counts.get(project_id, 0), "b_messages": message_counts.get(project_id, 0)}
+            for project_id in set(counts) | set(message_counts)
+        ]
+        if changes:
+            # message_count が NULL（未集計）の行は NULL のまま
+            session.execute(
+                update(projects_table)
+                .where(projects_table.c.project_id == bindparam("b_project_id"))
+                .values(
+                    activity_count=projects_table.c.activity_count + bindparam("b_count"),
+                    message_count=projects_table.c.message_count + bindparam("b_messages"),
+                ),
+                changes,
+            )
+        offset.last_event_id = max(offset.last_event_id, events[-1].id)
+        if own_session:
+            session.commit()
+    except Exception:
+        if own_session:
+            session.rollback()
+        raise
+    finally:
+        if own_session:
+            session.close()
+
+
+# ───────── お気に入り数・カテゴリー ─────────
+def sync_favorite_counts(db: Session, batch_size: int = 1000) -> int:
+    """
+    user_project_favorites から数え直し、favorite_count が異なるプロジェクトだけを更新する
+
+    :return: 更新したプロジェクトの数
+    """
+    counts = dict(
+        db.query(UserFavoriteProject.project_id, func.count())
+        .group_by(UserFavoriteProject.project_id)
+        .all()
+    )
+    current = dict(
+        db.query(Project.project_id, Project.favorite_count)
+        .filter(Project.favorite_count > 0)
+        .all()
+    )
+    changes = [
+        {"b_project_id": project_id, "b_count": count}
+        for project_id, count in counts.items()
+        if current.get(project_id, 0) != count
+    ] + [
+        {"b_project_id": project_id, "b_count": 0}
+        for project_id in current
+        if project_id not in counts
+    ]
+    for start in range(0, len(changes), batch_size):
+        db.execute(
+            update(projects_table)
+            .where(projects_table.c.project_id == bindparam("b_project_id"))
+            .values(favorite_count=bindparam("b_count")),
+            changes[start:start + batch_size],
+        )
+        db.commit()
+    return len(changes)
+
+
+def backfill_categories(db: Session, batch_size: int = 1000) -> int:
+    """
+    category が空で summary にカテゴリーが保存されている行を batch_size 件移し替える
+
+    :return: 移し替えた行数
+    """
+    rows = (
+        db.query(Project.project_id, Project.summary)
+        .filter(Project.category.is_(None), Project.summary.isnot(None))
+        .order_by(Project.project_id)
+        .limit(batch_size)
+        .all()
+    )
+    if rows:
+        db.execute(
+            update(projects_table)
+            .where(projects_table.c.project_id == bindparam("b_project_id"))
+            .values(category=bindparam("b_category")),
+            [{"b_project_id": project_id, "b_category": summary[:100]} for project_id, summary in rows],
+        )
+    db.commit()
+    return len(rows)
+
+
+def backfill_message_counts(db: Session, batch_size: int = 1000) -> int:
+    """
+    message_count が NULL（未集計）のプロジェクトを batch_size 件、シャードのメッセージから数えて設定する
+
+    :return: 設定した行数
+    """
+    project_ids = [
+        project_id for (project_id,) in
+        db.query(Project.project_id)
+        .filter(Project.message_count.is_(None))
+        .order_by(Project.project_id)
+        .limit(batch_size)
+    ]
+    if not project_ids:
+        return 0
+    counts: Dict[int, int] = Counter()
+    shards = ShardSessions(db)
+    try:
+        for sdb, shard_project_ids in shards.group_by_project(project_ids):
+            live = [Trouble.project_id.in_(shard_project_ids), Trouble.deleted_at.is_(None)]
+            counts.update(dict(
+                sdb.query(Trouble.project_id, func.count(Message.id))
+                .join(Message, Message.trouble_id == Trouble.id)
+                .filter(*live)
+                .group_by(Trouble.project_id)
+                .all()
+            ))
+            counts.update({
+                project_id: int(count) for project_id, count in
+                sdb.query(Trouble.project_id, func.sum(MessageArchive.message_count))
+                .join(MessageArchive, MessageArchive.trouble_id == Trouble.id)
+                .filter(*live)
+                .group_by(Trouble.project_id)
+                .all()
+            })
+    finally:
+        shards.close()
+    db.execute(
+        update(projects_table)
+        .where(projects_table.c.project_id == bindparam("b_project_id"), projects_table.c.message_count.is_(None))
+        .values(message_count=bindparam("b_count")),
+        [{"b_project_id": project_id, "b_count": counts.get(project_id, 0)} for project_id in project_ids],
+    )
+    db.commit()
+    return len(project_ids)
+
+
+class ProjectStatsRefresher(PeriodicWorker):
+    """カテゴリー・メッセージ数の初回設定と、お気に入り数の集計し直しを定期的に行う"""
+
+    def __init__(
+        self,
+        interval: float = 300.0,
+        batch_size: int = 1000,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ):
+        super().__init__("project-stats", interval, run_on_start=True)
+        self._batch_size = batch_size
+        self._session_factory = session_factory
+        self._fingerprint = None
+
+    def run_once(self) -> None:
+        db = self._session_factory()
+        try:
+            while not self.stopping and backfill_categories(db, self._batch_size) == self._batch_size:
+                pass
+            while not self.stopping and backfill_message_counts(db, self._batch_size) == self._batch_size:
+                pass
+            fingerprint = favorites_fingerprint(db)
+            if fingerprint != self._fingerprint:
+                updated = sync_favorite_counts(db, self._batch_size)
+                self._fingerprint = fingerprint
+                if updated:
+                    print(f"プロジェクトのお気に入り数を更新しました: {updated}件")
+        except Exception as e:
+            print(f"プロジェクトの集計値の更新エラー: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+
+
+# アプリ全体で共有する更新処理
+project_stats_refresher = ProjectStatsRefresher(
+    interval=settings.PROJECT_STATS_REFRESH_INTERVAL_SECONDS,
+    batch_size=settings.PROJECT_STATS_BATCH_SIZE,
+)
+
+if settings.PROJECT_ACTIVITY_ENABLED:
+    outbox_dispatcher.register(CONSUMER_NAME, handle_change_events)
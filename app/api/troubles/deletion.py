@@ -0,0 +1,211 @@
+"""
+お困りごとの削除（子データを含む一括削除）
+
+お困りごとを削除する際は、先に子データ（メッセージ）を集合単位の DELETE で
+チャンクごとに削除・コミットし、最後にお困りごと本体を削除する。
+1件ずつ外部キーを NULL にしたり削除したりすることはなく、
+長いスレッドでもトランザクションとロックの範囲はチャンク単位に収まる。
+
+- メッセージ数が1チャンク以内の場合は、本体と同じ1トランザクションで削除する
+- それを超える場合、TROUBLE_SOFT_DELETE_ENABLED が有効なら deleted_at を設定して
+  即座に一覧・詳細から隠し（論理削除）、子データの削除はバックグラウンドの
+  TroublePurger が行う。無効ならリクエスト内でチャンクごとに削除する
+- 論理削除済みで未削除のお困りごとは deleted_at が設定された行そのものが
+  削除待ちの一覧になるため、再起動しても削除は再開される
+- db にはお困りごとを保存しているシャードのセッションを渡す（TroublePurger は全シャードを処理する）
+- 既読位置（trouble_read_markers）は既定のデータベースにあるため、本体を削除した後に別のトランザクションで削除する
+"""
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, func
+from sqlalchemy.orm import Session
+
+from ...core.config import settings
+from ...core.database import DEFAULT_SHARD, SessionLocal, shard_registry
+from ...core.query_cache import SHARD_INFO_KEY
+from ...services.outbox import record_change, TROUBLE, DELETED
+from ...services.periodic import PeriodicWorker
+from ..messages.models import Message, MessageArchive, TroubleReadMarker
+from ..messages.unread import latest_messages
+from .feed import feed_index
+from .similarity import delete_similarity_data
+from .models import Trouble
+
+messages_table = Message.__table__
+archives_table = MessageArchive.__table__
+markers_table = TroubleReadMarker.__table__
+troubles_table = Trouble.__table__
+
+
+def delete_messages_in_chunks(db: Session, trouble_id: int, chunk_size: int) -> int:
+    """
+    お困りごとのメッセージを chunk_size 件ずつ削除し、チャンクごとにコミットする
+    （アーカイブ済みのメッセージはお困りごとあたり数ページのため、本体と一緒に削除する）
+
+    :return: 削除したメッセージ数
+    """
+    deleted = 0
+    last_id = 0
+    while True:
+        # 削除済みの範囲を読み飛ばすため、ID のキーセットで次のチャンクを取得する
+        ids = [
+            message_id for (message_id,) in
+            db.query(Message.id)
+            .filter(Message.trouble_id == trouble_id, Message.id > last_id)
+            .order_by(Message.id)
+            .limit(chunk_size)
+        ]
+        if not ids:
+            return deleted
+        db.execute(delete(messages_table).where(messages_table.c.id.in_(ids)))
+        db.commit()
+        deleted += len(ids)
+        last_id = ids[-1]
+
+
+def delete_read_markers(db: Session, trouble_id: int) -> None:
+    """お困りごとの既読位置を削除する（既定のデータベース以外のシャードの場合は既定のデータベースのセッションで削除する）"""
+    own_session = db.info.get(SHARD_INFO_KEY, DEFAULT_SHARD) != DEFAULT_SHARD
+    session = SessionLocal() if own_session else db
+    try:
+        session.execute(delete(markers_table).where(markers_table.c.trouble_id == trouble_id))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        if own_session:
+            session.close()
+
+
+def count_messages(db: Session, trouble_id: int) -> int:
+    """お困りごとのメッセージ数（アーカイブ済みを含む）"""
+    hot = db.query(func.count(Message.id)).filter(Message.trouble_id == trouble_id).scalar()
+    archived = (
+        db.query(func.coalesce(func.sum(MessageArchive.message_count), 0))
+        .filter(MessageArchive.trouble_id == trouble_id)
+        .scalar()
+    )
+    return int(hot) + int(archived)
+
+
+def delete_trouble(db: Session, trouble: Trouble, payload: Dict[str, Any]) -> None:
+    """
+    お困りごとを子データごと削除する（変更イベントの記録とフィードからの除外も行う）
+    メッセージ数に応じて、即時削除・論理削除・チャンク削除を選ぶ
+
+    :param payload: 変更イベントに記録する内容（プロジェクトのメッセージ数を減らすため、削除するメッセージ数を追加する）
+    """
+    chunk_size = settings.TROUBLE_DELETE_CHUNK_SIZE
+    trouble_id, category, created_at = trouble.id, trouble.category, trouble.created_at
+    payload = dict(payload, message_count=count_messages(db, trouble_id))
+    is_long_thread = (
+        db.query(Message.id).filter(Message.trouble_id == trouble_id).offset(chunk_size).limit(1).first()
+        is not None
+    )
+
+    if not is_long_thread:
+        # 短いスレッドは本体と同じトランザクションで削除する
+        db.execute(delete(messages_table).where(messages_table.c.trouble_id == trouble_id))
+        db.execute(delete(archives_table).where(archives_table.c.trouble_id == trouble_id))
+        delete_similarity_data(db, trouble_id)
+        db.execute(delete(troubles_table).where(troubles_table.c.id == trouble_id))
+        record_change(db, TROUBLE, trouble_id, DELETED, payload)
+        db.commit()
+        delete_read_markers(db, trouble_id)
+    elif settings.TROUBLE_SOFT_DELETE_ENABLED:
+        # 長いスレッドは論理削除して先に応答し、子データはバックグラウンドで削除する
+        trouble.deleted_at = datetime.utcnow()
+        record_change(db, TROUBLE, trouble_id, DELETED, payload)
+        db.commit()
+        trouble_purger.notify()
+    else:
+        delete_messages_in_chunks(db, trouble_id, chunk_size)
+        db.execute(delete(archives_table).where(archives_table.c.trouble_id == trouble_id))
+        delete_similarity_data(db, trouble_id)
+        db.execute(delete(troubles_table).where(troubles_table.c.id == trouble_id))
+        record_change(db, TROUBLE, trouble_id, DELETED, payload)
+        db.commit()
+        delete_read_markers(db, trouble_id)
+
+    feed_index.remove(category, trouble_id, created_at)
+    latest_messages.remove(trouble_id)
+
+
+def purge_trouble(db: Session, trouble_id: int, chunk_size: int) -> int:
+    """論理削除済みのお困りごとを子データごと物理削除する"""
+    deleted = delete_messages_in_chunks(db, trouble_id, chunk_size)
+    db.execute(delete(archives_table).where(archives_table.c.trouble_id == trouble_id))
+    delete_similarity_data(db, trouble_id)
+    db.execute(
+        delete(troubles_table)
+        .where(troubles_table.c.id == trouble_id, troubles_table.c.deleted_at.isnot(None))
+    )
+    db.commit()
+    delete_read_markers(db, trouble_id)
+    return deleted
+
+
+class TroublePurger(PeriodicWorker):
+    """
+    論理削除済みのお困りごとをバックグラウンドで物理削除する
+    起動直後にも削除待ちを処理するため、途中で停止したお困りごとは次回起動時に続きから削除される
+    """
+
+    def __init__(
+        self,
+        interval: float = 60.0,
+        chunk_size: int = 1000,
+        session_factories: Optional[Dict[str, Callable[[], Session]]] = None,
+    ):
+        super().__init__("trouble-purger", interval, run_on_start=True)
+        self._chunk_size = chunk_size
+        # シャード名 -> セッションファクトリー（未指定の場合は登録済みの全シャード）
+        self._session_factories = session_factories or shard_registry.session_factories()
+
+    def run_once(self) -> None:
+        self.purge_pending()
+
+    def purge_pending(self) -> int:
+        """
+        全シャードの削除待ちのお困りごとをすべて物理削除する
+
+        :return: 削除したお困りごとの数
+        """
+        purged = 0
+        for session_factory in self._session_factories.values():
+            if self.stopping:
+                break
+            purged += self._purge_shard(session_factory)
+        return purged
+
+    def _purge_shard(self, session_factory: Callable[[], Session]) -> int:
+        db = session_factory()
+        try:
+            pending: List[int] = [
+                trouble_id for (trouble_id,) in
+                db.query(Trouble.id).filter(Trouble.deleted_at.isnot(None)).order_by(Trouble.deleted_at)
+            ]
+            db.commit()
+            purged = 0
+            for trouble_id in pending:
+                if self.stopping:
+                    break
+                try:
+                    messages = purge_trouble(db, trouble_id, self._chunk_size)
+                    purged += 1
+                    print(f"お困りごと {trouble_id} を削除しました（メッセージ {messages}件）")
+                except Exception as e:
+                    print(f"お困りごとの削除エラー（{trouble_id}）: {str(e)}")
+                    db.rollback()
+            return purged
+        finally:
+            db.close()
+
+
+# アプリ全体で共有する削除スレッド
+trouble_purger = TroublePurger(
+    interval=settings.TROUBLE_PURGE_INTERVAL_SECONDS,
+    chunk_size=settings.TROUBLE_DELETE_CHUNK_SIZE,
+)
@@ -0,0 +1,174 @@
+"""
+お困りごとのパーソナライズフィード
+
+カテゴリーごとに「新しい順のお困りごとID列」をメモリ上に保持し（カテゴリー別の新着インデックス）、
+ユーザーの興味カテゴリー K 個分の列をマージしてフィードを作る。
+troubles テーブルを走査せず、フィード1ページの取得はインデックスのマージと IN 検索だけで済む。
+
+- 各カテゴリーの列は初回参照時（および TTL 経過後）に DB から新しい順に depth 件読み込む
+- お困りごとの作成・更新・削除時はルーターから add / remove を呼んで即時反映する
+- 列が depth 件で打ち切られているカテゴリーで列の末尾を越えた場合は DB から続きを取得する
+- シャーディング時は全シャードから新しい順に取得してマージする（ID はシャードをまたいで一意）
+"""
+import bisect
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from ...core.config import settings
+from .models import Trouble
+
+# 並び順のキー: (-作成日時のエポックからのマイクロ秒, -ID)。昇順に並べると新しい順になる
+# （タイムゾーン無しの作成日時は UTC として整数にする。サーバーのローカル時刻や浮動小数点の丸めに左右されない）
+FeedKey = Tuple[int, int]
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_micros(created_at: datetime) -> int:
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return (created_at - _EPOCH) // timedelta(microseconds=1)
+
+
+def _from_micros(micros: int) -> datetime:
+    """DB の値と比較するための、タイムゾーン無しの UTC の日時"""
+    return _EPOCH + timedelta(microseconds=micros)
+
+
+def _feed_key(created_at: datetime, trouble_id: int) -> FeedKey:
+    return (-_to_micros(created_at), -trouble_id)
+
+
+def encode_cursor(key: FeedKey) -> str:
+    """フィードのカーソル（最後に返した要素のキー）を文字列にする"""
+    return f"{-key[0]}_{-key[1]}"
+
+
+def decode_cursor(cursor: str) -> Optional[FeedKey]:
+    """カーソル文字列をキーに戻す。不正な場合は None"""
+    try:
+        micros, trouble_id = cursor.split("_", 1)
+        return (-int(micros), -int(trouble_id))
+    except ValueError:
+        return None
+
+
+class CategoryRecencyIndex:
+    """カテゴリー別の新着インデックス"""
+
+    def __init__(self, depth: int = 500, ttl: float = 300.0):
+        self._depth = depth
+        self._ttl = ttl
+        self._streams: Dict[str, List[FeedKey]] = {}
+        self._complete: Dict[str, bool] = {}  # DB上の全件を保持しているか
+        self._loaded_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    # ───────── 更新 ─────────
+    def add(self, category: str, trouble_id: int, created_at: datetime) -> None:
+        """お困りごとをインデックスに追加する（未読み込みのカテゴリーは次回参照時に読み込む）"""
+        with self._lock:
+            stream = self._streams.get(category)
+            if stream is None:
+                return
+            bisect.insort(stream, _feed_key(created_at, trouble_id))
+            if len(stream) > self._depth:
+                stream.pop()
+                self._complete[category] = False
+
+    def remove(self, category: str, trouble_id: int, created_at: datetime) -> None:
+        """お困りごとをインデックスから削除する"""
+        with self._lock:
+            stream = self._streams.get(category)
+            if stream is None:
+                return
+            key = _feed_key(created_at, trouble_id)
+            i = bisect.bisect_left(stream, key)
+            if i < len(stream) and stream[i] == key:
+                del stream[i]
+
+    def invalidate(self, category: Optional[str] = None) -> None:
+        """インデックスを破棄する（category 未指定の場合は全カテゴリー）"""
+        with self._lock:
+            if category is None:
+                self._streams.clear()
+                self._complete.clear()
+                self._loaded_at.clear()
+            else:
+                self._streams.pop(category, None)
+                self._complete.pop(category, None)
+                self._loaded_at.pop(category, None)
+
+    # ───────── 参照 ─────────
+    def merged(
+        self, sessions: List[Session], categories: Iterable[str], after: Optional[FeedKey], limit: int
+    ) -> List[FeedKey]:
+        """
+        複数カテゴリーの列をマージして、after より後（古い）の要素を新しい順に limit 件返す
+
+        :param sessions: 全シャードのセッション
+        """
+        slices = []
+        for category in set(categories):
+            stream, complete = self._get_stream(sessions, category)
+            start = bisect.bisect_right(stream, after) if after is not None else 0
+            part = stream[start:start + limit]
+            if len(part) < limit and not complete:
+                # インデックスの末尾を越えたカテゴリーは DB から続きを取得する
+                part = query_recent_keys(sessions, category, after, limit)
+            slices.append(part)
+        return list(islice(heapq.merge(*slices), limit))
+
+    def _get_stream(self, sessions: List[Session], category: str) -> Tuple[List[FeedKey], bool]:
+        now = time.monotonic()
+        with self._lock:
+            stream = self._streams.get(category)
+            if stream is not None and now - self._loaded_at[category] < self._ttl:
+                return stream, self._complete[category]
+
+        stream = query_recent_keys(sessions, category, None, self._depth)
+        complete = len(stream) < self._depth
+        with self._lock:
+            self._streams[category] = stream
+            self._complete[category] = complete
+            self._loaded_at[category] = now
+        return stream, complete
+
+
+def query_recent_keys(
+    sessions: List[Session], category: Optional[str], after: Optional[FeedKey], limit: int
+) -> List[FeedKey]:
+    """
+    お困りごとを新しい順に after より後から limit 件取得する（キーセットページネーション）
+    category 指定時は (category, created_at) インデックスを使用する
+    シャードごとに limit 件ずつ取得し、新しい順にマージする
+    """
+    slices = []
+    for db in sessions:
+        query = db.query(Trouble.id, Trouble.created_at).filter(Trouble.deleted_at.is_(None))
+        if category is not None:
+            query = query.filter(Trouble.category == category)
+        if after is not None:
+            after_created_at = _from_micros(-after[0])
+            after_id = -after[1]
+            query = query.filter(or_(
+                Trouble.created_at < after_created_at,
+                and_(Trouble.created_at == after_created_at, Trouble.id < after_id),
+            ))
+        rows = query.order_by(Trouble.created_at.desc(), Trouble.id.desc()).limit(limit).all()
+        slices.append([_feed_key(created_at, trouble_id) for trouble_id, created_at in rows])
+    return list(islice(heapq.merge(*slices), limit))
+
+
+# アプリ全体で共有するインデックス
+feed_index = CategoryRecencyIndex(
+    depth=settings.FEED_INDEX_DEPTH,
+    ttl=settings.FEED_INDEX_TTL_SECONDS,
+)
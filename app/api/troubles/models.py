@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import BigInteger, Column, Float, Integer, LargeBinary, SmallInteger, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -17,8 +17,50 @@ class Trouble(Base):
     author_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)  # users.idからusers.user_idに修正
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    deleted_at = Column(DateTime(timezone=True), nullable=True, index=True)  # 論理削除日時（子データの削除が終わるまでの間だけ設定される）
     
     # リレーションシップ
     project = relationship("Project", back_populates="troubles")
     author = relationship("User", back_populates="troubles")
     messages = relationship("Message", back_populates="trouble")
+
+    __table_args__ = (
+        # カテゴリー別の新着順取得（パーソナライズフィード）用
+        Index("ix_troubles_category_created_at", "category", "created_at"),
+    )
+
+
+class TroubleSignature(Base):
+    __tablename__ = "trouble_signatures"
+
+    # お困りごとのタイトル・説明文の MinHash シグネチャ（類似お困りごとの検出用、お困りごとと同じシャードに保存する）
+    trouble_id = Column(Integer, ForeignKey("troubles.id"), primary_key=True, autoincrement=False)
+    project_id = Column(Integer, nullable=False)
+    signature = Column(LargeBinary, nullable=False)  # 32bit 符号なし整数の配列（リトルエンディアン）
+    checked_at = Column(DateTime(timezone=True), nullable=True, index=True)  # 重複レポートで照合済みの日時（未照合は NULL）
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class TroubleLshBucket(Base):
+    __tablename__ = "trouble_lsh_buckets"
+
+    # シグネチャをバンドに分けたハッシュ（LSH）。同じバケットに入ったお困りごとを類似候補とする
+    project_id = Column(Integer, primary_key=True, autoincrement=False)
+    band = Column(SmallInteger, primary_key=True, autoincrement=False)
+    bucket = Column(BigInteger, primary_key=True, autoincrement=False)
+    trouble_id = Column(Integer, ForeignKey("troubles.id"), primary_key=True, autoincrement=False, index=True)
+
+
+class TroubleDuplicate(Base):
+    __tablename__ = "trouble_duplicates"
+
+    # 重複レポート: 後から作成されたお困りごとと、それに類似する先に作成されたお困りごとの組
+    trouble_id = Column(Integer, ForeignKey("troubles.id"), primary_key=True, autoincrement=False)
+    duplicate_of_id = Column(Integer, ForeignKey("troubles.id"), primary_key=True, autoincrement=False, index=True)
+    project_id = Column(Integer, nullable=False)
+    similarity = Column(Float, nullable=False)
+    detected_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_trouble_duplicates_project_id", "project_id", "trouble_id"),
+    )
@@ -1,44 +1,85 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import func, select
 
 # 相対インポートに修正
-from ...core.database import get_db
+from ...core.config import settings
+from ...core.database import ShardSessions, fan_out_page, get_db, get_shards
+from ...core.query_cache import cached
+from ...core.http_cache import conditional_response, make_etag
 from ...api.auth.jwt import get_current_user
 from ...api.users.models import User
 from ...api.projects.models import Project
-from .models import Trouble
+from ...api.points.service import award_points, TROUBLE_POSTED
+from ...api.messages.models import Message
+from ...api.messages.archive import archived_count_subquery, get_archived_counts
+from ...api.messages.unread import ThreadHead, mark_read
+from ...services.outbox import record_change, TROUBLE, CREATED, UPDATED
+from .models import Trouble, TroubleDuplicate
+from .feed import feed_index, query_recent_keys, encode_cursor, decode_cursor
 
-from . import schemas
+from . import deletion, schemas, similarity
 
 router = APIRouter()
 
-@router.post("/", response_model=schemas.TroubleResponse)
+def trouble_event_payload(trouble: Trouble) -> dict:
+    """変更イベント（アウトボックス）に記録するお困りごとの内容"""
+    return {
+        "id": trouble.id,
+        "title": trouble.title,
+        "description": trouble.description,
+        "category": trouble.category,
+        "project_id": trouble.project_id,
+        "author_id": trouble.author_id,
+    }
+
+@router.post("/", response_model=schemas.TroubleCreateResponse)
 def create_trouble(
     trouble: schemas.TroubleCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards)
 ):
     # プロジェクトが存在するか確認
-    project = db.query(Project).filter(Project.id == trouble.project_id).first()
+    project = cached(db.query(Project).filter(Project.project_id == trouble.project_id)).first()
     if not project:
         raise HTTPException(status_code=404, detail="プロジェクトが見つかりません")
     
+    # お困りごとはプロジェクトのシャードに保存する
+    sdb = shards.for_project(trouble.project_id)
+    
     # お困りごと作成
     new_trouble = Trouble(
         title=trouble.title,
         description=trouble.description,
         category=trouble.category,
         project_id=trouble.project_id,
-        author_id=current_user.id
+        author_id=current_user.user_id
     )
     
-    db.add(new_trouble)
-    db.commit()
-    db.refresh(new_trouble)
+    sdb.add(new_trouble)
+    sdb.flush()
+    record_change(sdb, TROUBLE, new_trouble.id, CREATED, trouble_event_payload(new_trouble))
     
-    return schemas.TroubleResponse(
+    # 同じプロジェクトの類似お困りごとを検索し、シグネチャを同じトランザクションで保存する
+    similar = []
+    if settings.TROUBLE_SIMILARITY_ENABLED:
+        signature = similarity.compute_signature(new_trouble.title, new_trouble.description)
+        similar = similarity.index_new_trouble(sdb, new_trouble, signature)
+    sdb.commit()
+    sdb.refresh(new_trouble)
+    
+    # 投稿者にポイントを付与
+    award_points(db, current_user.user_id, TROUBLE_POSTED, new_trouble.id)
+    
+    # 自分のお困りごとへの返信を未読として数えられるよう、既読位置 0 で追跡を始める
+    mark_read(db, current_user.user_id, new_trouble.id, ThreadHead(0, 0), background=True)
+    
+    # フィード用の新着インデックスに追加
+    feed_index.add(new_trouble.category, new_trouble.id, new_trouble.created_at)
+    
+    return schemas.TroubleCreateResponse(
         id=new_trouble.id,
         title=new_trouble.title,
         description=new_trouble.description,
@@ -48,7 +89,11 @@ def create_trouble(
         author_id=new_trouble.author_id,
         author=current_user.name,
         created_at=new_trouble.created_at,
-        comments=0  # 新規作成時はコメント数0
+        comments=0,  # 新規作成時はコメント数0
+        similar_troubles=[
+            schemas.SimilarTrouble(id=s.trouble_id, title=s.title, similarity=s.similarity)
+            for s in similar
+        ]
     )
 
 @router.get("/", response_model=schemas.TroublesListResponse)
@@ -58,36 +103,36 @@ def get_troubles(
     skip: int = 0,
     limit: int = 10,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards)
 ):
-    # クエリ作成
-    query = db.query(Trouble)
-    
-    # プロジェクトIDによるフィルタリング
-    if project_id:
-        query = query.filter(Trouble.project_id == project_id)
-    
-    # カテゴリによるフィルタリング
-    if category:
-        query = query.filter(Trouble.category == category)
-    
-    # 作成日時で降順ソート
-    query = query.order_by(Trouble.created_at.desc())
-    
-    # 総数取得
-    total = query.count()
+    def build_query(sdb: Session):
+        # クエリ作成（論理削除済みは除く）
+        query = sdb.query(Trouble).filter(Trouble.deleted_at.is_(None))
+        
+        # プロジェクトIDによるフィルタリング
+        if project_id:
+            query = query.filter(Trouble.project_id == project_id)
+        
+        # カテゴリによるフィルタリング
+        if category:
+            query = query.filter(Trouble.category == category)
+        
+        # 作成日時で降順ソート
+        return query.order_by(Trouble.created_at.desc())
     
-    # ページネーション適用
-    troubles = query.offset(skip).limit(limit).all()
+    # プロジェクト指定時はそのシャードだけ、未指定時は全シャードから取得して作成日時順にマージ
+    sessions = [shards.for_project(project_id)] if project_id else shards.all()
+    troubles, total = fan_out_page(sessions, build_query, lambda t: t.created_at, skip, limit)
     
     # レスポンス形式に変換
     trouble_list = []
     for trouble in troubles:
         # プロジェクト情報取得
-        project = db.query(Project).filter(Project.id == trouble.project_id).first()
+        project = cached(db.query(Project).filter(Project.project_id == trouble.project_id)).first()
         
         # 作成者情報取得
-        author = db.query(User).filter(User.id == trouble.author_id).first()
+        author = cached(db.query(User).filter(User.user_id == trouble.author_id)).first()
         
         # コメント数取得（メッセージとして扱う）
         # Note: Message モデルが実装されていることを前提とする
@@ -112,26 +157,215 @@ def get_troubles(
         total=total
     )
 
+def build_trouble_responses(
+    db: Session, shards: ShardSessions, troubles: List[Trouble]
+) -> List[schemas.TroubleResponse]:
+    """
+    お困りごとのリストをレスポンス形式に変換する
+    プロジェクト名・作成者名・コメント数はそれぞれ1回の IN / GROUP BY クエリでまとめて取得する
+    （コメント数はシャードごとに1回ずつ）
+    """
+    if not troubles:
+        return []
+    
+    project_ids = {t.project_id for t in troubles}
+    author_ids = {t.author_id for t in troubles}
+    trouble_ids = [t.id for t in troubles]
+    
+    project_titles = dict(
+        db.query(Project.project_id, Project.title).filter(Project.project_id.in_(project_ids)).all()
+    )
+    author_names = dict(
+        db.query(User.user_id, User.name).filter(User.user_id.in_(author_ids)).all()
+    )
+    comment_counts = {}
+    archived_counts = {}
+    for sdb, shard_trouble_ids in shards.group_by_id(trouble_ids):
+        comment_counts.update(
+            sdb.query(Message.trouble_id, func.count(Message.id))
+            .filter(Message.trouble_id.in_(shard_trouble_ids))
+            .group_by(Message.trouble_id)
+            .all()
+        )
+        archived_counts.update(get_archived_counts(sdb, shard_trouble_ids))
+    
+    return [
+        schemas.TroubleResponse(
+            id=trouble.id,
+            title=trouble.title,
+            description=trouble.description,
+            category=trouble.category,
+            project_id=trouble.project_id,
+            project_title=project_titles.get(trouble.project_id, "Unknown Project"),
+            author_id=trouble.author_id,
+            author=author_names.get(trouble.author_id, "Unknown User"),
+            created_at=trouble.created_at,
+            comments=comment_counts.get(trouble.id, 0) + archived_counts.get(trouble.id, 0)
+        )
+        for trouble in troubles
+    ]
+
+@router.get("/feed", response_model=schemas.TroubleFeedResponse)
+def get_trouble_feed(
+    cursor: Optional[str] = Query(None, description="前のページの next_cursor"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards)
+):
+    """
+    ログインユーザーの興味カテゴリーに合うお困りごとを新しい順に取得する
+    カテゴリー別の新着インデックスをマージして取得し、カテゴリー未設定の場合は全体の新着を返す
+    """
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            raise HTTPException(status_code=400, detail="カーソルが不正です")
+    
+    categories = current_user.get_categories_list()
+    if categories:
+        keys = feed_index.merged(shards.all(), categories, after, limit)
+    else:
+        keys = query_recent_keys(shards.all(), None, after, limit)
+    
+    # キーの順序（新しい順）を保ったまま本体を取得
+    ids = [-trouble_id for _, trouble_id in keys]
+    troubles_by_id = {}
+    for sdb, shard_ids in shards.group_by_id(ids):
+        troubles_by_id.update(
+            (t.id, t) for t in sdb.query(Trouble).filter(Trouble.id.in_(shard_ids), Trouble.deleted_at.is_(None)).all()
+        )
+    troubles = [troubles_by_id[i] for i in ids if i in troubles_by_id]
+    
+    return schemas.TroubleFeedResponse(
+        troubles=build_trouble_responses(db, shards, troubles),
+        next_cursor=encode_cursor(keys[-1]) if len(keys) == limit else None
+    )
+
+@router.get("/similar", response_model=List[schemas.SimilarTrouble])
+def get_similar_troubles(
+    project_id: int = Query(..., description="投稿先のプロジェクトID"),
+    title: str = Query(..., min_length=1, max_length=100),
+    description: str = Query("", max_length=1000),
+    current_user: User = Depends(get_current_user),
+    shards: ShardSessions = Depends(get_shards)
+):
+    """
+    投稿前のタイトル・説明文に類似する、同じプロジェクトのお困りごとを取得する
+    """
+    sdb = shards.for_project(project_id)
+    similar = similarity.find_similar(
+        sdb, project_id, similarity.compute_signature(title, description),
+        settings.TROUBLE_SIMILAR_LIMIT, settings.TROUBLE_SIMILARITY_THRESHOLD,
+    )
+    return [schemas.SimilarTrouble(id=s.trouble_id, title=s.title, similarity=s.similarity) for s in similar]
+
+@router.get("/duplicates", response_model=schemas.DuplicateReportResponse)
+def get_duplicate_report(
+    project_id: int = Query(..., description="対象のプロジェクトID"),
+    before_id: Optional[int] = Query(None, description="前のページの next_before_id"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    shards: ShardSessions = Depends(get_shards)
+):
+    """
+    プロジェクトの重複レポート（先に作成されたお困りごとに類似するお困りごと）を新しい順に取得する
+    limit はお困りごとの数で、1件のお困りごとに複数の類似お困りごとがある場合はすべて含める
+    """
+    sdb = shards.for_project(project_id)
+    query = sdb.query(TroubleDuplicate.trouble_id).filter(TroubleDuplicate.project_id == project_id)
+    if before_id is not None:
+        query = query.filter(TroubleDuplicate.trouble_id < before_id)
+    trouble_ids = [
+        trouble_id for (trouble_id,) in
+        query.group_by(TroubleDuplicate.trouble_id).order_by(TroubleDuplicate.trouble_id.desc()).limit(limit)
+    ]
+    
+    original = aliased(Trouble)
+    rows = (
+        sdb.query(TroubleDuplicate, Trouble.title, original.title)
+        .join(Trouble, Trouble.id == TroubleDuplicate.trouble_id)
+        .join(original, original.id == TroubleDuplicate.duplicate_of_id)
+        .filter(
+            TroubleDuplicate.trouble_id.in_(trouble_ids),
+            Trouble.deleted_at.is_(None),
+            original.deleted_at.is_(None),
+        )
+        .order_by(TroubleDuplicate.trouble_id.desc(), TroubleDuplicate.similarity.desc())
+        .all()
+    ) if trouble_ids else []
+    
+    return schemas.DuplicateReportResponse(
+        duplicates=[
+            schemas.DuplicateTrouble(
+                id=duplicate.trouble_id,
+                title=title,
+                duplicate_of_id=duplicate.duplicate_of_id,
+                duplicate_of_title=original_title,
+                similarity=duplicate.similarity,
+                detected_at=duplicate.detected_at,
+            )
+            for duplicate, title, original_title in rows
+        ],
+        next_before_id=trouble_ids[-1] if len(trouble_ids) == limit else None
+    )
+
 @router.get("/{trouble_id}", response_model=schemas.TroubleDetailResponse)
 def get_trouble_detail(
     trouble_id: int,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards)
 ):
-    # お困りごと取得
-    trouble = db.query(Trouble).filter(Trouble.id == trouble_id).first()
-    if not trouble:
+    sdb = shards.for_id(trouble_id)
+    if sdb is None:
         raise HTTPException(status_code=404, detail="お困りごとが見つかりません")
     
-    # プロジェクト情報取得
-    project = db.query(Project).filter(Project.id == trouble.project_id).first()
+    # 本体を読み込む前に、更新日時とコメント数だけを取得して ETag を計算する
+    # （プロジェクト名・作成者名の変更も反映されるよう、それぞれの更新日時も含める）
+    comments_count_subquery = (
+        select(func.count(Message.id)).where(Message.trouble_id == Trouble.id).scalar_subquery()
+        + archived_count_subquery(Trouble.id)
+    )
+    version = (
+        sdb.query(
+            Trouble.project_id,
+            Trouble.author_id,
+            Trouble.created_at,
+            Trouble.updated_at,
+            comments_count_subquery.label("comments_count"),
+        )
+        .filter(Trouble.id == trouble_id, Trouble.deleted_at.is_(None))
+        .first()
+    )
+    if not version:
+        raise HTTPException(status_code=404, detail="お困りごとが見つかりません")
     
-    # 作成者情報取得
-    author = db.query(User).filter(User.id == trouble.author_id).first()
+    # プロジェクト・作成者は既定のデータベースにあるため、シャードとは別に取得する（本体の作成にも使う）
+    project = cached(db.query(Project).filter(Project.project_id == version.project_id)).first()
+    author = cached(db.query(User).filter(User.user_id == version.author_id)).first()
+    project_updated_at = project.updated_at if project else None
+    author_updated_at = author.updated_at if author else None
     
-    # コメント数取得（メッセージとして扱う）
-    # comments_count = db.query(Message).filter(Message.trouble_id == trouble.id).count()
-    comments_count = 0  # 仮実装
+    etag = make_etag(
+        "trouble", trouble_id,
+        version.created_at, version.updated_at, project_updated_at, author_updated_at, version.comments_count
+    )
+    last_modified = max(
+        v for v in (version.created_at, version.updated_at, project_updated_at, author_updated_at)
+        if v is not None
+    )
+    not_modified = conditional_response(request, response, etag, last_modified)
+    if not_modified:
+        return not_modified
+    
+    # お困りごと取得
+    trouble = sdb.query(Trouble).filter(Trouble.id == trouble_id, Trouble.deleted_at.is_(None)).first()
+    if not trouble:
+        raise HTTPException(status_code=404, detail="お困りごとが見つかりません")
     
     return schemas.TroubleDetailResponse(
         id=trouble.id,
@@ -143,7 +377,7 @@ def get_trouble_detail(
         author_id=trouble.author_id,
         author=author.name if author else "Unknown User",
         created_at=trouble.created_at,
-        comments=comments_count,
+        comments=version.comments_count,
         # メッセージ機能が実装されていることを前提とする
         # messages=[]  # 必要に応じてメッセージ一覧を取得
     )
@@ -153,27 +387,48 @@ def update_trouble(
     trouble_id: int,
     trouble_update: schemas.TroubleUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards)
 ):
     # お困りごと取得
-    trouble = db.query(Trouble).filter(Trouble.id == trouble_id).first()
+    sdb = shards.for_id(trouble_id)
+    trouble = (
+        sdb.query(Trouble).filter(Trouble.id == trouble_id, Trouble.deleted_at.is_(None)).first()
+        if sdb is not None else None
+    )
     if not trouble:
         raise HTTPException(status_code=404, detail="お困りごとが見つかりません")
     
     # 作成者のみ更新可能
-    if trouble.author_id != current_user.id:
+    if trouble.author_id != current_user.user_id:
         raise HTTPException(status_code=403, detail="自分のお困りごとのみ更新できます")
     
     # 更新
+    previous_category = trouble.category
+    previous_title, previous_description = trouble.title, trouble.description
     trouble.title = trouble_update.title
     trouble.description = trouble_update.description
     trouble.category = trouble_update.category
     
-    db.commit()
-    db.refresh(trouble)
+    # タイトル・説明文が変わった場合は類似検出用のシグネチャを作り直す
+    if settings.TROUBLE_SIMILARITY_ENABLED and (
+        previous_title != trouble.title or previous_description != trouble.description
+    ):
+        similarity.reindex_trouble(sdb, trouble)
+    
+    payload = trouble_event_payload(trouble)
+    payload["previous_category"] = previous_category
+    record_change(sdb, TROUBLE, trouble.id, UPDATED, payload)
+    sdb.commit()
+    sdb.refresh(trouble)
+    
+    # カテゴリーが変わった場合はフィード用の新着インデックスを付け替える
+    if previous_category != trouble.category:
+        feed_index.remove(previous_category, trouble.id, trouble.created_at)
+        feed_index.add(trouble.category, trouble.id, trouble.created_at)
     
     # プロジェクト情報取得
-    project = db.query(Project).filter(Project.id == trouble.project_id).first()
+    project = cached(db.query(Project).filter(Project.project_id == trouble.project_id)).first()
     
     return schemas.TroubleResponse(
         id=trouble.id,
@@ -192,33 +447,35 @@ def update_trouble(
 def delete_trouble(
     trouble_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    shards: ShardSessions = Depends(get_shards)
 ):
     # お困りごと取得
-    trouble = db.query(Trouble).filter(Trouble.id == trouble_id).first()
+    sdb = shards.for_id(trouble_id)
+    trouble = (
+        sdb.query(Trouble).filter(Trouble.id == trouble_id, Trouble.deleted_at.is_(None)).first()
+        if sdb is not None else None
+    )
     if not trouble:
         raise HTTPException(status_code=404, detail="お困りごとが見つかりません")
     
     # 作成者のみ削除可能
-    if trouble.author_id != current_user.id:
+    if trouble.author_id != current_user.user_id:
         raise HTTPException(status_code=403, detail="自分のお困りごとのみ削除できます")
     
-    # 削除
-    db.delete(trouble)
-    db.commit()
+    # 削除（メッセージごとチャンク単位で削除し、長いスレッドは論理削除してバックグラウンドで削除する）
+    deletion.delete_trouble(sdb, trouble, trouble_event_payload(trouble))
     
     return None
 
 @router.get("/categories", response_model=List[str])
 def get_trouble_categories(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    shards: ShardSessions = Depends(get_shards)
 ):
-    # お困りごとのカテゴリー一覧を取得（重複を排除）
-    categories = db.query(Trouble.category).distinct().all()
-    
-    # 結果を文字列のリストに変換
-    category_list = [cat[0] for cat in categories]
+    # お困りごとのカテゴリー一覧を全シャードから取得（重複を排除）
+    category_list = list(dict.fromkeys(
+        cat[0] for sdb in shards.all() for cat in sdb.query(Trouble.category).distinct().all()
+    ))
     
     # もしカテゴリーがなければデフォルトのカテゴリーを返す
     if not category_list:
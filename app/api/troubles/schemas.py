@@ -1,8 +1,10 @@
-from pydantic import BaseModel, Field
+from pydantic import Field
 from datetime import datetime
 from typing import List, Optional
 
-class TroubleBase(BaseModel):
+from ...schemas.base import BaseSchemaModel
+
+class TroubleBase(BaseSchemaModel):
     title: str = Field(..., min_length=1, max_length=100, description="お困りごとのタイトル")
     description: str = Field(..., min_length=10, max_length=1000, description="お困りごとの詳細説明")
     category: str = Field(..., description="お困りごとのカテゴリー")
@@ -22,14 +24,36 @@ class TroubleResponse(TroubleBase):
     created_at: datetime
     comments: int = 0
 
-    class Config:
-        orm_mode = True
+class SimilarTrouble(BaseSchemaModel):
+    id: int
+    title: str
+    similarity: float = Field(..., description="類似度（タイトル・説明文の推定 Jaccard 係数）")
+
+class TroubleCreateResponse(TroubleResponse):
+    # 同じプロジェクトの類似お困りごと（重複投稿の可能性があるもの）
+    similar_troubles: List[SimilarTrouble] = []
+
+class DuplicateTrouble(BaseSchemaModel):
+    id: int
+    title: str
+    duplicate_of_id: int
+    duplicate_of_title: str
+    similarity: float
+    detected_at: Optional[datetime] = None
+
+class DuplicateReportResponse(BaseSchemaModel):
+    duplicates: List[DuplicateTrouble]
+    next_before_id: Optional[int] = None
 
 class TroubleDetailResponse(TroubleResponse):
     # メッセージ関連の情報を追加する場合
     # messages: List[MessageResponse] = []
     pass
 
-class TroublesListResponse(BaseModel):
+class TroublesListResponse(BaseSchemaModel):
+    troubles: List[TroubleResponse]
+    total: int
+
+class TroubleFeedResponse(BaseSchemaModel):
     troubles: List[TroubleResponse]
-    total: int
\ No newline at end of file
+    next_cursor: Optional[str] = None
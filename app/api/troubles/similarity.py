@@ -0,0 +1,366 @@
+"""
+類似お困りごとの検出（MinHash/LSH）
+
+- タイトルと説明文を正規化した文字 3-gram の集合から、64個のハッシュ関数による
+  MinHash シグネチャを作り trouble_signatures に保存する（お困りごとと同じシャード）
+- シグネチャを 4行ずつ 16バンドに分け、バンドごとのハッシュを trouble_lsh_buckets に保存する。
+  同じプロジェクトで1つでも同じバケットに入ったお困りごとを類似候補とし、
+  候補のシグネチャの一致率（推定 Jaccard 係数）が閾値以上のものを類似とする
+  （候補の検索はインデックスを使うため、お困りごとの件数が増えても数クエリで済む）
+- お困りごと作成時は、保存前に同じプロジェクトの類似お困りごとを検索して応答に含め、
+  その結果を重複レポート（trouble_duplicates）にも記録する
+- DuplicateReporter はシグネチャの無いお困りごと（導入前のデータ）のシグネチャを作成し、
+  未照合（更新されたお困りごとを含む）のシグネチャを照合して重複レポートを更新する
+"""
+import struct
+import unicodedata
+import zlib
+from datetime import datetime
+from random import Random
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import and_, delete, func, insert, or_, update
+from sqlalchemy.orm import Session
+
+from ...core.config import settings
+from ...core.database import shard_registry
+from ...services.periodic import PeriodicWorker
+from .models import Trouble, TroubleDuplicate, TroubleLshBucket, TroubleSignature
+
+SHINGLE_SIZE = 3
+BANDS = 16
+ROWS_PER_BAND = 4
+NUM_HASHES = BANDS * ROWS_PER_BAND
+
+# 候補として照合する最大件数（バケットの一致数が多い順）
+MAX_CANDIDATES = 50
+
+_MAX_HASH = (1 << 32) - 1
+_PRIME = (1 << 61) - 1
+# ハッシュ関数 (a * x + b) mod p の係数（保存済みのシグネチャと互換性を保つため固定のシードで生成する）
+_rng = Random(20240601)
+_COEFFICIENTS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_HASHES)]
+
+_SIGNATURE_FORMAT = f"<{NUM_HASHES}I"
+
+signatures_table = TroubleSignature.__table__
+buckets_table = TroubleLshBucket.__table__
+duplicates_table = TroubleDuplicate.__table__
+
+Signature = Tuple[int, ...]
+
+
+class SimilarTrouble(NamedTuple):
+    trouble_id: int
+    title: str
+    similarity: float
+
+
+# ───────── シグネチャ ─────────
+def normalize_text(text: str) -> str:
+    """全角・半角と大文字・小文字を揃え、空白と記号を除く"""
+    return "".join(ch for ch in unicodedata.normalize("NFKC", text).lower() if ch.isalnum())
+
+
+def shingles(text: str) -> Set[str]:
+    normalized = normalize_text(text)
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def compute_signature(title: str, description: str) -> Signature:
+    """タイトルと説明文の MinHash シグネチャ"""
+    hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(f"{title} {description}")]
+    if not hashes:
+        return (_MAX_HASH,) * NUM_HASHES
+    return tuple(
+        min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _COEFFICIENTS
+    )
+
+
+def band_buckets(signature: Signature) -> List[Tuple[int, int]]:
+    """シグネチャをバンドに分け、(バンド番号, バケット) のリストにする"""
+    return [
+        (band, zlib.crc32(struct.pack(f"<H{ROWS_PER_BAND}I", band, *signature[start:start + ROWS_PER_BAND])))
+        for band, start in enumerate(range(0, NUM_HASHES, ROWS_PER_BAND))
+    ]
+
+
+def estimate_similarity(a: Signature, b: Signature) -> float:
+    """シグネチャの一致率（Jaccard 係数の推定値）"""
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_HASHES
+
+
+def pack_signature(signature: Signature) -> bytes:
+    return struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def unpack_signature(data: bytes) -> Signature:
+    return struct.unpack(_SIGNATURE_FORMAT, data)
+
+
+# ───────── 検索 ─────────
+def find_similar(
+    db: Session,
+    project_id: int,
+    signature: Signature,
+    limit: int,
+    threshold: float,
+    before_id: Optional[int] = None,
+) -> List[SimilarTrouble]:
+    """
+    同じプロジェクトの類似お困りごとを類似度の高い順に返す（論理削除済みは除く）
+
+    :param db: プロジェクトのシャードのセッション
+    :param before_id: 指定した場合はこの ID より前に作成されたお困りごとだけを対象にする
+    """
+    query = (
+        db.query(TroubleLshBucket.trouble_id)
+        .filter(
+            TroubleLshBucket.project_id == project_id,
+            or_(*[
+                and_(TroubleLshBucket.band == band, TroubleLshBucket.bucket == bucket)
+                for band, bucket in band_buckets(signature)
+            ]),
+        )
+    )
+    if before_id is not None:
+        query = query.filter(TroubleLshBucket.trouble_id < before_id)
+    candidate_ids = [
+        trouble_id for (trouble_id,) in
+        query.group_by(TroubleLshBucket.trouble_id)
+        .order_by(func.count().desc(), TroubleLshBucket.trouble_id.desc())
+        .limit(MAX_CANDIDATES)
+    ]
+    if not candidate_ids:
+        return []
+
+    similar = []
+    for trouble_id, data, title in (
+        db.query(TroubleSignature.trouble_id, TroubleSignature.signature, Trouble.title)
+        .join(Trouble, Trouble.id == TroubleSignature.trouble_id)
+        .filter(TroubleSignature.trouble_id.in_(candidate_ids), Trouble.deleted_at.is_(None))
+    ):
+        similarity = estimate_similarity(signature, unpack_signature(data))
+        if similarity >= threshold:
+            similar.append(SimilarTrouble(trouble_id, title, similarity))
+    similar.sort(key=lambda s: (-s.similarity, -s.trouble_id))
+    return similar[:limit]
+
+
+# ───────── 保存 ─────────
+def save_signature(
+    db: Session,
+    trouble_id: int,
+    project_id: int,
+    signature: Signature,
+    checked: bool = False,
+    replace: bool = False,
+) -> None:
+    """
+    シグネチャとバケットを保存する（コミットは呼び出し元で行う）
+
+    :param checked: 重複レポートを記録済みの場合は True（未照合なら DuplicateReporter が照合する）
+    :param replace: 既存のシグネチャを置き換える場合は True
+    """
+    if replace:
+        db.execute(delete(buckets_table).where(buckets_table.c.trouble_id == trouble_id))
+        db.execute(delete(signatures_table).where(signatures_table.c.trouble_id == trouble_id))
+    db.execute(insert(signatures_table).values(
+        trouble_id=trouble_id,
+        project_id=project_id,
+        signature=pack_signature(signature),
+        checked_at=datetime.utcnow() if checked else None,
+    ))
+    db.execute(insert(buckets_table), [
+        {"project_id": project_id, "band": band, "bucket": bucket, "trouble_id": trouble_id}
+        for band, bucket in band_buckets(signature)
+    ])
+
+
+def record_duplicates(db: Session, trouble_id: int, project_id: int, similar: Iterable[SimilarTrouble]) -> None:
+    """お困りごとの重複レポートを置き換える（コミットは呼び出し元で行う）"""
+    db.execute(delete(duplicates_table).where(duplicates_table.c.trouble_id == trouble_id))
+    rows = [
+        {"trouble_id": trouble_id, "duplicate_of_id": s.trouble_id, "project_id": project_id, "similarity": s.similarity}
+        for s in similar
+    ]
+    if rows:
+        db.execute(insert(duplicates_table), rows)
+
+
+def index_new_trouble(db: Session, trouble: Trouble, signature: Signature) -> List[SimilarTrouble]:
+    """
+    作成したお困りごとのシグネチャを保存し、類似お困りごとを返す（コミットは呼び出し元で行う）
+    お困りごとの flush 後、コミット前に呼ぶ
+    """
+    similar = find_similar(
+        db, trouble.project_id, signature,
+        settings.TROUBLE_SIMILAR_LIMIT, settings.TROUBLE_SIMILARITY_THRESHOLD,
+        before_id=trouble.id,
+    )
+    save_signature(db, trouble.id, trouble.project_id, signature, checked=True)
+    record_duplicates(db, trouble.id, trouble.project_id, similar)
+    return similar
+
+
+def reindex_trouble(db: Session, trouble: Trouble) -> None:
+    """
+    タイトル・説明文を更新したお困りごとのシグネチャを作り直す（コミットは呼び出し元で行う）
+    このお困りごとが関わる重複レポートは DuplicateReporter が照合し直す
+    """
+    signature = compute_signature(trouble.title, trouble.description)
+    save_signature(db, trouble.id, trouble.project_id, signature, replace=True)
+    referrers = [
+        trouble_id for (trouble_id,) in
+        db.query(TroubleDuplicate.trouble_id).filter(TroubleDuplicate.duplicate_of_id == trouble.id)
+    ]
+    if referrers:
+        db.execute(
+            update(signatures_table)
+            .where(signatures_table.c.trouble_id.in_(referrers))
+            .values(checked_at=None)
+        )
+    delete_similarity_data(db, trouble.id, keep_signature=True)
+
+
+def delete_similarity_data(db: Session, trouble_id: int, keep_signature: bool = False) -> None:
+    """お困りごとのシグネチャ・バケット・重複レポートを削除する（お困りごと本体の削除前に呼ぶ）"""
+    db.execute(delete(duplicates_table).where(or_(
+        duplicates_table.c.trouble_id == trouble_id,
+        duplicates_table.c.duplicate_of_id == trouble_id,
+    )))
+    if not keep_signature:
+        db.execute(delete(buckets_table).where(buckets_table.c.trouble_id == trouble_id))
+        db.execute(delete(signatures_table).where(signatures_table.c.trouble_id == trouble_id))
+
+
+# ───────── 重複レポート ─────────
+def backfill_signatures(db: Session, batch_size: int) -> int:
+    """
+    シグネチャの無いお困りごとのシグネチャを最大 batch_size 件作成する（照合は check_signatures で行う）
+
+    :return: 作成したシグネチャの数
+    """
+    troubles = (
+        db.query(Trouble.id, Trouble.project_id, Trouble.title, Trouble.description)
+        .outerjoin(TroubleSignature, TroubleSignature.trouble_id == Trouble.id)
+        .filter(TroubleSignature.trouble_id.is_(None), Trouble.deleted_at.is_(None))
+        .order_by(Trouble.id)
+        .limit(batch_size)
+        .all()
+    )
+    for trouble_id, project_id, title, description in troubles:
+        save_signature(db, trouble_id, project_id, compute_signature(title, description))
+    db.commit()
+    return len(troubles)
+
+
+def check_signatures(db: Session, batch_size: int) -> int:
+    """
+    未照合のシグネチャを最大 batch_size 件照合し、先に作成された類似お困りごとを重複レポートに記録する
+    後から作成された類似お困りごとが照合済みでこのお困りごとを記録していない場合
+    （シグネチャを後から作成した既存データ・更新されたお困りごと）は、そちらを未照合に戻す
+
+    :return: 照合したシグネチャの数
+    """
+    pending = (
+        db.query(TroubleSignature.trouble_id, TroubleSignature.project_id, TroubleSignature.signature)
+        .filter(TroubleSignature.checked_at.is_(None))
+        .order_by(TroubleSignature.trouble_id)
+        .limit(batch_size)
+        .all()
+    )
+    pending_ids = {trouble_id for trouble_id, _, _ in pending}
+    recheck: Set[int] = set()
+    for trouble_id, project_id, data in pending:
+        similar = find_similar(
+            db, project_id, unpack_signature(data),
+            MAX_CANDIDATES, settings.TROUBLE_SIMILARITY_THRESHOLD,
+        )
+        older = [s for s in similar if s.trouble_id < trouble_id]
+        record_duplicates(db, trouble_id, project_id, older[:settings.TROUBLE_SIMILAR_LIMIT])
+
+        # 同じバッチで後から照合するものは、記録済みのこのお困りごとを見つけるため除く
+        newer = [s.trouble_id for s in similar if s.trouble_id > trouble_id and s.trouble_id not in pending_ids]
+        if newer:
+            recorded = {
+                newer_id for (newer_id,) in
+                db.query(TroubleDuplicate.trouble_id)
+                .filter(TroubleDuplicate.trouble_id.in_(newer), TroubleDuplicate.duplicate_of_id == trouble_id)
+            }
+            recheck.update(newer_id for newer_id in newer if newer_id not in recorded)
+    if pending:
+        db.execute(
+            update(signatures_table)
+            .where(signatures_table.c.trouble_id.in_(pending_ids))
+            .values(checked_at=datetime.utcnow())
+        )
+    if recheck:
+        db.execute(
+            update(signatures_table)
+            .where(signatures_table.c.trouble_id.in_(recheck))
+            .values(checked_at=None)
+        )
+    db.commit()
+    return len(pending)
+
+
+class DuplicateReporter(PeriodicWorker):
+    """シグネチャの作成と重複レポートの更新を全シャードについて定期的に行う"""
+
+    def __init__(
+        self,
+        interval: float = 600.0,
+        batch_size: int = 500,
+        session_factories: Optional[Dict[str, Callable[[], Session]]] = None,
+    ):
+        super().__init__("trouble-duplicate-reporter", interval, run_on_start=True)
+        self._batch_size = batch_size
+        # シャード名 -> セッションファクトリー（未指定の場合は登録済みの全シャード）
+        self._session_factories = session_factories or shard_registry.session_factories()
+
+    def run_once(self) -> None:
+        self.report_pending()
+
+    def report_pending(self) -> int:
+        """
+        全シャードのシグネチャの無いお困りごと・未照合のシグネチャをすべて処理する
+
+        :return: 照合したお困りごとの数
+        """
+        checked = 0
+        for session_factory in self._session_factories.values():
+            if self.stopping:
+                break
+            checked += self._report_shard(session_factory)
+        return checked
+
+    def _report_shard(self, session_factory: Callable[[], Session]) -> int:
+        db = session_factory()
+        try:
+            while not self.stopping and backfill_signatures(db, self._batch_size) == self._batch_size:
+                pass
+            checked = 0
+            while not self.stopping:
+                # 照合で未照合に戻ったお困りごとがあるため、未照合が無くなるまで繰り返す
+                count = check_signatures(db, self._batch_size)
+                checked += count
+                if count == 0:
+                    break
+            return checked
+        except Exception as e:
+            print(f"重複レポートの作成エラー: {str(e)}")
+            db.rollback()
+            return 0
+        finally:
+            db.close()
+
+
+# アプリ全体で共有する重複レポート処理
+duplicate_reporter = DuplicateReporter(
+    interval=settings.TROUBLE_DUPLICATE_REPORT_INTERVAL_SECONDS,
+    batch_size=settings.TROUBLE_DUPLICATE_REPORT_BATCH_SIZE,
+)
@@ -12,7 +12,7 @@ class User(Base):
     name = Column(String, unique=True, index=True, nullable=False)
     password = Column(String, nullable=False)  # hashed_password ではなく password
     categories = Column(String, nullable=True)
-    point_total = Column(Integer, default=0)  # 統一して point_total を使用
+    point_total = Column(Integer, default=0, index=True)  # 統一して point_total を使用（ランキング用にインデックス）
     last_login_at = Column(DateTime, nullable=True)  # nullable=True に変更
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -23,10 +23,10 @@ def get_current_user_info(
     
     # レスポンスを構築
     return {
-        "id": current_user.id,
+        "id": current_user.user_id,
         "name": current_user.name,
         "categories": categories,
-        "points": current_user.points,
+        "points": current_user.get_points(),
         "created_at": current_user.created_at
     }
 
@@ -76,7 +76,7 @@ def update_user_info(
         "id": current_user.user_id,
         "name": current_user.name,
         "categories": categories,
-        "points": current_user.points,
+        "points": current_user.get_points(),
         "created_at": current_user.created_at
     }
 
@@ -1,6 +1,6 @@
 from typing import List, Optional
 from datetime import datetime
-from pydantic import BaseModel, Field
+from pydantic import Field
 
 # 相対インポートに変更
 from ...schemas.base import BaseSchemaModel
@@ -24,9 +24,13 @@ class UserResponse(UserBase):
     categories: List[str]
     points: int = 0
     created_at: datetime
-    
-    class Config:
-        from_attributes = True
+
+class UserSummary(BaseSchemaModel):
+    """他のユーザーから参照される公開情報"""
+    id: int
+    name: str
+    categories: List[str] = []
+    points: int = 0
 
 class UserLogin(BaseSchemaModel):
     name: str
@@ -35,8 +39,15 @@ class UserLogin(BaseSchemaModel):
 class Token(BaseSchemaModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: Optional[str] = None
     user_id: int
     user_name: str
 
+class RefreshTokenRequest(BaseSchemaModel):
+    refresh_token: str = Field(..., description="リフレッシュトークン")
+
+class LogoutRequest(BaseSchemaModel):
+    refresh_token: Optional[str] = Field(None, description="同時に失効させるリフレッシュトークン")
+
 class TokenData(BaseSchemaModel):
     user_id: Optional[int] = None
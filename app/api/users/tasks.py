@@ -0,0 +1,41 @@
+from datetime import datetime
+from typing import Any, Dict, Hashable
+
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.orm import Session
+
+from ...services.write_behind import write_behind, merge_max, merge_sum
+from .models import User
+
+# write-behind キューで扱う書き込み種別
+LAST_LOGIN = "users.last_login"
+POINT_INCREMENT = "users.point_increment"
+
+users_table = User.__table__
+
+def apply_last_login(db: Session, items: Dict[Hashable, Any]) -> None:
+    """最終ログイン時刻をまとめて更新する（キー: user_id, 値: ISO形式の時刻）"""
+    db.execute(
+        update(users_table)
+        .where(users_table.c.user_id == bindparam("b_user_id"))
+        .values(last_login_at=bindparam("b_last_login_at")),
+        [
+            {"b_user_id": user_id, "b_last_login_at": datetime.fromisoformat(logged_in_at)}
+            for user_id, logged_in_at in items.items()
+        ],
+    )
+
+def apply_point_increments(db: Session, items: Dict[Hashable, Any]) -> None:
+    """ポイントの加算をまとめて反映する（キー: user_id, 値: 加算するポイント）"""
+    db.execute(
+        update(users_table)
+        .where(users_table.c.user_id == bindparam("b_user_id"))
+        .values(point_total=func.coalesce(users_table.c.point_total, 0) + bindparam("b_delta")),
+        [
+            {"b_user_id": user_id, "b_delta": delta}
+            for user_id, delta in items.items()
+        ],
+    )
+
+write_behind.register(LAST_LOGIN, apply_last_login, merge=merge_max)
+write_behind.register(POINT_INCREMENT, apply_point_increments, merge=merge_sum)
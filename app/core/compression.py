@@ -0,0 +1,310 @@
+# app/core/compression.py
+"""
+レスポンス圧縮ミドルウェア（ASGI）
+
+- Accept-Encoding に応じて brotli / zstd / gzip を選択する
+  （brotli・zstandard パッケージは任意依存。未インストールの場合は gzip のみ）
+- 最小サイズ未満のレスポンス、許可リストにない Content-Type、圧縮済みのレスポンスは対象外
+- ストリーミングレスポンス（more_body=True）はチャンクごとに逐次圧縮する
+- ETag 付きのレスポンスは圧縮結果を (パス, ETag, 方式) 単位でキャッシュし、再圧縮を省く
+- ルートごとに圧縮前後のバイト数と圧縮にかかった時間を集計する（get_compression_stats）
+"""
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 圧縮対象の Content-Type（前方一致）
+COMPRESSIBLE_CONTENT_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+
+
+# ───────── 圧縮方式 ─────────
+def _gzip_compressor():
+    return zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+class _StreamCompressor:
+    """方式ごとの差異を吸収する逐次圧縮器"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        elif encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compressobj()
+        else:
+            self._compressor = _gzip_compressor()
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            # flush しないとチャンクが手元に溜まり続けるため、チャンクごとに出力させる
+            return self._compressor.process(data) + self._compressor.flush()
+        if self.encoding == "zstd":
+            return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    """レスポンス本体を一括で圧縮する"""
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compress(body)
+    compressor = _gzip_compressor()
+    return compressor.compress(body) + compressor.flush()
+
+
+def available_encodings() -> List[str]:
+    """利用可能な圧縮方式（優先順）"""
+    encodings = []
+    if brotli is not None:
+        encodings.append("br")
+    if zstandard is not None:
+        encodings.append("zstd")
+    encodings.append("gzip")
+    return encodings
+
+
+def choose_encoding(accept_encoding: str, encodings: List[str]) -> Optional[str]:
+    """
+    Accept-Encoding から使用する圧縮方式を選ぶ
+    q 値が最も高いものを選び、同値の場合はサーバー側の優先順に従う
+    """
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+# ───────── 圧縮済みレスポンスのキャッシュ ─────────
+class CompressedBodyCache:
+    """圧縮済みの本体を保持する LRU キャッシュ（合計バイト数で上限を設ける）"""
+
+    def __init__(self, max_bytes: int):
+        self._max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str, str], bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key: Tuple[str, str, str], body: bytes) -> None:
+        if len(body) > self._max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+# ───────── 統計 ─────────
+_stats: Dict[str, Dict[str, float]] = {}
+_stats_lock = threading.Lock()
+
+
+def _record(route: str, encoding: str, bytes_in: int, bytes_out: int, seconds: float, cache_hit: bool) -> None:
+    with _stats_lock:
+        stats = _stats.setdefault(f"{route} [{encoding}]", {
+            "responses": 0, "cache_hits": 0, "bytes_in": 0, "bytes_out": 0, "compress_seconds": 0.0,
+        })
+        stats["responses"] += 1
+        stats["cache_hits"] += int(cache_hit)
+        stats["bytes_in"] += bytes_in
+        stats["bytes_out"] += bytes_out
+        stats["compress_seconds"] += seconds
+
+
+def get_compression_stats() -> Dict[str, Dict[str, float]]:
+    """ルート・方式ごとの圧縮統計（削減バイト数と CPU 時間の比較用）"""
+    with _stats_lock:
+        result = {}
+        for key, stats in _stats.items():
+            entry = dict(stats)
+            entry["ratio"] = stats["bytes_out"] / stats["bytes_in"] if stats["bytes_in"] else 1.0
+            entry["saved_bytes_per_ms"] = (
+                (stats["bytes_in"] - stats["bytes_out"]) / (stats["compress_seconds"] * 1000)
+                if stats["compress_seconds"] else 0.0
+            )
+            result[key] = entry
+        return result
+
+
+# ───────── ミドルウェア ─────────
+class CompressionMiddleware:
+    """レスポンス圧縮ミドルウェア"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, cache_max_bytes: int = 16 * 1024 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = available_encodings()
+        self.cache = CompressedBodyCache(cache_max_bytes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, scope, send, encoding)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """1リクエスト分の送信処理をフックして圧縮する"""
+
+    def __init__(self, middleware: CompressionMiddleware, scope: Scope, send: Send, encoding: str):
+        self.middleware = middleware
+        self.scope = scope
+        self.downstream: Send = send
+        self.encoding = encoding
+        self.start_message: Optional[Message] = None
+        self.compressor: Optional[_StreamCompressor] = None
+        self.passthrough = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    def _route(self) -> str:
+        route = self.scope.get("route")
+        return getattr(route, "path", self.scope.get("path", ""))
+
+    def _is_compressible(self, headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        return content_type.startswith(COMPRESSIBLE_CONTENT_TYPES)
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            status_code = message["status"]
+            headers = Headers(raw=message["headers"])
+            if status_code < 200 or status_code in (204, 304) or not self._is_compressible(headers):
+                self.passthrough = True
+                await self.downstream(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        headers = MutableHeaders(raw=self.start_message["headers"])
+
+        if self.compressor is None and not more_body:
+            await self._send_whole(headers, body)
+            return
+
+        # ストリーミングレスポンスはチャンクごとに逐次圧縮する
+        if self.compressor is None:
+            self.compressor = _StreamCompressor(self.encoding)
+            self._set_encoding_headers(headers)
+            del headers["content-length"]
+            await self.downstream(self.start_message)
+
+        started = time.perf_counter()
+        chunk = self.compressor.compress(body)
+        if not more_body:
+            chunk += self.compressor.finish()
+        self.seconds += time.perf_counter() - started
+        self.bytes_in += len(body)
+        self.bytes_out += len(chunk)
+        await self.downstream({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        if not more_body:
+            _record(self._route(), self.encoding, self.bytes_in, self.bytes_out, self.seconds, False)
+
+    async def _send_whole(self, headers: MutableHeaders, body: bytes) -> None:
+        if len(body) < self.middleware.minimum_size:
+            await self.downstream(self.start_message)
+            await self.downstream({"type": "http.response.body", "body": body})
+            return
+
+        # ETag 付きのレスポンスは内容が ETag で一意に決まるため、圧縮結果を再利用する
+        etag = headers.get("etag")
+        request_target = self.scope.get("path", "") + "?" + self.scope.get("query_string", b"").decode("latin-1")
+        cache_key = (request_target, etag, self.encoding) if etag else None
+        compressed = self.middleware.cache.get(cache_key) if cache_key else None
+        cache_hit = compressed is not None
+
+        started = time.perf_counter()
+        if compressed is None:
+            compressed = compress_body(body, self.encoding)
+            if cache_key:
+                self.middleware.cache.put(cache_key, compressed)
+        seconds = time.perf_counter() - started
+
+        if len(compressed) >= len(body):
+            # 圧縮しても小さくならない場合はそのまま返す
+            await self.downstream(self.start_message)
+            await self.downstream({"type": "http.response.body", "body": body})
+            return
+
+        self._set_encoding_headers(headers)
+        headers["Content-Length"] = str(len(compressed))
+        await self.downstream(self.start_message)
+        await self.downstream({"type": "http.response.body", "body": compressed})
+        _record(self._route(), self.encoding, len(body), len(compressed), seconds, cache_hit)
+
+    def _set_encoding_headers(self, headers: MutableHeaders) -> None:
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
@@ -1,15 +1,27 @@
 # app/core/config.py
 from pydantic_settings import BaseSettings
 import os
+from urllib.parse import quote_plus
 from dotenv import load_dotenv
 
 # 環境変数の読み込み
 load_dotenv()
 
+# プロジェクトルート（同梱の SSL 証明書の既定パスに使用）
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 class Settings(BaseSettings):
     # プロジェクト設定
     PROJECT_NAME: str = os.getenv("PROJECT_NAME", "CollaboGames")
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
+    # 登録するルーター（カンマ区切りの名前: auth,users,projects,troubles,messages,points,batch,notifications,analytics）
+    # 未指定の場合はすべて。指定しなかったルーターのモジュールはインポートしない
+    API_ROUTERS: str = os.getenv("API_ROUTERS", "")
+
+    # プロファイリング設定（DEBUG=True のときのみ有効。X-Debug-Profile ヘッダー付きのリクエストを記録する）
+    PROFILING_SAMPLE_INTERVAL_MS: float = float(os.getenv("PROFILING_SAMPLE_INTERVAL_MS", 1.0))
+    PROFILING_MAX_REPORTS: int = int(os.getenv("PROFILING_MAX_REPORTS", 20))  # メモリ上に保持するレポート数
+    PROFILING_TOKEN: str = os.getenv("PROFILING_TOKEN", "")  # 設定した場合はヘッダーの値と一致するときだけ記録し、/debug/profiles の参照にも要求する
 
     # Azure MySQL設定
     AZURE_MYSQL_HOST: str = os.getenv("AZURE_MYSQL_HOST", "")
@@ -18,26 +30,178 @@ class Settings(BaseSettings):
     AZURE_MYSQL_DATABASE: str = os.getenv("AZURE_MYSQL_DATABASE", "")
     AZURE_MYSQL_PORT: str = os.getenv("AZURE_MYSQL_PORT", "3306")
     AZURE_MYSQL_SSL_MODE: str = os.getenv("AZURE_MYSQL_SSL_MODE", "")
+    # SSL の CA 証明書（未指定の場合はリポジトリ同梱の DigiCert 証明書を使う）
+    AZURE_MYSQL_SSL_CA: str = os.getenv("AZURE_MYSQL_SSL_CA", os.path.join(PROJECT_ROOT, "DigiCertGlobalRootCA.crt .pem"))
     USE_AZURE: bool = os.getenv("USE_AZURE", "False").lower() == "true"
     
     # データベース設定
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./test.db")
 
+    # MySQL ドライバー・接続設定
+    MYSQL_DRIVER: str = os.getenv("MYSQL_DRIVER", "pymysql")  # pymysql / mysqldb（mysqlclient）
+    DB_CHARSET: str = os.getenv("DB_CHARSET", "utf8mb4")
+    DB_ISOLATION_LEVEL: str = os.getenv("DB_ISOLATION_LEVEL", "")  # 例: READ COMMITTED（空文字の場合はサーバーの既定値のまま）
+    DB_SESSION_TIME_ZONE: str = os.getenv("DB_SESSION_TIME_ZONE", "+00:00")  # NOW() などを UTC に揃える（空文字の場合は設定しない）
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 0))  # 0 の場合はコネクションプールを使わない（NullPool）
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_RECYCLE_SECONDS: int = int(os.getenv("DB_POOL_RECYCLE_SECONDS", 1800))  # サーバー側のアイドル切断より短くする
+    DB_COMPILED_CACHE_SIZE: int = int(os.getenv("DB_COMPILED_CACHE_SIZE", 1200))  # コンパイル済みSQLのキャッシュ件数
+    DB_CONNECT_TIMEOUT_SECONDS: int = int(os.getenv("DB_CONNECT_TIMEOUT_SECONDS", 5))
+    DB_READ_TIMEOUT_SECONDS: int = int(os.getenv("DB_READ_TIMEOUT_SECONDS", 30))  # 応答待ちの上限（ネットワーク断などで無期限に待たない）
+    DB_WRITE_TIMEOUT_SECONDS: int = int(os.getenv("DB_WRITE_TIMEOUT_SECONDS", 30))
+    DB_STATEMENT_TIMEOUT_MS: int = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 10000))  # SELECT の実行時間の上限（MySQL の max_execution_time。0 の場合は無制限）
+    DB_POOL_TIMEOUT_SECONDS: float = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", 5))  # プールの接続が空くのを待つ上限
+
+    # サーキットブレーカー設定（直近の SQL のエラー率・遅延率がしきい値を超えたら、一定時間 DB を使うリクエストに 503 を返す）
+    DB_BREAKER_ENABLED: bool = os.getenv("DB_BREAKER_ENABLED", "True").lower() == "true"
+    DB_BREAKER_WINDOW_SIZE: int = int(os.getenv("DB_BREAKER_WINDOW_SIZE", 50))  # 判定に使う直近の SQL の数
+    DB_BREAKER_MIN_CALLS: int = int(os.getenv("DB_BREAKER_MIN_CALLS", 10))  # この数に満たない間は判定しない
+    DB_BREAKER_FAILURE_RATE: float = float(os.getenv("DB_BREAKER_FAILURE_RATE", 0.5))
+    DB_BREAKER_SLOW_CALL_SECONDS: float = float(os.getenv("DB_BREAKER_SLOW_CALL_SECONDS", 2.0))  # これ以上かかった SQL を遅いとみなす
+    DB_BREAKER_SLOW_CALL_RATE: float = float(os.getenv("DB_BREAKER_SLOW_CALL_RATE", 0.8))
+    DB_BREAKER_OPEN_SECONDS: float = float(os.getenv("DB_BREAKER_OPEN_SECONDS", 30))  # 開いてから試行を再開するまでの時間
+    # ブレーカーが開いている間・DB エラー時に前回の応答を返す参照系の GET のパス（カンマ区切り）
+    DB_STALE_PATHS: str = os.getenv(
+        "DB_STALE_PATHS", "/api/projects/,/api/projects/browse,/api/projects/categories,/api/troubles/,/api/troubles/feed"
+    )
+    DB_STALE_MAX_AGE_SECONDS: float = float(os.getenv("DB_STALE_MAX_AGE_SECONDS", 3600))  # これより古い応答は返さない
+    DB_STALE_MAX_ENTRIES: int = int(os.getenv("DB_STALE_MAX_ENTRIES", 1000))
+    DB_STALE_MAX_BYTES: int = int(os.getenv("DB_STALE_MAX_BYTES", 32 * 1024 * 1024))  # 保持する応答の本体の合計バイト数の上限
+
+    # シャーディング設定（お困りごと・メッセージをプロジェクト単位で別のデータベースに保存する）
+    # "名前=URL" をカンマ区切りで指定する（例: "shard1=mysql+pymysql://...,shard2=sqlite:///./shard2.db"）
+    # 並び順がシャード番号（1 から）になり、ID の採番範囲が決まるため、追加は末尾にのみ行うこと
+    SHARD_DATABASE_URLS: str = os.getenv("SHARD_DATABASE_URLS", "")
+    # 新規プロジェクトの配置先（カンマ区切りのシャード名。プロジェクトIDで振り分ける。空の場合は既定のデータベース）
+    SHARD_NEW_PROJECTS: str = os.getenv("SHARD_NEW_PROJECTS", "")
+
     # セキュリティ設定
     SECRET_KEY: str = os.getenv("SECRET_KEY", "fallback_secret_key_please_change_in_production")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+    # 他のプロセスで失効させたトークンをデナイリストに取り込む間隔（取り込むまでは他のプロセスで使用できる）
+    TOKEN_REVOCATION_SYNC_INTERVAL_SECONDS: float = float(os.getenv("TOKEN_REVOCATION_SYNC_INTERVAL_SECONDS", 5.0))
 
     # CORS設定
     ALLOWED_HOSTS: list = ["*"]
 
+    # レート制限設定（トークンバケット）
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "True").lower() == "true"
+    RATE_LIMIT_CAPACITY: int = int(os.getenv("RATE_LIMIT_CAPACITY", 60))  # バケット容量（バースト許容量）
+    RATE_LIMIT_REFILL_PER_SECOND: float = float(os.getenv("RATE_LIMIT_REFILL_PER_SECOND", 1.0))  # 1秒あたりの補充量
+    RATE_LIMIT_MAX_CONCURRENCY: int = int(os.getenv("RATE_LIMIT_MAX_CONCURRENCY", 8))  # ユーザー単位の同時実行数上限
+    RATE_LIMIT_MAX_KEYS: int = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))  # メモリ上に保持するキー数の目安
+
+    # バックグラウンド書き込み（write-behind）設定
+    WRITE_BEHIND_ENABLED: bool = os.getenv("WRITE_BEHIND_ENABLED", "True").lower() == "true"
+    WRITE_BEHIND_SPOOL_PATH: str = os.getenv("WRITE_BEHIND_SPOOL_PATH", "./write_behind_spool.db")  # 未反映の書き込みを保持するSQLiteファイル（プロセスごとに拡張子の前へプロセスIDを付ける）
+    WRITE_BEHIND_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL_SECONDS", 2.0))
+    WRITE_BEHIND_BATCH_SIZE: int = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 500))
+    WRITE_BEHIND_MAX_PENDING: int = int(os.getenv("WRITE_BEHIND_MAX_PENDING", 10000))  # 保留できるキー数の上限
+    WRITE_BEHIND_MAX_RETRIES: int = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", 5))
+
+    # パーソナライズフィード設定
+    FEED_INDEX_DEPTH: int = int(os.getenv("FEED_INDEX_DEPTH", 500))  # カテゴリーごとにメモリ上に保持する件数
+    FEED_INDEX_TTL_SECONDS: float = float(os.getenv("FEED_INDEX_TTL_SECONDS", 300))  # 他プロセスでの更新を取り込むための再読み込み間隔
+
+    # HTTPキャッシュ設定（認証不要な詳細系レスポンスの Cache-Control）
+    HTTP_CACHE_MAX_AGE: int = int(os.getenv("HTTP_CACHE_MAX_AGE", 60))
+    HTTP_CACHE_STALE_WHILE_REVALIDATE: int = int(os.getenv("HTTP_CACHE_STALE_WHILE_REVALIDATE", 300))
+
+    # レスポンス圧縮設定
+    COMPRESSION_ENABLED: bool = os.getenv("COMPRESSION_ENABLED", "True").lower() == "true"
+    COMPRESSION_MIN_SIZE: int = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))  # これより小さいレスポンスは圧縮しない（バイト）
+    COMPRESSION_GZIP_LEVEL: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+    COMPRESSION_BROTLI_QUALITY: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+    COMPRESSION_ZSTD_LEVEL: int = int(os.getenv("COMPRESSION_ZSTD_LEVEL", 3))
+    COMPRESSION_CACHE_MAX_BYTES: int = int(os.getenv("COMPRESSION_CACHE_MAX_BYTES", 16 * 1024 * 1024))  # 圧縮済みレスポンスのキャッシュ上限
+
+    # クエリ結果キャッシュ設定（主キー検索などの小さな参照クエリ用）
+    QUERY_CACHE_ENABLED: bool = os.getenv("QUERY_CACHE_ENABLED", "True").lower() == "true"
+    QUERY_CACHE_MAX_BYTES: int = int(os.getenv("QUERY_CACHE_MAX_BYTES", 8 * 1024 * 1024))  # キャッシュ全体の上限（バイト）
+    QUERY_CACHE_MAX_ENTRY_BYTES: int = int(os.getenv("QUERY_CACHE_MAX_ENTRY_BYTES", 64 * 1024))  # これより大きい結果はキャッシュしない
+    QUERY_CACHE_TTL_SECONDS: float = float(os.getenv("QUERY_CACHE_TTL_SECONDS", 30))  # 他プロセスでの更新を取り込むための有効期限
+
+    # 変更イベント（アウトボックス）配信設定
+    OUTBOX_DISPATCH_ENABLED: bool = os.getenv("OUTBOX_DISPATCH_ENABLED", "True").lower() == "true"
+    OUTBOX_POLL_INTERVAL_SECONDS: float = float(os.getenv("OUTBOX_POLL_INTERVAL_SECONDS", 1.0))
+    OUTBOX_BATCH_SIZE: int = int(os.getenv("OUTBOX_BATCH_SIZE", 200))
+    OUTBOX_GAP_TIMEOUT_SECONDS: float = float(os.getenv("OUTBOX_GAP_TIMEOUT_SECONDS", 2))  # 欠番の手前で配信を止めて待つ時間
+    OUTBOX_GAP_RESCAN_SECONDS: float = float(os.getenv("OUTBOX_GAP_RESCAN_SECONDS", 600))  # 飛ばした欠番が遅れてコミットされないか探し続ける時間
+    OUTBOX_RETENTION_DAYS: int = int(os.getenv("OUTBOX_RETENTION_DAYS", 7))  # 全コンシューマーが処理済みのイベントを保持する日数
+
+    # プロジェクト一覧の並び替え用の集計値（活動数はアウトボックスのコンシューマー、お気に入り数は定期的に集計し直す）
+    PROJECT_ACTIVITY_ENABLED: bool = os.getenv("PROJECT_ACTIVITY_ENABLED", "True").lower() == "true"
+    PROJECT_STATS_ENABLED: bool = os.getenv("PROJECT_STATS_ENABLED", "True").lower() == "true"
+    PROJECT_STATS_REFRESH_INTERVAL_SECONDS: float = float(os.getenv("PROJECT_STATS_REFRESH_INTERVAL_SECONDS", 300))
+    PROJECT_STATS_BATCH_SIZE: int = int(os.getenv("PROJECT_STATS_BATCH_SIZE", 1000))  # 1回の UPDATE で更新する行数
+
+    # 分析用の集計設定（生データを集計済みの位置から差分だけ集計テーブルに反映する）
+    ANALYTICS_ROLLUP_ENABLED: bool = os.getenv("ANALYTICS_ROLLUP_ENABLED", "True").lower() == "true"
+    ANALYTICS_ROLLUP_INTERVAL_SECONDS: float = float(os.getenv("ANALYTICS_ROLLUP_INTERVAL_SECONDS", 300))
+    ANALYTICS_ROLLUP_BATCH_SIZE: int = int(os.getenv("ANALYTICS_ROLLUP_BATCH_SIZE", 5000))  # 1トランザクションで集計する行数
+    ANALYTICS_ROLLUP_LAG_SECONDS: int = int(os.getenv("ANALYTICS_ROLLUP_LAG_SECONDS", 120))  # 未コミット・書き込み待ちの行を取りこぼさないよう、この秒数より新しい行は次回に回す
+    # 分析用エンドポイントを利用できるユーザーID（カンマ区切り。未指定の場合は誰も利用できない）
+    ADMIN_USER_IDS: str = os.getenv("ADMIN_USER_IDS", "")
+
+    # 冪等性キー設定（Idempotency-Key ヘッダー付きの書き込みリクエストの再送に、保存した応答を返す）
+    IDEMPOTENCY_ENABLED: bool = os.getenv("IDEMPOTENCY_ENABLED", "True").lower() == "true"
+    IDEMPOTENCY_PATHS: str = os.getenv(
+        "IDEMPOTENCY_PATHS", "/api/projects/create,/api/troubles/,/api/messages/"
+    )  # 対象の POST のパス（カンマ区切り。/api/auth/ 以下は指定しても対象にしない）
+    IDEMPOTENCY_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 86400))  # 応答を保存する期間
+    IDEMPOTENCY_LOCK_TIMEOUT_SECONDS: int = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT_SECONDS", 60))  # 処理中のまま止まったキーを引き継ぐまでの時間
+    IDEMPOTENCY_CACHE_MAX_ENTRIES: int = int(os.getenv("IDEMPOTENCY_CACHE_MAX_ENTRIES", 10000))  # メモリ上に保持する応答の数
+    IDEMPOTENCY_MAX_BODY_BYTES: int = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", 1024 * 1024))  # これより大きい応答は保存しない
+    IDEMPOTENCY_PRUNE_INTERVAL_SECONDS: float = float(os.getenv("IDEMPOTENCY_PRUNE_INTERVAL_SECONDS", 3600))
+
+    # お困りごと削除設定
+    TROUBLE_DELETE_CHUNK_SIZE: int = int(os.getenv("TROUBLE_DELETE_CHUNK_SIZE", 1000))  # 1トランザクションで削除するメッセージ数
+    TROUBLE_SOFT_DELETE_ENABLED: bool = os.getenv("TROUBLE_SOFT_DELETE_ENABLED", "True").lower() == "true"  # 長いスレッドは論理削除してバックグラウンドで削除する
+    TROUBLE_PURGE_INTERVAL_SECONDS: float = float(os.getenv("TROUBLE_PURGE_INTERVAL_SECONDS", 60))
+
+    # メッセージのアーカイブ設定
+    MESSAGE_ARCHIVE_ENABLED: bool = os.getenv("MESSAGE_ARCHIVE_ENABLED", "True").lower() == "true"
+    MESSAGE_ARCHIVE_AFTER_DAYS: int = int(os.getenv("MESSAGE_ARCHIVE_AFTER_DAYS", 90))  # この日数書き込みの無いスレッドをアーカイブする
+    MESSAGE_ARCHIVE_PAGE_SIZE: int = int(os.getenv("MESSAGE_ARCHIVE_PAGE_SIZE", 200))  # 1ページ（圧縮単位）のメッセージ数
+    MESSAGE_ARCHIVE_INTERVAL_SECONDS: float = float(os.getenv("MESSAGE_ARCHIVE_INTERVAL_SECONDS", 3600))
+    MESSAGE_ARCHIVE_TROUBLES_PER_RUN: int = int(os.getenv("MESSAGE_ARCHIVE_TROUBLES_PER_RUN", 50))
+
+    # 類似お困りごとの検出設定（タイトル・説明文の MinHash/LSH）
+    TROUBLE_SIMILARITY_ENABLED: bool = os.getenv("TROUBLE_SIMILARITY_ENABLED", "True").lower() == "true"
+    TROUBLE_SIMILARITY_THRESHOLD: float = float(os.getenv("TROUBLE_SIMILARITY_THRESHOLD", 0.5))  # 類似とみなす推定 Jaccard 係数
+    TROUBLE_SIMILAR_LIMIT: int = int(os.getenv("TROUBLE_SIMILAR_LIMIT", 5))  # 作成時に返す類似お困りごとの最大数
+    TROUBLE_DUPLICATE_REPORT_INTERVAL_SECONDS: float = float(os.getenv("TROUBLE_DUPLICATE_REPORT_INTERVAL_SECONDS", 600))
+    TROUBLE_DUPLICATE_REPORT_BATCH_SIZE: int = int(os.getenv("TROUBLE_DUPLICATE_REPORT_BATCH_SIZE", 500))  # 1回の照合・シグネチャ作成の件数
+
+    # プロジェクトのおすすめ設定（お気に入りの共起から計算し、メモリ上に保持する）
+    RECOMMENDATIONS_ENABLED: bool = os.getenv("RECOMMENDATIONS_ENABLED", "True").lower() == "true"
+    RECOMMENDATION_TOP_K: int = int(os.getenv("RECOMMENDATION_TOP_K", 20))  # プロジェクト・ユーザーごとに保持する件数
+    RECOMMENDATION_MAX_FAVORITES_PER_USER: int = int(os.getenv("RECOMMENDATION_MAX_FAVORITES_PER_USER", 500))  # 共起の集計に使うユーザーあたりの最大お気に入り数
+    RECOMMENDATION_REFRESH_INTERVAL_SECONDS: float = float(os.getenv("RECOMMENDATION_REFRESH_INTERVAL_SECONDS", 600))
+
+    # 未読管理設定（お困りごとごとの最新メッセージIDと件数をメモリ上に保持する）
+    UNREAD_INDEX_MAX_TROUBLES: int = int(os.getenv("UNREAD_INDEX_MAX_TROUBLES", 100000))  # 保持するお困りごと数の上限
+    UNREAD_INDEX_TTL_SECONDS: float = float(os.getenv("UNREAD_INDEX_TTL_SECONDS", 300))  # 他プロセスでの書き込みを取り込むための再読み込み間隔
+
+    # 通知ダイジェスト設定（自分のお困りごとへの返信を一定期間ごとにまとめて通知する）
+    NOTIFICATIONS_ENABLED: bool = os.getenv("NOTIFICATIONS_ENABLED", "True").lower() == "true"
+    NOTIFICATION_DIGEST_WINDOW_SECONDS: float = float(os.getenv("NOTIFICATION_DIGEST_WINDOW_SECONDS", 300))  # 最初の通知からまとめるまでの待ち時間
+    NOTIFICATION_DIGEST_INTERVAL_SECONDS: float = float(os.getenv("NOTIFICATION_DIGEST_INTERVAL_SECONDS", 60))
+    NOTIFICATION_DIGEST_BATCH_SIZE: int = int(os.getenv("NOTIFICATION_DIGEST_BATCH_SIZE", 200))  # 1トランザクションでまとめる受信者数
+    NOTIFICATION_DELIVERY_BATCH_SIZE: int = int(os.getenv("NOTIFICATION_DELIVERY_BATCH_SIZE", 100))  # 1回の送信でまとめるダイジェスト数
+
     # データベースURLを動的に生成
     @property
     def get_database_url(self) -> str:
         """データベース接続URLを取得"""
         if self.USE_AZURE:
             # Azure MySQL用の接続URL（SSLはURLではなく connect_args で設定する）
-            return f"mysql+pymysql://{self.AZURE_MYSQL_USER}:{self.AZURE_MYSQL_PASSWORD}@{self.AZURE_MYSQL_HOST}:{self.AZURE_MYSQL_PORT}/{self.AZURE_MYSQL_DATABASE}"
+            # ユーザー名・パスワードに記号が含まれていても解釈が崩れないようにエスケープする
+            return (
+                f"mysql+{self.MYSQL_DRIVER}://{quote_plus(self.AZURE_MYSQL_USER)}:{quote_plus(self.AZURE_MYSQL_PASSWORD)}"
+                f"@{self.AZURE_MYSQL_HOST}:{self.AZURE_MYSQL_PORT}/{self.AZURE_MYSQL_DATABASE}"
+            )
         else:
             # ローカルデータベース接続URL
             return self.DATABASE_URL
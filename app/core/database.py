@@ -1,10 +1,15 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from fastapi import Depends, HTTPException
+from sqlalchemy import MetaData, create_engine, inspect, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Query, Session, sessionmaker
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.pool import NullPool
 from dotenv import load_dotenv
+import heapq
 import os
 import sys
-from typing import Dict, Any
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 # 環境変数の読み込み
 load_dotenv()
@@ -38,46 +43,421 @@ except ImportError:
         
         raise
 
+from app.core.resilience import CircuitBreaker, install_circuit_breaker
+
 # データベース接続設定
-def get_db_connect_args() -> Dict[str, Any]:
-    """データベース接続引数を取得"""
+def is_mysql(database_url: str) -> bool:
+    return make_url(database_url).get_backend_name() == "mysql"
+
+def get_db_connect_args(database_url: str) -> Dict[str, Any]:
+    """
+    データベース接続引数を取得
+    pymysql / mysqlclient のどちらでも同じキーで指定できるものだけを使う
+    """
     connect_args = {}
     
-    # Azure MySQLの場合のSSL設定
-    if settings.USE_AZURE:
-        ssl_mode = settings.AZURE_MYSQL_SSL_MODE.lower()
-        if ssl_mode == "require":
-            # SSL 証明書のパスを指定（Windows 環境の場合は raw 文字列またはバックスラッシュをエスケープ）
-            connect_args["ssl"] = {
-                "ssl_ca": r"C:\Users\mmkji\.ssl\DigiCertGlobalRootCA.crt.pem"
-            }
+    if is_mysql(database_url):
+        connect_args["charset"] = settings.DB_CHARSET
+        # DB が応答しなくなった場合に、リクエストのスレッドが無期限に待たないようにする
+        connect_args["connect_timeout"] = settings.DB_CONNECT_TIMEOUT_SECONDS
+        connect_args["read_timeout"] = settings.DB_READ_TIMEOUT_SECONDS
+        connect_args["write_timeout"] = settings.DB_WRITE_TIMEOUT_SECONDS
+        # 接続ごとに1回だけ実行される（プール使用時はプール内の接続ごとに1回）
+        session_variables = []
+        if settings.DB_SESSION_TIME_ZONE:
+            session_variables.append(f"time_zone = '{settings.DB_SESSION_TIME_ZONE}'")
+        if settings.DB_STATEMENT_TIMEOUT_MS > 0:
+            # 読み取り専用の SELECT だけが対象（超えた場合はエラーになりブレーカーの失敗として数えられる）
+            session_variables.append(f"max_execution_time = {settings.DB_STATEMENT_TIMEOUT_MS}")
+        if session_variables:
+            connect_args["init_command"] = "SET " + ", ".join(session_variables)
+        
+        # Azure MySQLの場合のSSL設定（SQLite のシャードには渡さない）
+        if settings.USE_AZURE:
+            ssl_mode = settings.AZURE_MYSQL_SSL_MODE.lower()
+            if ssl_mode == "require":
+                # CA 証明書のパスは AZURE_MYSQL_SSL_CA で指定（既定はリポジトリ同梱の証明書）
+                if not os.path.exists(settings.AZURE_MYSQL_SSL_CA):
+                    print(f"SSL 証明書が見つかりません: {settings.AZURE_MYSQL_SSL_CA}")
+                connect_args["ssl"] = {"ca": settings.AZURE_MYSQL_SSL_CA}
     
     return connect_args
 
+def get_engine_options(database_url: str) -> Dict[str, Any]:
+    """create_engine に渡すオプションを取得"""
+    options: Dict[str, Any] = {
+        "connect_args": get_db_connect_args(database_url),
+        "pool_pre_ping": True,  # 接続が生きているか確認
+        # コンパイル済みSQLのキャッシュ（同じ形のクエリは2回目以降コンパイルを省略する）
+        "query_cache_size": settings.DB_COMPILED_CACHE_SIZE,
+    }
+    if is_mysql(database_url) and settings.DB_ISOLATION_LEVEL:
+        # 接続時に1回だけ SET SESSION TRANSACTION ISOLATION LEVEL を実行する
+        options["isolation_level"] = settings.DB_ISOLATION_LEVEL
+    if settings.DB_POOL_SIZE > 0:
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        )
+    else:
+        options["poolclass"] = NullPool  # 各リクエスト間でコネクションを再利用しない
+    return options
+
+# ───────── シャーディング ─────────
+# お困りごと・メッセージ（とその派生データ）はプロジェクト単位でシャードに分けて保存する
+# ユーザー・プロジェクトなどその他のテーブルは既定のデータベース（DATABASE_URL）にのみ置く
+DEFAULT_SHARD = "default"
+
+# シャードに置くテーブル（これ以外のテーブルへの外部キーはシャード上には作らない）
+SHARDED_TABLES = (
+    "troubles", "messages", "message_archives", "outbox_events", "outbox_consumer_offsets",
+    "trouble_signatures", "trouble_lsh_buckets", "trouble_duplicates",
+)
+
+# シャードごとの ID の採番範囲の幅。シャード番号 n の ID は n * SHARD_ID_SPACE より大きい値から始まるため、
+# ID から保存先のシャードが分かり、シャードをまたいでも ID が重複しない（既定のデータベースは 0 番）
+SHARD_ID_SPACE = 100_000_000
+ID_RANGE_TABLES = ("troubles", "messages")
+
+def parse_shard_urls(value: str) -> List[Tuple[str, str]]:
+    """SHARD_DATABASE_URLS（"名前=URL" のカンマ区切り）を (名前, URL) のリストにする"""
+    shards: List[Tuple[str, str]] = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, separator, url = item.partition("=")
+        name, url = name.strip(), url.strip()
+        if not separator or not name or not url:
+            raise ValueError(f"SHARD_DATABASE_URLS の形式が不正です: {item}")
+        if name == DEFAULT_SHARD or name in dict(shards):
+            raise ValueError(f"シャード名が重複しています: {name}")
+        shards.append((name, url))
+    return shards
+
+class ShardRegistry:
+    """シャードごとのエンジン・セッションファクトリーと、プロジェクト・ID からの保存先の解決"""
+
+    def __init__(self):
+        self._engines: Dict[str, Engine] = {}
+        self._session_factories: Dict[str, sessionmaker] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._names_by_index: Dict[int, str] = {}
+        self._index: Dict[str, int] = {}
+        self._new_project_shards: List[str] = []
+
+    def add(self, name: str, index: int, engine: Engine, session_factory: sessionmaker) -> None:
+        self._engines[name] = engine
+        self._session_factories[name] = session_factory
+        # シャードごとに SQL の結果を記録し、障害のあるシャードだけ止める
+        breaker = CircuitBreaker(
+            name,
+            window_size=settings.DB_BREAKER_WINDOW_SIZE,
+            min_calls=settings.DB_BREAKER_MIN_CALLS,
+            failure_rate=settings.DB_BREAKER_FAILURE_RATE,
+            slow_call_seconds=settings.DB_BREAKER_SLOW_CALL_SECONDS,
+            slow_call_rate=settings.DB_BREAKER_SLOW_CALL_RATE,
+            open_seconds=settings.DB_BREAKER_OPEN_SECONDS,
+        )
+        install_circuit_breaker(engine, breaker)
+        self._breakers[name] = breaker
+        self._names_by_index[index] = name
+        self._index[name] = index
+
+    def set_new_project_shards(self, names: List[str]) -> None:
+        """新規プロジェクトの配置先を設定する"""
+        unknown = [name for name in names if name not in self._engines]
+        if unknown:
+            raise ValueError(f"SHARD_NEW_PROJECTS に未定義のシャードが含まれています: {unknown}")
+        self._new_project_shards = names
+
+    @property
+    def is_sharded(self) -> bool:
+        return len(self._engines) > 1
+
+    def names(self) -> List[str]:
+        """シャード名（シャード番号順）"""
+        return [self._names_by_index[index] for index in sorted(self._names_by_index)]
+
+    def engine(self, name: str) -> Engine:
+        return self._engines[name]
+
+    def session_factory(self, name: str) -> sessionmaker:
+        return self._session_factories[name]
+
+    def session_factories(self) -> Dict[str, sessionmaker]:
+        """シャード名 → セッションファクトリー（シャード番号順）"""
+        return {name: self._session_factories[name] for name in self.names()}
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        return self._breakers[name]
+
+    def ensure_available(self, name: str) -> None:
+        """シャードのブレーカーが開いている場合は 503 を返す（DB_BREAKER_ENABLED が無効の場合は何もしない）"""
+        if not settings.DB_BREAKER_ENABLED:
+            return
+        breaker = self._breakers[name]
+        if not breaker.allow_request():
+            raise HTTPException(
+                status_code=503,
+                detail="データベースが混み合っています。しばらくしてから再度お試しください",
+                headers={"Retry-After": str(breaker.retry_after())},
+            )
+
+    def id_range_start(self, name: str) -> int:
+        return self._index[name] * SHARD_ID_SPACE
+
+    def shard_for_id(self, entity_id: int) -> Optional[str]:
+        """お困りごと・メッセージの ID から保存先のシャードを求める（該当するシャードが無い場合は None）"""
+        if not self.is_sharded:
+            return DEFAULT_SHARD
+        return self._names_by_index.get(entity_id // SHARD_ID_SPACE) if entity_id > 0 else None
+
+    def shard_for_project(self, db: Session, project_id: int) -> str:
+        """プロジェクトのお困りごと・メッセージの保存先（対応表に無いプロジェクトは既定のシャード）"""
+        if not self.is_sharded:
+            return DEFAULT_SHARD
+        from app.models.shard import ProjectShard
+        row = cached(db.query(ProjectShard.shard).filter(ProjectShard.project_id == project_id)).first()
+        if row is None:
+            return DEFAULT_SHARD
+        if row.shard not in self._engines:
+            raise RuntimeError(f"プロジェクト {project_id} のシャード {row.shard} が設定されていません")
+        return row.shard
+
+    def assign_new_project(self, db: Session, project_id: int) -> str:
+        """新規プロジェクトの保存先を決めて対応表に追加する（コミットは呼び出し側で行う）"""
+        if not self._new_project_shards:
+            return DEFAULT_SHARD
+        shard = self._new_project_shards[project_id % len(self._new_project_shards)]
+        if shard != DEFAULT_SHARD:
+            from app.models.shard import ProjectShard
+            db.add(ProjectShard(project_id=project_id, shard=shard))
+        return shard
+
+def create_session_factory(bind: Engine, shard: str) -> sessionmaker:
+    """シャードのセッションファクトリーを作成する（クエリ結果キャッシュもシャードごとに区別される）"""
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=bind, info={SHARD_INFO_KEY: shard})
+    # クエリ結果キャッシュ（cached() を付けた参照クエリのキャッシュと、書き込み時の無効化）
+    install_query_cache(factory)
+    return factory
+
 # エンジンの作成
 try:
+    from app.core.query_cache import SHARD_INFO_KEY, cached, install_query_cache
+
     # settings.get_database_url プロパティを使って、Azure MySQL用の接続URLを取得
     database_url = settings.get_database_url
-    engine = create_engine(
-        database_url,
-        connect_args=get_db_connect_args(),
-        pool_pre_ping=True,  # 接続が生きているか確認
-        poolclass=NullPool     # 各リクエスト間でコネクションを再利用しない
-    )
+    engine = create_engine(database_url, **get_engine_options(database_url))
 
     # セッションファクトリーの作成
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    SessionLocal = create_session_factory(engine, DEFAULT_SHARD)
 
-    # ベースクラスの作成
-    Base = declarative_base()
+    # シャードの登録（既定のデータベースは 0 番、SHARD_DATABASE_URLS の順に 1 番から）
+    shard_registry = ShardRegistry()
+    shard_registry.add(DEFAULT_SHARD, 0, engine, SessionLocal)
+    for shard_index, (shard_name, shard_url) in enumerate(parse_shard_urls(settings.SHARD_DATABASE_URLS), start=1):
+        shard_engine = create_engine(shard_url, **get_engine_options(shard_url))
+        shard_registry.add(shard_name, shard_index, shard_engine, create_session_factory(shard_engine, shard_name))
+    shard_registry.set_new_project_shards(
+        [name.strip() for name in settings.SHARD_NEW_PROJECTS.split(",") if name.strip()]
+    )
+
+    # ベースクラス（各モデルが継承している app.models.base の Base を共有する）
+    from app.models.base import Base
 except Exception as e:
     print(f"データベース設定中にエラーが発生しました: {e}")
     raise
 
 # データベースセッションの依存性注入
 def get_db():
+    # ブレーカーが開いている間はセッションを作らずに 503 を返す
+    shard_registry.ensure_available(DEFAULT_SHARD)
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+# ───────── シャードのセッション ─────────
+class ShardSessions:
+    """
+    1リクエスト内で使うシャードごとのセッション（必要になったシャードの分だけ作る）
+    既定のシャードには get_db のセッションをそのまま使うため、シャードを設定していない場合の動作は従来と同じ
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self._sessions: Dict[str, Session] = {DEFAULT_SHARD: db}
+
+    def get(self, shard: str) -> Session:
+        session = self._sessions.get(shard)
+        if session is None:
+            shard_registry.ensure_available(shard)
+            session = shard_registry.session_factory(shard)()
+            self._sessions[shard] = session
+        return session
+
+    def for_project(self, project_id: int) -> Session:
+        """プロジェクトのお困りごと・メッセージを保存しているシャードのセッション"""
+        return self.get(shard_registry.shard_for_project(self.db, project_id))
+
+    def for_id(self, entity_id: int) -> Optional[Session]:
+        """お困りごと・メッセージの ID から求めたシャードのセッション（該当するシャードが無い場合は None）"""
+        shard = shard_registry.shard_for_id(entity_id)
+        return self.get(shard) if shard is not None else None
+
+    def all(self) -> List[Session]:
+        """全シャードのセッション（横断検索用）"""
+        return [self.get(name) for name in shard_registry.names()]
+
+    def group_by_id(self, ids: Iterable[int]) -> List[Tuple[Session, List[int]]]:
+        """お困りごと・メッセージの ID をシャードごとに分ける"""
+        groups: Dict[str, List[int]] = {}
+        for entity_id in ids:
+            shard = shard_registry.shard_for_id(entity_id)
+            if shard is not None:
+                groups.setdefault(shard, []).append(entity_id)
+        return [(self.get(shard), shard_ids) for shard, shard_ids in groups.items()]
+
+    def group_by_project(self, project_ids: Iterable[int]) -> List[Tuple[Session, List[int]]]:
+        """プロジェクトIDをシャードごとに分ける"""
+        groups: Dict[str, List[int]] = {}
+        for project_id in project_ids:
+            groups.setdefault(shard_registry.shard_for_project(self.db, project_id), []).append(project_id)
+        return [(self.get(shard), shard_ids) for shard, shard_ids in groups.items()]
+
+    def close(self) -> None:
+        for shard, session in self._sessions.items():
+            if shard != DEFAULT_SHARD:
+                session.close()
+
+def get_shards(db: Session = Depends(get_db)):
+    shards = ShardSessions(db)
+    try:
+        yield shards
+    finally:
+        shards.close()
+
+def fan_out_page(
+    sessions: List[Session],
+    build_query: Callable[[Session], Query],
+    key: Callable[[Any], Any],
+    skip: int,
+    limit: int,
+) -> Tuple[list, int]:
+    """
+    全シャードで同じ条件のクエリを実行し、key の降順にマージして skip 件目から limit 件と総数を返す
+    build_query は key の降順に並べたクエリを返すこと。各シャードからは先頭 skip + limit 件ずつ取得する
+    （シャードが1つの場合は OFFSET / LIMIT をそのまま使う）
+    """
+    if len(sessions) == 1:
+        query = build_query(sessions[0])
+        return query.offset(skip).limit(limit).all(), query.count()
+    total = 0
+    pages = []
+    for session in sessions:
+        query = build_query(session)
+        total += query.count()
+        pages.append(query.limit(skip + limit).all())
+    return list(islice(heapq.merge(*pages, key=key, reverse=True), skip, skip + limit)), total
+
+# ───────── シャードのテーブル作成 ─────────
+def shard_metadata() -> MetaData:
+    """
+    シャードに作成するテーブルの定義
+    既定のデータベースにあるテーブルへの外部キーは除き、ID の採番範囲を指定できるよう
+    SQLite でも AUTOINCREMENT（sqlite_sequence で採番）にする
+    """
+    metadata = MetaData()
+    for name in SHARDED_TABLES:
+        Base.metadata.tables[name].to_metadata(metadata)
+    for table in metadata.tables.values():
+        for constraint in list(table.foreign_key_constraints):
+            if constraint.elements[0].target_fullname.split(".")[0] not in SHARDED_TABLES:
+                table.constraints.discard(constraint)
+                for foreign_key in constraint.elements:
+                    table.foreign_keys.discard(foreign_key)
+                    foreign_key.parent.foreign_keys.discard(foreign_key)
+        if table.name in ID_RANGE_TABLES:
+            table.dialect_options["sqlite"]["autoincrement"] = True
+    return metadata
+
+def _reserve_id_range(conn, table_name: str, start: int) -> None:
+    """作成直後のテーブルの自動採番を start の次の値から始める"""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"), {"name": table_name, "seq": start})
+    elif dialect == "mysql":
+        conn.execute(text(f"ALTER TABLE {table_name} AUTO_INCREMENT = {start + 1}"))
+    else:
+        raise RuntimeError(f"{dialect} のシャードには ID の採番範囲を設定できません")
+
+def create_shard_tables() -> None:
+    """既定以外のシャードに不足しているテーブルを作成する（全モデルのインポート後に呼ぶ）"""
+    if not shard_registry.is_sharded:
+        return
+    metadata = shard_metadata()
+    for name in shard_registry.names():
+        if name == DEFAULT_SHARD:
+            continue
+        shard_engine = shard_registry.engine(name)
+        inspector = inspect(shard_engine)
+        missing = [t for t in metadata.sorted_tables if not inspector.has_table(t.name)]
+        if missing:
+            print(f"シャード {name} に不足しているテーブルを作成します: {[t.name for t in missing]}")
+            with shard_engine.begin() as conn:
+                metadata.create_all(bind=conn, tables=missing)
+                for table in missing:
+                    if table.name in ID_RANGE_TABLES:
+                        _reserve_id_range(conn, table.name, shard_registry.id_range_start(name))
+        upgrade_tables(shard_engine, metadata)
+
+# ───────── 既存テーブルへの列・インデックスの追加 ─────────
+# create_all は不足しているテーブルしか作成しないため、既存のテーブルに後から追加した列をここに登録しておき、
+# 起動時に無ければ ALTER TABLE ... ADD COLUMN で追加する（NULL 可、または server_default のある列に限る）
+ADDED_COLUMNS: Dict[str, List[str]] = {
+    "troubles": ["deleted_at"],
+    # category は ProjectStatsRefresher が summary から移し替える
+    "co_creation_projects": ["category", "favorite_count", "activity_count", "message_count"],
+    "revoked_tokens": ["revoked_at"],
+    "outbox_consumer_offsets": ["skipped_ids"],
+}
+
+def upgrade_tables(bind: Engine, metadata: MetaData) -> None:
+    """
+    既存のテーブルに不足している列（ADDED_COLUMNS）と、モデルに定義したインデックスを追加する
+    複数のプロセスが同時に起動して先に追加された場合はエラーを出力して次に進む
+    """
+    inspector = inspect(bind)
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        missing_columns = [name for name in ADDED_COLUMNS.get(table.name, []) if name not in columns]
+        # 登録されていない列（手動での変更が必要な列）を使うインデックスは作成しない
+        missing_indexes = [
+            index for index in table.indexes
+            if index.name not in indexes
+            and all(column.name in columns or column.name in missing_columns for column in index.columns)
+        ]
+        if not missing_columns and not missing_indexes:
+            continue
+        print(f"テーブル {table.name} に不足している列・インデックスを追加します: "
+              f"{missing_columns + [index.name for index in missing_indexes]}")
+        for name in missing_columns:
+            try:
+                with bind.begin() as conn:
+                    column = CreateColumn(table.c[name]).compile(dialect=bind.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column}"))
+            except Exception as e:
+                print(f"列の追加エラー: {str(e)}")
+        for index in missing_indexes:
+            try:
+                with bind.begin() as conn:
+                    index.create(conn)
+            except Exception as e:
+                print(f"インデックスの作成エラー: {str(e)}")
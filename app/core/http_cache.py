@@ -0,0 +1,106 @@
+# app/core/http_cache.py
+"""
+条件付きリクエスト（ETag / Last-Modified）のヘルパー
+
+詳細系エンドポイントでは、本体を読み込む前に updated_at や件数などの
+「バージョン情報」だけを軽量なクエリで取得し、そこから ETag を計算する。
+If-None-Match / If-Modified-Since が一致すれば 304 を返して本体の読み込みと
+シリアライズを省略する。
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Optional
+
+from fastapi import Request, Response, status
+
+from .config import settings
+
+# 認証が必要なレスポンス用: ブラウザは保存してよいが毎回再検証させる（CDN には保存させない）
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+def public_cache_control() -> str:
+    """認証不要なレスポンス用の Cache-Control（ブラウザ・CDN で共有キャッシュ可能）"""
+    return f"public, max-age={settings.HTTP_CACHE_MAX_AGE}, stale-while-revalidate={settings.HTTP_CACHE_STALE_WHILE_REVALIDATE}"
+
+
+def make_etag(*parts: Any) -> str:
+    """バージョン情報から弱い ETag を生成する"""
+    digest = hashlib.blake2b("|".join(str(p) for p in parts).encode("utf-8"), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def to_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """DB から取得した日時を UTC の aware な日時にする（naive な値は UTC とみなす）"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """
+    クライアントが保持しているレスポンスがまだ有効か判定する
+    If-None-Match がある場合はそちらを優先し、If-Modified-Since は無視する（RFC 9110）
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # 弱い比較（W/ の有無は区別しない）
+        target = etag[2:] if etag.startswith("W/") else etag
+        for candidate in if_none_match.split(","):
+            candidate = candidate.strip()
+            if candidate.startswith("W/"):
+                candidate = candidate[2:]
+            if candidate == target:
+                return True
+        return False
+
+    if_modified_since = request.headers.get("if-modified-since")
+    last_modified = to_utc(last_modified)
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP日付は秒単位のため、秒未満を切り捨てて比較する
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def set_cache_headers(
+    response: Response,
+    etag: str,
+    last_modified: Optional[datetime] = None,
+    cache_control: str = PRIVATE_CACHE_CONTROL,
+) -> None:
+    """ETag / Last-Modified / Cache-Control ヘッダーを設定する"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    last_modified = to_utc(last_modified)
+    if last_modified is not None:
+        response.headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+
+def conditional_response(
+    request: Request,
+    response: Response,
+    etag: str,
+    last_modified: Optional[datetime] = None,
+    cache_control: str = PRIVATE_CACHE_CONTROL,
+) -> Optional[Response]:
+    """
+    キャッシュヘッダーを設定し、クライアントのキャッシュが有効なら 304 レスポンスを返す
+    None が返った場合は通常どおりレスポンス本体を組み立てること
+
+    :param response: エンドポイントの Response パラメータ（依存関係で付与されたヘッダーを引き継ぐ）
+    """
+    set_cache_headers(response, etag, last_modified, cache_control)
+    if not is_not_modified(request, etag, last_modified):
+        return None
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=dict(response.headers))
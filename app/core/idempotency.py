@@ -0,0 +1,165 @@
+# app/core/idempotency.py
+"""
+冪等性キーミドルウェア（ASGI）
+
+- 対象パスへの POST に Idempotency-Key ヘッダーが付いている場合、同じキーの再送には
+  最初のリクエストの応答（ステータス・ヘッダー・本文）をそのまま返し、書き込みを再実行しない
+  （再送した応答には Idempotent-Replayed: true を付ける）
+- キーは認証情報（Authorization ヘッダー。無い場合はクライアントのIP）とパスごとに区別する。
+  同じキーで内容（メソッド・パス・本文）の異なるリクエストは 422、最初のリクエストが処理中の場合は 409 を返す
+- 保存するのは 4xx・5xx 以外の応答だけ（失敗したリクエストの再送は改めて実行する）
+- 応答は平文で保存するため、トークンを返す認証 API（/api/auth/）は設定されていても対象にしない
+- ヘッダーが無いリクエストはそのまま通す
+"""
+import hashlib
+from typing import Iterable, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..services.idempotency import (
+    IdempotencyStore, StoredResponse, CLAIMED, REPLAY, IN_PROGRESS, MISMATCH,
+)
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+# 応答にトークンを含むため対象にしないパス
+EXCLUDED_PATH_PREFIX = "/api/auth/"
+
+
+def _sha256(*parts: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part)
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+async def _read_body(receive: Receive) -> bytes:
+    chunks: List[bytes] = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+class IdempotencyMiddleware:
+    """Idempotency-Key ヘッダー付きの書き込みリクエストの再送に、保存した応答を返す"""
+
+    def __init__(self, app: ASGIApp, store: IdempotencyStore, paths: Iterable[str], max_body_bytes: int = 1024 * 1024):
+        self.app = app
+        self.store = store
+        paths = set(paths)
+        excluded = {path for path in paths if path.startswith(EXCLUDED_PATH_PREFIX)}
+        if excluded:
+            print(f"冪等性キーの対象から認証 API を除外します: {sorted(excluded)}")
+        self.paths = frozenset(paths - excluded)
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or scope.get("path") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        key = headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            await self.app(scope, receive, send)
+            return
+        if len(key) > MAX_KEY_LENGTH:
+            await JSONResponse(
+                {"detail": f"Idempotency-Key は{MAX_KEY_LENGTH}文字以内で指定してください"}, status_code=400
+            )(scope, receive, send)
+            return
+
+        body = await _read_body(receive)
+        # 認証の無いリクエストのキーがクライアント間で衝突しないよう、クライアントのIPとパスも含める
+        authorization = headers.get("authorization", "")
+        client = "" if authorization else (scope.get("client") or ("unknown", 0))[0]
+        key_hash = _sha256(
+            authorization.encode("latin-1"), client.encode(), scope["path"].encode(), key.encode("latin-1")
+        )
+        fingerprint = _sha256(
+            scope["method"].encode(), scope["path"].encode(), scope.get("query_string", b""), body
+        )
+
+        stored = self.store.get_cached(key_hash)
+        if stored is not None:
+            outcome = REPLAY if stored.fingerprint == fingerprint else MISMATCH
+        else:
+            outcome, stored = await run_in_threadpool(self.store.claim, key_hash, fingerprint)
+
+        if outcome == REPLAY:
+            await self._replay(stored, scope, receive, send)
+            return
+        if outcome == MISMATCH:
+            await JSONResponse(
+                {"detail": "この Idempotency-Key は内容の異なるリクエストで使用されています"}, status_code=422
+            )(scope, receive, send)
+            return
+        if outcome == IN_PROGRESS:
+            await JSONResponse(
+                {"detail": "同じ Idempotency-Key のリクエストを処理中です"},
+                status_code=409,
+                headers={"Retry-After": "1"},
+            )(scope, receive, send)
+            return
+        assert outcome == CLAIMED
+        await self._execute(key_hash, fingerprint, body, scope, receive, send)
+
+    async def _replay(self, stored: StoredResponse, scope: Scope, receive: Receive, send: Send) -> None:
+        response = Response(content=stored.body, status_code=stored.status_code)
+        response.raw_headers = [
+            (name.encode("latin-1"), value.encode("latin-1")) for name, value in stored.headers
+        ] + [(REPLAYED_HEADER.lower().encode("latin-1"), b"true")]
+        await response(scope, receive, send)
+
+    async def _execute(
+        self, key_hash: str, fingerprint: str, body: bytes, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        body_sent = False
+
+        async def replay_receive() -> Message:
+            # 読み込み済みの本文を渡し、その後は元の receive（切断の通知など）に委ねる
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status_code: Optional[int] = None
+        response_headers: List[tuple] = []
+        chunks: List[bytes] = []
+        size = 0
+
+        async def capture_send(message: Message) -> None:
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_headers.extend(
+                    (name.decode("latin-1"), value.decode("latin-1")) for name, value in message.get("headers", [])
+                )
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                if size <= self.max_body_bytes:
+                    chunks.append(chunk)
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except Exception:
+            await run_in_threadpool(self.store.release, key_hash)
+            raise
+
+        if status_code is not None and status_code < 400 and size <= self.max_body_bytes:
+            stored = StoredResponse(fingerprint, status_code, response_headers, b"".join(chunks))
+            await run_in_threadpool(self.store.complete, key_hash, stored)
+        else:
+            await run_in_threadpool(self.store.release, key_hash)
@@ -0,0 +1,280 @@
+# app/core/profiling.py
+"""
+リクエスト単位のプロファイリング（DEBUG モード専用）
+
+DEBUG=True のとき、X-Debug-Profile ヘッダー付きのリクエストについて
+- サンプリングプロファイル（一定間隔でスタックを採取し、関数ごとの出現回数を数える）
+- SQL タイムライン（各クエリの開始時刻・所要時間・SQL文・件数）
+を記録し、メモリ上にレポートとして保存する。
+レスポンスには X-Profile-Id / X-Profile-Url ヘッダーを付けるので、
+/debug/profiles/{id} で JSON のレポート、/debug/profiles/{id}/flamegraph で
+フレームグラフ用の collapsed stack 形式（flamegraph.pl / speedscope で読み込める）を取得できる。
+
+PROFILING_TOKEN を設定した場合は、ヘッダーの値がトークンと一致するときだけ記録する。
+レポートには SQL のパラメータ（パスワードのハッシュ・トークンの jti など）が含まれるため、
+/debug/profiles 以下の参照にも同じヘッダー（または token クエリパラメータ）を要求する（require_profiling_token）。
+
+同期エンドポイントはスレッドプールで実行されるため、サンプリング対象は
+「リクエストを受けたイベントループのスレッド」と「このリクエストの SQL を実行したスレッド」とする。
+同時に処理中の他のリクエストがイベントループ上で動いていると混ざることがあるため、
+負荷の低いステージング環境での利用を想定している。
+"""
+import contextvars
+import hmac
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+from fastapi import HTTPException, Request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+
+PROFILE_HEADER = "x-debug-profile"
+
+# SQL文・パラメータをレポートに残す最大長
+MAX_STATEMENT_LENGTH = 2000
+MAX_PARAMETERS_LENGTH = 500
+
+# スタックを遡る最大の深さ
+MAX_STACK_DEPTH = 128
+
+# 実行中のリクエストのプロファイル（スレッドプールにもコンテキストごと引き継がれる）
+_current: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar("request_profile", default=None)
+
+
+# ───────── 1リクエスト分の記録 ─────────
+class RequestProfile:
+    """1リクエスト分のサンプルと SQL タイムライン"""
+
+    def __init__(self, method: str, path: str, query_string: str, interval: float):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.status_code: Optional[int] = None
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms = 0.0
+
+        self.interval = interval
+        self.samples: Counter = Counter()  # スタック（根 → 葉のタプル） -> 出現回数
+        self.sample_count = 0
+        self.queries: List[Dict[str, Any]] = []
+        self.threads: Set[int] = set()
+
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    # ───────── サンプリング ─────────
+    def start(self) -> None:
+        self.threads.add(threading.get_ident())
+        self._sampler = threading.Thread(target=self._sample_loop, name=f"profiler-{self.id}", daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.duration_ms = self.elapsed_ms()
+
+    def add_thread(self, thread_id: int) -> None:
+        with self._lock:
+            self.threads.add(thread_id)
+
+    def _sample_loop(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stopping.wait(self.interval):
+            with self._lock:
+                threads = set(self.threads)
+            frames = sys._current_frames()
+            for thread_id in threads:
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[tuple(reversed(stack))] += 1
+                self.sample_count += 1
+
+    # ───────── SQL タイムライン ─────────
+    def add_query(self, statement: str, parameters: Any, start_ms: float, duration_ms: float, rowcount: int) -> None:
+        with self._lock:
+            self.queries.append({
+                "start_ms": round(start_ms, 3),
+                "duration_ms": round(duration_ms, 3),
+                "statement": statement[:MAX_STATEMENT_LENGTH],
+                "parameters": repr(parameters)[:MAX_PARAMETERS_LENGTH],
+                "rowcount": rowcount,
+                "thread": threading.get_ident(),
+            })
+
+    # ───────── レポート ─────────
+    def collapsed_stacks(self) -> str:
+        """フレームグラフ用の collapsed stack 形式（"根;...;葉 回数" を1行ずつ）"""
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in self.samples.most_common())
+
+    def top_functions(self, limit: int = 30) -> List[Dict[str, Any]]:
+        """関数ごとの self（葉として現れた回数）と total（スタックに含まれた回数）"""
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in self.samples.items():
+            if not stack:
+                continue
+            self_counts[stack[-1]] += count
+            for function in set(stack):
+                total_counts[function] += count
+        interval_ms = self.interval * 1000
+        return [
+            {
+                "function": function,
+                "self_samples": self_counts[function],
+                "total_samples": total,
+                "self_ms": round(self_counts[function] * interval_ms, 1),
+                "total_ms": round(total * interval_ms, 1),
+            }
+            for function, total in total_counts.most_common(limit)
+        ]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            "queries": len(self.queries),
+            "sql_ms": round(sum(q["duration_ms"] for q in self.queries), 3),
+            "samples": self.sample_count,
+        }
+
+    def report(self) -> Dict[str, Any]:
+        report = self.summary()
+        report.update({
+            "query_string": self.query_string,
+            "sample_interval_ms": self.interval * 1000,
+            "top_functions": self.top_functions(),
+            "sql_timeline": self.queries,
+        })
+        return report
+
+
+# ───────── レポートの保存 ─────────
+class ProfileStore:
+    """最近のレポートを保持する（古いものから破棄）"""
+
+    def __init__(self, max_reports: int):
+        self._max_reports = max_reports
+        self._profiles: "OrderedDict[str, RequestProfile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._profiles[profile.id] = profile
+            while len(self._profiles) > self._max_reports:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [profile.summary() for profile in reversed(self._profiles.values())]
+
+
+profile_store = ProfileStore(settings.PROFILING_MAX_REPORTS)
+
+
+# ───────── SQL イベント ─────────
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    profile = _current.get()
+    if profile is None:
+        return
+    profile.add_thread(threading.get_ident())
+    context._profile_started_ms = profile.elapsed_ms()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    profile = _current.get()
+    started_ms = getattr(context, "_profile_started_ms", None)
+    if profile is None or started_ms is None:
+        return
+    profile.add_query(statement, parameters, started_ms, profile.elapsed_ms() - started_ms, cursor.rowcount)
+
+
+def install_sql_timeline(engine: Engine) -> None:
+    """エンジンに SQL タイムライン記録用のイベントを登録する"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def require_profiling_token(request: Request) -> None:
+    """
+    PROFILING_TOKEN を設定した場合、プロファイルの参照に X-Debug-Profile ヘッダー
+    （ブラウザからのダウンロード用に token クエリパラメータも可）でトークンを要求する
+    """
+    if not settings.PROFILING_TOKEN:
+        return
+    value = request.headers.get(PROFILE_HEADER) or request.query_params.get("token") or ""
+    if not hmac.compare_digest(value, settings.PROFILING_TOKEN):
+        raise HTTPException(status_code=403, detail="プロファイルの参照にはトークンが必要です")
+
+
+# ───────── ミドルウェア ─────────
+class ProfilingMiddleware:
+    """X-Debug-Profile ヘッダー付きのリクエストをプロファイリングする"""
+
+    def __init__(self, app: ASGIApp, interval_ms: float = 1.0, token: str = ""):
+        self.app = app
+        self.interval = interval_ms / 1000
+        self.token = token
+
+    def _is_requested(self, scope: Scope) -> bool:
+        value = Headers(scope=scope).get(PROFILE_HEADER)
+        if not value:
+            return False
+        return hmac.compare_digest(value, self.token) if self.token else True
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self._is_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(
+            scope["method"],
+            scope.get("path", ""),
+            scope.get("query_string", b"").decode("latin-1"),
+            self.interval,
+        )
+
+        async def send_with_profile_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers["X-Profile-Id"] = profile.id
+                headers["X-Profile-Url"] = f"/debug/profiles/{profile.id}"
+            await send(message)
+
+        token = _current.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_profile_headers)
+        finally:
+            profile.stop()
+            _current.reset(token)
+            profile_store.add(profile)
@@ -0,0 +1,203 @@
+# app/core/query_cache.py
+"""
+クエリ結果キャッシュ（SQLAlchemy セッション統合）
+
+主キー検索や存在確認のような小さな参照クエリの結果をプロセス内のメモリに保持し、
+リクエストをまたいで同じクエリが発行された場合は DB に問い合わせずに返す。
+
+- 対象は cached() で明示的に指定したクエリのみ
+- キャッシュキーは「シャード + SQL文 + パラメータ + 参照テーブルのバージョン」
+- テーブルのバージョンは書き込みのコミット時に進める
+  （after_flush で ORM の追加・変更・削除対象のテーブルを、do_orm_execute で
+  一括 INSERT / UPDATE / DELETE の対象テーブルを記録し、after_commit でまとめて反映する）
+  バージョンが変わるとキーが変わるため、古い結果は参照されずに LRU で追い出される
+- 他プロセスでの書き込みは検知できないため、TTL で古さの上限を決める
+- 結果は pickle したバイト列で保持する（リクエスト間で ORM オブジェクトを共有しない）
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import ORMExecuteState, Session, loading, object_mapper
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.sql.util import find_tables
+
+from .config import settings
+
+# クエリをキャッシュ対象にする実行オプション名
+CACHE_OPTION = "query_cache"
+
+# テーブル名が特定できない書き込み（生SQLなど）で全テーブルを無効化する印
+ALL_TABLES = "*"
+
+# セッションの info に保持する「コミット待ちの書き込み対象テーブル」のキー
+_WRITTEN_TABLES = "query_cache_written_tables"
+
+# セッションの info に保持する接続先シャード名のキー（同じクエリでもシャードごとに別の結果として扱う）
+SHARD_INFO_KEY = "shard"
+
+
+def cached(query):
+    """クエリ（Query / Select）をキャッシュ対象にする"""
+    return query.execution_options(**{CACHE_OPTION: True})
+
+
+# ───────── テーブルのバージョン ─────────
+class TableVersions:
+    """テーブルごとの書き込みバージョン"""
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._epoch = 0  # 全テーブル共通のバージョン
+        self._lock = threading.Lock()
+
+    def bump(self, tables: Set[str]) -> None:
+        with self._lock:
+            if ALL_TABLES in tables:
+                self._epoch += 1
+                return
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def snapshot(self, tables: Tuple[str, ...]) -> Tuple[int, ...]:
+        with self._lock:
+            return (self._epoch,) + tuple(self._versions.get(table, 0) for table in tables)
+
+
+# ───────── 結果のキャッシュ ─────────
+class QueryResultCache:
+    """クエリ結果の LRU キャッシュ（合計バイト数で上限を設ける）"""
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int, ttl: float):
+        self._max_bytes = max_bytes
+        self._max_entry_bytes = max_entry_bytes
+        self._ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, bytes]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            data = entry[1]
+        return pickle.loads(data)
+
+    def put(self, key: Hashable, value: Any) -> None:
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            print(f"クエリキャッシュ保存エラー: {str(e)}")
+            return
+        if len(data) > self._max_entry_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self._ttl, data)
+            self._size += len(data)
+            while self._size > self._max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "hits": self.hits, "misses": self.misses}
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+
+table_versions = TableVersions()
+query_cache = QueryResultCache(
+    max_bytes=settings.QUERY_CACHE_MAX_BYTES,
+    max_entry_bytes=settings.QUERY_CACHE_MAX_ENTRY_BYTES,
+    ttl=settings.QUERY_CACHE_TTL_SECONDS,
+)
+
+# SQL文の構造ごとのコンパイル結果（キャッシュキーの文字列化に使用）
+_statement_cache: Dict[Any, str] = {}
+
+
+# ───────── セッションイベント ─────────
+def _written_tables(session: Session) -> Set[str]:
+    return session.info.setdefault(_WRITTEN_TABLES, set())
+
+
+def _is_write_text(statement: TextClause) -> bool:
+    return not statement.text.lstrip().upper().startswith(("SELECT", "WITH", "SHOW"))
+
+
+def _on_do_orm_execute(state: ORMExecuteState):
+    statement = state.statement
+
+    if state.is_insert or state.is_update or state.is_delete:
+        _written_tables(state.session).add(statement.table.name)
+        return None
+    if isinstance(statement, TextClause):
+        if _is_write_text(statement):
+            _written_tables(state.session).add(ALL_TABLES)
+        return None
+    if not state.is_select or not state.execution_options.get(CACHE_OPTION) or not settings.QUERY_CACHE_ENABLED:
+        return None
+
+    tables = tuple(sorted({t.name for t in find_tables(statement, check_columns=True, include_aliases=True)}))
+    written = state.session.info.get(_WRITTEN_TABLES)
+    if written and (ALL_TABLES in written or written.intersection(tables)):
+        # このセッションでコミット前の書き込みがあるテーブルは DB から読む
+        return None
+
+    # バージョンはクエリ実行前に取得する（実行中にコミットされた場合は古いキーに保存されるだけで済む）
+    versions = table_versions.snapshot(tables)
+    statement_key = statement._generate_cache_key().to_offline_string(
+        _statement_cache, statement, state.parameters or {}
+    )
+    key = (state.session.info.get(SHARD_INFO_KEY), statement_key, tables, versions)
+
+    frozen = query_cache.get(key)
+    if frozen is None:
+        frozen = state.invoke_statement().freeze()
+        query_cache.put(key, frozen)
+    return loading.merge_frozen_result(state.session, statement, frozen, load=False)()
+
+
+def _on_after_flush(session: Session, flush_context) -> None:
+    written = _written_tables(session)
+    for obj in chain(session.new, session.dirty, session.deleted):
+        written.update(table.name for table in object_mapper(obj).tables)
+
+
+def _on_after_commit(session: Session) -> None:
+    written = session.info.pop(_WRITTEN_TABLES, None)
+    if written:
+        table_versions.bump(written)
+
+
+def _on_after_rollback(session: Session) -> None:
+    session.info.pop(_WRITTEN_TABLES, None)
+
+
+def install_query_cache(session_factory) -> None:
+    """セッションファクトリーにキャッシュと無効化のイベントを登録する"""
+    event.listen(session_factory, "do_orm_execute", _on_do_orm_execute)
+    event.listen(session_factory, "after_flush", _on_after_flush)
+    event.listen(session_factory, "after_commit", _on_after_commit)
+    event.listen(session_factory, "after_rollback", _on_after_rollback)
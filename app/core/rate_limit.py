@@ -0,0 +1,240 @@
+# app/core/rate_limit.py
+"""
+トークンバケット方式のレート制限
+
+- キーは JWT の sub（ユーザーID）。トークンが無い／無効な場合はクライアントIP
+- ルートごとのコスト重みは ROUTE_COSTS で定義（未定義のルートは DEFAULT_COST）
+- ユーザー単位の同時実行数（処理中リクエスト数）にも上限を設ける
+- ストレージは既定でプロセス内メモリ。複数ワーカー間で共有したい場合は
+  RateLimitBackend を実装して set_backend() で差し替える
+- RateLimit-* ヘッダーは依存関係がリクエストの state に保存し、RateLimitHeadersMiddleware が
+  応答に付与する（エンドポイントが Response を直接返す場合も付くようにするため）
+"""
+import abc
+import math
+import threading
+import time
+from typing import Dict, Tuple
+
+from fastapi import HTTPException, Request, status
+from jose import JWTError, jwt
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+
+# 未定義ルートのコスト
+DEFAULT_COST = 1
+
+# ルートごとのコスト重み（メソッド, ルートのパステンプレート）→ コスト
+# bcrypt を使うログイン・登録や、件数取得を伴う一覧取得は重めに設定
+ROUTE_COSTS: Dict[Tuple[str, str], int] = {
+    ("POST", "/api/auth/login"): 10,
+    ("POST", "/api/auth/register"): 10,
+    ("GET", "/api/troubles/"): 3,
+    ("GET", "/api/projects/"): 3,
+    ("GET", "/api/messages/trouble/{trouble_id}"): 2,
+}
+
+# 応答に付与する RateLimit-* ヘッダーを保存するリクエストの state のキー
+HEADERS_STATE = "rate_limit_headers"
+
+
+class RateLimitBackend(abc.ABC):
+    """
+    レート制限の状態を保持するバックエンドのインターフェース
+    共有ストレージ（Redis など）を使う場合はこのクラスを継承して実装する
+    """
+
+    @abc.abstractmethod
+    def consume(self, key: str, cost: float, capacity: float, refill_rate: float) -> Tuple[bool, float, float]:
+        """
+        バケットからトークンを消費する
+
+        :return: (許可されたか, 残りトークン数, 再試行までの秒数)
+        """
+
+    @abc.abstractmethod
+    def acquire(self, key: str, limit: int) -> bool:
+        """同時実行枠を1つ確保する。上限に達している場合は False"""
+
+    @abc.abstractmethod
+    def release(self, key: str) -> None:
+        """同時実行枠を1つ解放する"""
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """
+    プロセス内メモリのバックエンド
+    バケットは (トークン数, 最終更新時刻) のタプルで保持し、
+    満タンに戻ったバケットはキー数が上限に達した時点でまとめて破棄する
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self._max_keys = max_keys
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._inflight: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, cost: float, capacity: float, refill_rate: float) -> Tuple[bool, float, float]:
+        now = time.monotonic()
+        # 容量を超えるコストは永久に通らないため容量で頭打ちにする
+        cost = min(cost, capacity)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self._max_keys:
+                    self._prune(now, capacity, refill_rate)
+                tokens = capacity
+            else:
+                tokens = min(capacity, bucket[0] + (now - bucket[1]) * refill_rate)
+
+            if tokens >= cost:
+                tokens -= cost
+                allowed = True
+                retry_after = 0.0
+            else:
+                allowed = False
+                retry_after = (cost - tokens) / refill_rate
+
+            self._buckets[key] = (tokens, now)
+        return allowed, tokens, retry_after
+
+    def acquire(self, key: str, limit: int) -> bool:
+        with self._lock:
+            current = self._inflight.get(key, 0)
+            if current >= limit:
+                return False
+            self._inflight[key] = current + 1
+            return True
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            current = self._inflight.get(key, 0)
+            if current <= 1:
+                self._inflight.pop(key, None)
+            else:
+                self._inflight[key] = current - 1
+
+    def _prune(self, now: float, capacity: float, refill_rate: float) -> None:
+        """満タンに戻っているバケットを削除する（削除しても挙動は変わらない）"""
+        full = [
+            key for key, (tokens, last) in self._buckets.items()
+            if tokens + (now - last) * refill_rate >= capacity
+        ]
+        for key in full:
+            del self._buckets[key]
+
+
+_backend: RateLimitBackend = InMemoryRateLimitBackend(max_keys=settings.RATE_LIMIT_MAX_KEYS)
+
+
+def set_backend(backend: RateLimitBackend) -> None:
+    """レート制限のバックエンドを差し替える"""
+    global _backend
+    _backend = backend
+
+
+def get_backend() -> RateLimitBackend:
+    """現在のレート制限バックエンドを取得する"""
+    return _backend
+
+
+def get_rate_limit_key(request: Request) -> str:
+    """
+    レート制限のキーを決定する
+    署名を検証できた JWT があればユーザーID、無ければクライアントIPを使う
+    """
+    authorization = request.headers.get("authorization")
+    if authorization and authorization[:7].lower() == "bearer ":
+        try:
+            payload = jwt.decode(authorization[7:], settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            user_id = payload.get("sub")
+            if user_id is not None:
+                return f"user:{user_id}"
+        except JWTError:
+            pass
+    client_host = request.client.host if request.client else "unknown"
+    return f"ip:{client_host}"
+
+
+def get_route_cost(request: Request) -> int:
+    """リクエストされたルートのコスト重みを取得する"""
+    route = request.scope.get("route")
+    path = getattr(route, "path", request.url.path)
+    return ROUTE_COSTS.get((request.method, path), DEFAULT_COST)
+
+
+async def rate_limit(request: Request):
+    """
+    レート制限の依存関係
+    アプリ全体の dependencies に登録して使用する
+    RateLimit-* ヘッダーを state に保存し（RateLimitHeadersMiddleware が付与する）、超過時は 429 と Retry-After を返す
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        yield
+        return
+
+    key = get_rate_limit_key(request)
+    cost = get_route_cost(request)
+    capacity = settings.RATE_LIMIT_CAPACITY
+    refill_rate = settings.RATE_LIMIT_REFILL_PER_SECOND
+
+    allowed, remaining, retry_after = _backend.consume(key, cost, capacity, refill_rate)
+    headers = {
+        "RateLimit-Limit": str(capacity),
+        "RateLimit-Remaining": str(int(remaining)),
+        "RateLimit-Reset": str(math.ceil((capacity - remaining) / refill_rate)),
+    }
+
+    if not allowed:
+        headers["Retry-After"] = str(math.ceil(retry_after))
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="リクエストが多すぎます。しばらくしてから再試行してください",
+            headers=headers,
+        )
+
+    if not _backend.acquire(key, settings.RATE_LIMIT_MAX_CONCURRENCY):
+        headers["Retry-After"] = "1"
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="同時リクエスト数が上限を超えています",
+            headers=headers,
+        )
+
+    setattr(request.state, HEADERS_STATE, headers)
+    try:
+        yield
+    finally:
+        _backend.release(key)
+
+
+class RateLimitHeadersMiddleware:
+    """
+    rate_limit が state に保存した RateLimit-* ヘッダーを応答に付与する
+    （依存関係の Response に設定したヘッダーは、エンドポイントが 304 や PlainTextResponse などを
+    直接返した場合に失われるため、送信時に付与する）
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # 内側の Request.state が同じ辞書を使うように先に作っておく
+        state = scope.setdefault("state", {})
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = state.get(HEADERS_STATE)
+                if headers:
+                    response_headers = MutableHeaders(scope=message)
+                    for name, value in headers.items():
+                        response_headers[name] = value
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
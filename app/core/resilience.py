@@ -0,0 +1,390 @@
+# app/core/resilience.py
+"""
+データベース障害時の縮退運転
+
+- CircuitBreaker: エンジンごとに直近の SQL の結果（接続・タイムアウトなどのエラーと、遅いクエリ）を記録し、
+  エラー率・遅延率がしきい値を超えたら一定時間「開」にして、新しいリクエストを DB に流さずに 503 を返す
+  （遅くなった DB にリクエストが積み重なり、全ハンドラーが待たされるのを防ぐ）
+  開いてから DB_BREAKER_OPEN_SECONDS 経過すると「半開」になり、試しに1リクエストだけ通す。
+  その SQL が成功すれば閉じ、失敗すれば再び開く
+- 障害として数えるのは接続断・タイムアウト・プールの枯渇だけで、一意制約違反・存在しない列などの
+  アプリ側・スキーマのエラーは数えない（503 ではなく 500 を返す）
+- StaleResponseMiddleware: 参照系エンドポイント（プロジェクト一覧・カテゴリー・お困りごと一覧など）の
+  成功した応答を保持し、ブレーカーが開いている間や DB エラーで 503 になった場合は保持している応答を返す
+  （Warning: 110 と X-Served-Stale ヘッダーを付ける）
+  保持するのは 1回で送られた上限以下の 200 の応答だけで、それ以外（ストリーミング・大きな応答）はそのまま流す
+  認証付きの応答はユーザーIDごとに保持し、トークンの署名・有効期限・デナイリストを確認できた場合だけ返す
+  保持する応答は件数と合計バイト数で上限を設ける
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .security import REFRESH_TOKEN_TYPE, decode_token
+from .token_denylist import token_denylist
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STALE_HEADER = "X-Served-Stale"
+
+# DB の障害によるエラーの候補（接続断・タイムアウト・プールの枯渇など。OperationalError は is_database_failure で絞り込む）
+DATABASE_FAILURES = (OperationalError, InterfaceError, PoolTimeoutError)
+
+# 接続断・タイムアウトを表す MySQL のエラーコード
+MYSQL_FAILURE_CODES = frozenset({
+    1040,  # Too many connections
+    1053,  # Server shutdown in progress
+    1205,  # Lock wait timeout exceeded
+    2002, 2003, 2005, 2006, 2013, 2055,  # 接続できない・接続が切れた
+    3024,  # max_execution_time を超えた
+})
+# 接続できない・タイムアウトを表す SQLite のエラーメッセージ
+SQLITE_FAILURE_MESSAGES = ("database is locked", "database table is locked", "unable to open database file", "disk i/o error")
+
+
+def is_database_failure(exc: Optional[BaseException]) -> bool:
+    """DB の障害（接続断・タイムアウト・プールの枯渇）によるエラーか（存在しない列などのエラーは含まない）"""
+    if isinstance(exc, (PoolTimeoutError, InterfaceError)):
+        return True
+    if not isinstance(exc, OperationalError):
+        return False
+    if exc.connection_invalidated:
+        return True
+    args = getattr(exc.orig, "args", ())
+    if args and isinstance(args[0], int):
+        return args[0] in MYSQL_FAILURE_CODES
+    message = str(exc.orig).lower()
+    return any(text in message for text in SQLITE_FAILURE_MESSAGES)
+
+
+class CircuitBreaker:
+    """直近の SQL のエラー率・遅延率で DB への流入を止めるブレーカー"""
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int = 50,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 2.0,
+        slow_call_rate: float = 0.8,
+        open_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self._window_size = window_size
+        self._min_calls = min_calls
+        self._failure_rate = failure_rate
+        self._slow_call_seconds = slow_call_seconds
+        self._slow_call_rate = slow_call_rate
+        self._open_seconds = open_seconds
+        self._clock = clock
+        # 直近の SQL の結果 (失敗したか, 遅かったか)
+        self._calls: Deque[Tuple[bool, bool]] = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self._open_seconds:
+            self._state = HALF_OPEN
+            self._probe_started_at = None
+        return self._state
+
+    def is_open(self) -> bool:
+        """DB にリクエストを流さない状態か（半開で試行中のリクエストがある場合も含む）"""
+        with self._lock:
+            state = self._current_state()
+            if state == HALF_OPEN:
+                return not self._can_probe()
+            return state == OPEN
+
+    def _can_probe(self) -> bool:
+        # 試行したリクエストが SQL を実行しないまま終わった場合に備え、一定時間で次の試行を許す
+        return self._probe_started_at is None or self._clock() - self._probe_started_at >= self._open_seconds
+
+    def allow_request(self) -> bool:
+        """リクエストに DB を使わせてよいか（半開の場合は試行の1リクエストだけ通す）"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._can_probe():
+                self._probe_started_at = self._clock()
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_after(self) -> int:
+        """次に試行するまでの秒数（Retry-After ヘッダー用）"""
+        with self._lock:
+            remaining = self._open_seconds - (self._clock() - self._opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def record(self, duration: float, failed: bool) -> None:
+        """SQL の結果を記録する"""
+        slow = duration >= self._slow_call_seconds
+        with self._lock:
+            state = self._current_state()
+            if state == HALF_OPEN:
+                if failed or slow:
+                    self._trip()
+                else:
+                    self._state = CLOSED
+                    self._calls.clear()
+                return
+            if state == OPEN:
+                return
+            self._calls.append((failed, slow))
+            if len(self._calls) < self._min_calls:
+                return
+            failures = sum(1 for f, _ in self._calls if f)
+            slow_calls = sum(1 for _, s in self._calls if s)
+            if failures >= self._failure_rate * len(self._calls) or slow_calls >= self._slow_call_rate * len(self._calls):
+                self._trip()
+
+    def _trip(self) -> None:
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._calls.clear()
+        self.trips += 1
+        print(f"データベース '{self.name}' のサーキットブレーカーが開きました（{self._open_seconds:.0f}秒間リクエストを止めます）")
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "recent_calls": len(self._calls),
+                "recent_failures": sum(1 for f, _ in self._calls if f),
+                "recent_slow_calls": sum(1 for _, s in self._calls if s),
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
+
+
+# ───────── SQL イベント ─────────
+def install_circuit_breaker(engine: Engine, breaker: CircuitBreaker) -> None:
+    """エンジンに SQL の結果を記録するイベントを登録する"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        context._breaker_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        started = getattr(context, "_breaker_started", None)
+        if started is not None:
+            breaker.record(time.perf_counter() - started, failed=False)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context) -> None:
+        if not (exception_context.is_disconnect or is_database_failure(exception_context.sqlalchemy_exception)):
+            return
+        context = exception_context.execution_context
+        started = getattr(context, "_breaker_started", None) if context is not None else None
+        breaker.record(time.perf_counter() - started if started is not None else 0.0, failed=True)
+
+
+def database_unavailable_response(retry_after: int) -> JSONResponse:
+    return JSONResponse(
+        {"detail": "データベースが混み合っています。しばらくしてから再度お試しください"},
+        status_code=503,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+async def database_error_handler(request: Request, exc: Exception) -> Response:
+    """DB の障害によるエラーを 500 ではなく 503 で返す（クライアントの再試行・古い応答での代替の対象にする）"""
+    print(f"データベースエラー: {str(exc)}")
+    if not is_database_failure(exc):
+        # スキーマの不一致などは再試行しても直らないため、通常のエラーとして返す
+        return PlainTextResponse("Internal Server Error", status_code=500)
+    return database_unavailable_response(5)
+
+
+# ───────── 古い応答での代替 ─────────
+class StaleResponseCache:
+    """参照系エンドポイントの最後に成功した応答（LRU・保持期間付き。件数と本体の合計バイト数で上限を設ける）"""
+
+    def __init__(self, max_entries: int = 1000, max_age_seconds: float = 3600.0, max_bytes: int = 32 * 1024 * 1024):
+        self._max_entries = max_entries
+        self._max_age = max_age_seconds
+        self._max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, int, List[Tuple[bytes, bytes]], bytes]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.served = 0
+
+    def get(self, key: str) -> Optional[Tuple[float, int, List[Tuple[bytes, bytes]], bytes]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self._max_age:
+                del self._entries[key]
+                self._size -= len(entry[3])
+                return None
+            self._entries.move_to_end(key)
+            self.served += 1
+            return entry
+
+    def put(self, key: str, status_code: int, headers: List[Tuple[bytes, bytes]], body: bytes) -> None:
+        if len(body) > self._max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[3])
+            self._entries[key] = (time.monotonic(), status_code, headers, body)
+            self._size += len(body)
+            while len(self._entries) > self._max_entries or self._size > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted[3])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "served": self.served}
+
+
+class StaleResponseMiddleware:
+    """ブレーカーが開いている間・DB エラーの場合に、参照系エンドポイントの前回の応答を返す"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        breaker: CircuitBreaker,
+        cache: StaleResponseCache,
+        paths: Iterable[str],
+        max_body_bytes: int = 256 * 1024,
+    ):
+        self.app = app
+        self.breaker = breaker
+        self.cache = cache
+        self.paths = frozenset(paths)
+        self.max_body_bytes = max_body_bytes
+
+    def _cache_key(self, scope: Scope, identity: str) -> str:
+        # ユーザーごとに内容が変わるエンドポイントもあるため、ユーザーごとに区別する
+        # （トークンごとに区別すると、再ログインやトークンの更新のたびに同じ内容の応答が増えるため）
+        digest = hashlib.sha256()
+        for part in (scope["path"].encode(), scope.get("query_string", b""), identity.encode()):
+            digest.update(part)
+            digest.update(b"\n")
+        return digest.hexdigest()
+
+    def _identity(self, scope: Scope) -> Optional[str]:
+        """
+        応答を保持・返す単位（未認証は空文字、認証付きは "user:<ユーザーID>"）
+        DB を使えない間は get_current_user を実行できないため、Authorization ヘッダーがある場合は
+        トークンの署名・有効期限・種別と、このプロセスのデナイリストで確認する。確認できない場合は None
+        """
+        authorization = Headers(scope=scope).get("authorization")
+        if not authorization:
+            return ""
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() != "bearer":
+            return None
+        payload = decode_token(token)
+        if (
+            payload is None
+            or payload.get("sub") is None
+            or payload.get("type") == REFRESH_TOKEN_TYPE
+            or payload.get("jti") in token_denylist
+        ):
+            return None
+        return f"user:{payload['sub']}"
+
+    async def _send_stale(self, entry, scope: Scope, receive: Receive, send: Send) -> None:
+        stored_at, status_code, headers, body = entry
+        response = Response(content=body, status_code=status_code)
+        response.raw_headers = [
+            (name, value) for name, value in headers if name.lower() != b"content-length"
+        ] + [
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (b"warning", b'110 - "Response is Stale"'),
+            (STALE_HEADER.lower().encode("latin-1"), b"true"),
+            (b"age", str(int(time.monotonic() - stored_at)).encode("latin-1")),
+        ]
+        await response(scope, receive, send)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET" or scope.get("path") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        identity = self._identity(scope)
+        if identity is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = self._cache_key(scope, identity)
+        if self.breaker.is_open():
+            entry = self.cache.get(key)
+            if entry is not None:
+                await self._send_stale(entry, scope, receive, send)
+                return
+
+        # 200 と 503 の場合だけ開始メッセージを最初の本体まで止め、200 は保持、503 は保持している応答に差し替える
+        # それ以外の状態・2回以上に分けて送られる本体・上限を超える本体はそのまま流す
+        start: Optional[Message] = None
+        passthrough = False
+        replaced = False
+
+        async def hold_send(message: Message) -> None:
+            nonlocal start, passthrough, replaced
+            if replaced:
+                return
+            if message["type"] == "http.response.start":
+                if message["status"] in (200, 503) and not self._too_large(message):
+                    start = message
+                else:
+                    passthrough = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough or start is None:
+                await send(message)
+                return
+
+            held, start = start, None
+            passthrough = True
+            body = message.get("body", b"")
+            whole = not message.get("more_body", False)
+            if held["status"] == 200:
+                if whole and len(body) <= self.max_body_bytes:
+                    self.cache.put(key, 200, list(held.get("headers", [])), body)
+            else:
+                entry = self.cache.get(key)
+                if entry is not None:
+                    replaced = True
+                    await self._send_stale(entry, scope, receive, send)
+                    return
+            await send(held)
+            await send(message)
+
+        await self.app(scope, receive, hold_send)
+
+    def _too_large(self, start: Message) -> bool:
+        """Content-Length から上限を超えると分かる応答か"""
+        content_length = Headers(raw=start.get("headers", [])).get("content-length")
+        return content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_bytes
@@ -1,8 +1,9 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional
+import uuid
 
 from jose import jwt
-from passlib.context import CryptContext
 from dotenv import load_dotenv
 import os
 
@@ -13,17 +14,28 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "fallback_secret_key_please_change_in_production")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 30))
 
-# パスワードハッシュ用のコンテキスト
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# トークン種別（payload の "type"）
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    """
+    パスワードハッシュ用のコンテキスト
+    passlib の読み込みは起動時間の大きな割合を占め、登録・ログイン時にしか使わないため、初回使用時に作成する
+    """
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """平文のパスワードとハッシュ化されたパスワードを検証する"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """パスワードをハッシュ化する"""
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """
@@ -33,20 +45,34 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     :param expires_delta: トークンの有効期限
     :return: エンコードされたJWTトークン
     """
-    to_encode = data.copy()
-    
-    # 有効期限の設定
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    if expires_delta is None:
+        expires_delta = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    return _encode_token(data, expires_delta, ACCESS_TOKEN_TYPE)
+
+def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+    """
+    JWTリフレッシュトークンを生成する
+    アクセストークンの再発行専用で、API の認証には使用できない
     
-    to_encode.update({"exp": expire})
+    :param data: トークンに含めるデータ（通常はユーザーID）
+    :param expires_delta: トークンの有効期限
+    :return: エンコードされたJWTトークン
+    """
+    if expires_delta is None:
+        expires_delta = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    return _encode_token(data, expires_delta, REFRESH_TOKEN_TYPE)
+
+def _encode_token(data: dict, expires_delta: timedelta, token_type: str) -> str:
+    """有効期限・jti（失効管理用の一意なID）・種別を付与してトークンをエンコードする"""
+    to_encode = data.copy()
+    to_encode.update({
+        "exp": datetime.utcnow() + expires_delta,
+        "jti": uuid.uuid4().hex,
+        "type": token_type,
+    })
     
     # トークンをエンコード
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    
-    return encoded_jwt
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def decode_token(token: str):
     """
@@ -0,0 +1,54 @@
+# app/core/token_denylist.py
+"""
+失効済みトークン（jti）のメモリ内デナイリスト
+
+- jti → 有効期限（UNIXタイムスタンプ）の辞書で O(1) 判定
+- 有効期限切れのエントリは、期限順のヒープを使って追加時にまとめて削除する
+  （期限切れトークンは署名検証の exp チェックで弾かれるため保持不要）
+"""
+import heapq
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class TokenDenylist:
+    """失効済みトークンの jti を保持するデナイリスト"""
+
+    def __init__(self):
+        self._entries: Dict[str, float] = {}
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def add(self, jti: str, expires_at: float) -> None:
+        """jti を失効済みとして登録する"""
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            if expires_at <= now or jti in self._entries:
+                return
+            self._entries[jti] = expires_at
+            heapq.heappush(self._expiry_heap, (expires_at, jti))
+
+    def __contains__(self, jti: Optional[str]) -> bool:
+        if jti is None:
+            return False
+        return jti in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def prune(self) -> None:
+        """有効期限切れのエントリを削除する"""
+        with self._lock:
+            self._prune(time.time())
+
+    def _prune(self, now: float) -> None:
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            _, jti = heapq.heappop(heap)
+            self._entries.pop(jti, None)
+
+
+# アプリ全体で共有するデナイリスト
+token_denylist = TokenDenylist()
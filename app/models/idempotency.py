@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, LargeBinary
+
+from .base import Base
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    # Idempotency-Key ヘッダー付きの書き込みリクエストと、その応答（再送時にそのまま返す）
+    # status_code が NULL の行は処理中（他のリクエストが同じキーで実行している）
+    key_hash = Column(String(64), primary_key=True)  # 認証情報（無い場合はクライアントのIP）・パス・キーの SHA-256
+    fingerprint = Column(String(64), nullable=False)  # メソッド・パス・本文の SHA-256
+    status_code = Column(Integer, nullable=True)
+    headers = Column(Text, nullable=True)  # JSON（[名前, 値] のリスト）
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, index=True)  # 処理を開始した日時（有効期限の起点）
+    completed_at = Column(DateTime(timezone=True), nullable=True)
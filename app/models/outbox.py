@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime
+from sqlalchemy.sql import func
+
+from .base import Base
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+
+    # 変更イベント（業務データの更新と同じトランザクションで追記する）
+    # id の順序がイベントの配信順になる
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    aggregate_type = Column(String(32), nullable=False)  # trouble / message / project
+    aggregate_id = Column(Integer, nullable=False)
+    event_type = Column(String(16), nullable=False)  # created / updated / deleted
+    payload = Column(Text, nullable=False)  # JSON
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+    # SQLite でも削除後に id を再利用させない（コンシューマーのオフセットが巻き戻らないようにする）
+    __table_args__ = {"sqlite_autoincrement": True}
+
+class OutboxConsumerOffset(Base):
+    __tablename__ = "outbox_consumer_offsets"
+
+    # コンシューマーごとの配信済み位置（この id までのイベントは処理済み）
+    consumer = Column(String(64), primary_key=True)
+    last_event_id = Column(BigInteger, nullable=False, default=0)
+    # 欠番のまま先へ進んだ id と飛ばした時刻（JSON。{"id": UNIX時刻}）
+    # 遅れてコミットされたイベントを一定時間は探して配信する
+    skipped_ids = Column(Text, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.sql import func
+
+from .base import Base
+
+class ProjectShard(Base):
+    __tablename__ = "project_shards"
+
+    # プロジェクトのお困りごと・メッセージを保存するシャード（既定のデータベースにのみ作成する）
+    # 行が無いプロジェクトは既定のシャード（DATABASE_URL）に保存される
+    # お困りごとが作成された後に変更するとデータが見えなくなるため、プロジェクト作成時にだけ設定する
+    project_id = Column(Integer, primary_key=True, autoincrement=False)
+    shard = Column(String(64), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,214 @@
+# app/services/idempotency.py
+"""
+冪等性キーの保存先
+
+- 完了したリクエストの応答をメモリ上の LRU（TTL 付き）と idempotency_keys テーブルに保存する
+  再送はまずメモリを参照し、無ければテーブルを参照する（別プロセスで処理された再送も返せる）
+- 処理の開始時にテーブルへ status_code が NULL の行を INSERT してキーを確保する
+  主キーの重複で失敗した場合は、同じキーのリクエストが処理中か完了済みのどちらか
+- 処理中のままプロセスが停止したキーは、IDEMPOTENCY_LOCK_TIMEOUT_SECONDS 経過後に次のリクエストが引き継ぐ
+- 保存期間を過ぎた行は IdempotencyKeyPruner が削除する
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..models.idempotency import IdempotencyKey
+from .periodic import PeriodicWorker
+
+keys_table = IdempotencyKey.__table__
+
+# claim() の結果
+CLAIMED = "claimed"          # キーを確保した（リクエストを実行する）
+REPLAY = "replay"            # 完了済み（保存した応答を返す）
+IN_PROGRESS = "in_progress"  # 同じキーのリクエストが処理中
+MISMATCH = "mismatch"        # 同じキーで内容の異なるリクエストが送られた
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status_code: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+
+
+class IdempotencyStore:
+    """冪等性キーごとの応答の保存先（メモリ上の LRU とデータベース）"""
+
+    def __init__(
+        self,
+        ttl_seconds: int = 86400,
+        lock_timeout_seconds: int = 60,
+        max_entries: int = 10000,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ):
+        self._ttl = ttl_seconds
+        self._lock_timeout = lock_timeout_seconds
+        self._max_entries = max_entries
+        self._session_factory = session_factory
+        self._cache: "OrderedDict[str, Tuple[StoredResponse, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ───────── メモリ ─────────
+    def get_cached(self, key_hash: str) -> Optional[StoredResponse]:
+        with self._lock:
+            entry = self._cache.get(key_hash)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry[1]:
+                del self._cache[key_hash]
+                return None
+            self._cache.move_to_end(key_hash)
+            return entry[0]
+
+    def _remember(self, key_hash: str, response: StoredResponse, expires_in: float) -> None:
+        with self._lock:
+            self._cache[key_hash] = (response, time.monotonic() + expires_in)
+            self._cache.move_to_end(key_hash)
+            while len(self._cache) > self._max_entries:
+                self._cache.popitem(last=False)
+
+    # ───────── データベース ─────────
+    def claim(self, key_hash: str, fingerprint: str) -> Tuple[str, Optional[StoredResponse]]:
+        """
+        キーを確保する。完了済みの場合は保存した応答も返す
+
+        :return: (CLAIMED / REPLAY / IN_PROGRESS / MISMATCH, 応答)
+        """
+        now = datetime.utcnow()
+        db = self._session_factory()
+        try:
+            try:
+                db.add(IdempotencyKey(key_hash=key_hash, fingerprint=fingerprint, created_at=now))
+                db.commit()
+                return CLAIMED, None
+            except IntegrityError:
+                db.rollback()
+
+            row = db.query(IdempotencyKey).filter(IdempotencyKey.key_hash == key_hash).first()
+            if row is None:
+                # 直前に期限切れで削除された
+                return self.claim(key_hash, fingerprint)
+            created_at = row.created_at.replace(tzinfo=None)
+
+            # 保存期間を過ぎたキー・処理中のまま止まったキーは引き継ぐ
+            expired = created_at <= now - timedelta(seconds=self._ttl)
+            stale = row.status_code is None and created_at <= now - timedelta(seconds=self._lock_timeout)
+            if expired or stale:
+                taken = db.execute(
+                    update(keys_table)
+                    .where(keys_table.c.key_hash == key_hash, keys_table.c.created_at == row.created_at)
+                    .values(fingerprint=fingerprint, status_code=None, headers=None, body=None,
+                            created_at=now, completed_at=None)
+                ).rowcount
+                db.commit()
+                return (CLAIMED, None) if taken else (IN_PROGRESS, None)
+
+            if row.fingerprint != fingerprint:
+                return MISMATCH, None
+            if row.status_code is None:
+                return IN_PROGRESS, None
+
+            response = StoredResponse(
+                row.fingerprint,
+                row.status_code,
+                [tuple(header) for header in json.loads(row.headers or "[]")],
+                row.body or b"",
+            )
+            remaining = (created_at + timedelta(seconds=self._ttl) - now).total_seconds()
+            self._remember(key_hash, response, remaining)
+            return REPLAY, response
+        finally:
+            db.close()
+
+    def complete(self, key_hash: str, response: StoredResponse) -> None:
+        """確保したキーに応答を保存する"""
+        self._remember(key_hash, response, self._ttl)
+        db = self._session_factory()
+        try:
+            db.execute(
+                update(keys_table)
+                .where(keys_table.c.key_hash == key_hash, keys_table.c.status_code.is_(None))
+                .values(
+                    status_code=response.status_code,
+                    headers=json.dumps(response.headers),
+                    body=response.body,
+                    completed_at=datetime.utcnow(),
+                )
+            )
+            db.commit()
+        except Exception as e:
+            # メモリには保存済みのため、このプロセスへの再送には応答を返せる
+            print(f"冪等性キーの保存エラー: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def release(self, key_hash: str) -> None:
+        """確保したキーを解放する（応答を保存しなかった場合。再送は改めて実行される）"""
+        db = self._session_factory()
+        try:
+            db.execute(
+                delete(keys_table)
+                .where(keys_table.c.key_hash == key_hash, keys_table.c.status_code.is_(None))
+            )
+            db.commit()
+        except Exception as e:
+            print(f"冪等性キーの解放エラー: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def prune(self, batch_size: int = 1000) -> int:
+        """
+        保存期間を過ぎたキーを batch_size 件ずつ削除する
+
+        :return: 削除した数
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self._ttl)
+        deleted = 0
+        db = self._session_factory()
+        try:
+            while True:
+                key_hashes = [
+                    key_hash for (key_hash,) in
+                    db.query(IdempotencyKey.key_hash)
+                    .filter(IdempotencyKey.created_at < cutoff)
+                    .limit(batch_size)
+                ]
+                if not key_hashes:
+                    return deleted
+                db.execute(delete(keys_table).where(keys_table.c.key_hash.in_(key_hashes)))
+                db.commit()
+                deleted += len(key_hashes)
+        finally:
+            db.close()
+
+
+class IdempotencyKeyPruner(PeriodicWorker):
+    """保存期間を過ぎた冪等性キーを定期的に削除する"""
+
+    def __init__(self, store: IdempotencyStore, interval: float = 3600.0):
+        super().__init__("idempotency-pruner", interval)
+        self._store = store
+
+    def run_once(self) -> None:
+        self._store.prune()
+
+
+# アプリ全体で共有する保存先
+idempotency_store = IdempotencyStore(
+    ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+    lock_timeout_seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT_SECONDS,
+    max_entries=settings.IDEMPOTENCY_CACHE_MAX_ENTRIES,
+)
+idempotency_pruner = IdempotencyKeyPruner(idempotency_store, interval=settings.IDEMPOTENCY_PRUNE_INTERVAL_SECONDS)
@@ -0,0 +1,319 @@
+# app/services/outbox.py
+"""
+トランザクショナル・アウトボックスと変更イベントの配信
+
+- ルーターはお困りごと・メッセージ・プロジェクトの作成・更新・削除と同じトランザクションで
+  record_change() を呼び、outbox_events に変更イベントを追記する
+  （業務データの更新とイベントの記録は必ず両方コミットされるか、両方ロールバックされる）
+- OutboxDispatcher はバックグラウンドスレッドで outbox_events を id 順に読み、
+  登録されたコンシューマーにバッチで配信する
+- コンシューマーごとの配信済み位置（オフセット）は outbox_consumer_offsets に保持する
+  ハンドラーが成功した場合のみ同じトランザクションでオフセットを進めるため、
+  失敗したバッチは次回再配信される（at-least-once。ハンドラーは冪等にすること）
+- ハンドラーには配信用のセッションを渡す。派生データを DB に書き込む場合は
+  このセッションを使えばオフセット更新と同時にコミットされる
+- 先行する id のトランザクションが未コミットの場合に順序が崩れないよう、
+  欠番があればその手前で配信を止め、OUTBOX_GAP_TIMEOUT_SECONDS 経過後は先へ進む
+  飛ばした欠番はオフセット行（skipped_ids）に記録し、OUTBOX_GAP_RESCAN_SECONDS の間は
+  毎回探して、遅れてコミットされたイベントを配信する（この場合だけ id 順より後に届く）
+  期間内に現れなかった欠番はロールバック等で確定したものとみなして記録から外す
+- オフセット行を SELECT ... FOR UPDATE で取得するため、複数プロセスで動かしても
+  同じコンシューマーのバッチが並行して処理されることはない
+- シャーディング時は業務データと同じシャードの outbox_events に記録し、
+  オフセットもシャードごとに保持する。ハンドラーにはイベントを記録したシャードのセッションを渡す
+  （イベントの順序はシャード内でのみ保証される）
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.database import shard_registry
+from ..models.outbox import OutboxEvent, OutboxConsumerOffset
+from .periodic import PeriodicWorker
+
+# 集約（変更対象）の種別
+TROUBLE = "trouble"
+MESSAGE = "message"
+PROJECT = "project"
+
+# 変更の種別
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+
+# 保持期間を過ぎたイベントの削除間隔（秒）
+PRUNE_INTERVAL_SECONDS = 3600
+
+# コンシューマーごとに記録しておく欠番の上限（超えた場合は古いものから外す）
+MAX_SKIPPED_IDS = 1000
+
+# セッションの info に保持する「コミット待ちのイベントがある」ことを示すキー
+_PENDING = "outbox_pending"
+
+
+class ChangeEvent(NamedTuple):
+    """コンシューマーに渡す変更イベント"""
+    id: int
+    aggregate_type: str
+    aggregate_id: int
+    event_type: str
+    payload: Dict[str, Any]
+    created_at: Optional[datetime]
+
+
+Consumer = Callable[[Session, List[ChangeEvent]], None]
+
+
+def record_change(db: Session, aggregate_type: str, aggregate_id: int, event_type: str, payload: Dict[str, Any]) -> None:
+    """
+    変更イベントをアウトボックスに追記する（コミットは呼び出し側で行う）
+
+    :param db: 業務データの更新に使っているセッション
+    :param aggregate_type: TROUBLE / MESSAGE / PROJECT
+    :param aggregate_id: 変更されたエンティティのID（作成時は flush して採番してから呼ぶ）
+    :param event_type: CREATED / UPDATED / DELETED
+    :param payload: コンシューマーに渡す内容
+    """
+    db.add(OutboxEvent(
+        aggregate_type=aggregate_type,
+        aggregate_id=aggregate_id,
+        event_type=event_type,
+        payload=json.dumps(payload, ensure_ascii=False, default=str),
+    ))
+    db.info[_PENDING] = True
+
+
+def _to_event(row: OutboxEvent) -> ChangeEvent:
+    return ChangeEvent(
+        id=row.id,
+        aggregate_type=row.aggregate_type,
+        aggregate_id=row.aggregate_id,
+        event_type=row.event_type,
+        payload=json.loads(row.payload),
+        created_at=row.created_at,
+    )
+
+
+def _load_skipped(value: Optional[str]) -> Dict[int, float]:
+    """オフセット行の skipped_ids を {欠番: 飛ばした時刻} にする"""
+    if not value:
+        return {}
+    try:
+        return {int(event_id): float(skipped_at) for event_id, skipped_at in json.loads(value).items()}
+    except (ValueError, TypeError, AttributeError):
+        return {}
+
+
+def _dump_skipped(skipped: Dict[int, float]) -> Optional[str]:
+    if not skipped:
+        return None
+    return json.dumps({str(event_id): skipped_at for event_id, skipped_at in sorted(skipped.items())})
+
+
+class OutboxDispatcher(PeriodicWorker):
+    """アウトボックスのイベントを登録済みコンシューマーに配信する"""
+
+    def __init__(
+        self,
+        poll_interval: float = 1.0,
+        batch_size: int = 200,
+        gap_timeout: float = 2.0,
+        gap_rescan: float = 600.0,
+        retention_days: int = 7,
+        session_factories: Optional[Dict[str, Callable[[], Session]]] = None,
+    ):
+        super().__init__("outbox-dispatcher", poll_interval)
+        self._batch_size = batch_size
+        self._gap_timeout = gap_timeout
+        self._gap_rescan = gap_rescan
+        self._retention_days = retention_days
+        # シャード名 -> セッションファクトリー（未指定の場合は登録済みの全シャード）
+        self._session_factories = session_factories or shard_registry.session_factories()
+
+        self._consumers: Dict[str, Consumer] = {}
+        # シャード・コンシューマーごとの (待っている欠番, 最初に見つけた時刻)
+        self._gaps: Dict[Tuple[str, str], Tuple[int, float]] = {}
+        self._last_pruned = 0.0
+
+        self._dispatch_lock = threading.Lock()
+
+    # ───────── コンシューマー登録 ─────────
+    def register(self, name: str, handler: Consumer) -> None:
+        """コンシューマーを登録する（name はオフセットの保存キーになるため変更しないこと）"""
+        self._consumers[name] = handler
+
+    # ───────── 配信 ─────────
+    def dispatch(self) -> int:
+        """
+        全シャードの全コンシューマーに1バッチずつ配信する
+
+        :return: 配信したイベントの数（コンシューマーごとの合計）
+        """
+        delivered = 0
+        with self._dispatch_lock:
+            for shard, session_factory in self._session_factories.items():
+                for name, handler in list(self._consumers.items()):
+                    delivered += self._dispatch_consumer(shard, session_factory, name, handler)
+        return delivered
+
+    def _dispatch_consumer(self, shard: str, session_factory: Callable[[], Session], name: str, handler: Consumer) -> int:
+        db = session_factory()
+        try:
+            offset = (
+                db.query(OutboxConsumerOffset)
+                .filter(OutboxConsumerOffset.consumer == name)
+                .with_for_update()
+                .first()
+            )
+            if offset is None:
+                offset = OutboxConsumerOffset(consumer=name, last_event_id=0)
+                db.add(offset)
+                db.flush()
+
+            skipped = _load_skipped(offset.skipped_ids)
+            late = self._late_arrivals(db, shard, name, skipped)
+            rows = (
+                db.query(OutboxEvent)
+                .filter(OutboxEvent.id > offset.last_event_id)
+                .order_by(OutboxEvent.id)
+                .limit(self._batch_size)
+                .all()
+            )
+            rows, gap_ids = self._until_gap((shard, name), offset.last_event_id, rows)
+            for event_id in gap_ids:
+                skipped[event_id] = time.time()
+            if len(skipped) > MAX_SKIPPED_IDS:
+                dropped = sorted(skipped, key=skipped.get)[:len(skipped) - MAX_SKIPPED_IDS]
+                print(f"記録しきれない欠番を外しました（{name} / シャード {shard}）: {dropped}")
+                for event_id in dropped:
+                    del skipped[event_id]
+
+            events = [_to_event(row) for row in late + rows]
+            if events:
+                handler(db, events)
+            if rows:
+                offset.last_event_id = rows[-1].id
+            offset.skipped_ids = _dump_skipped(skipped)
+            db.commit()
+            return len(events)
+        except Exception as e:
+            # オフセットは進めずにロールバックし、次回同じバッチを再配信する
+            print(f"変更イベントの配信エラー（{name} / シャード {shard}）: {str(e)}")
+            db.rollback()
+            return 0
+        finally:
+            db.close()
+
+    def _late_arrivals(self, db: Session, shard: str, name: str, skipped: Dict[int, float]) -> List[OutboxEvent]:
+        """
+        飛ばした欠番のうち、その後コミットされたイベントを取得する
+
+        見つかった欠番と、探す期間（gap_rescan）を過ぎた欠番は skipped から外す
+        """
+        if not skipped:
+            return []
+        rows = (
+            db.query(OutboxEvent)
+            .filter(OutboxEvent.id.in_(list(skipped)))
+            .order_by(OutboxEvent.id)
+            .all()
+        )
+        for row in rows:
+            del skipped[row.id]
+        if rows:
+            print(f"遅れてコミットされた変更イベントを配信します（{name} / シャード {shard}）: {[row.id for row in rows]}")
+
+        expired = [event_id for event_id, skipped_at in skipped.items() if time.time() - skipped_at >= self._gap_rescan]
+        for event_id in expired:
+            del skipped[event_id]
+        return rows
+
+    def _until_gap(
+        self, gap_key: Tuple[str, str], last_id: int, rows: List[OutboxEvent],
+    ) -> Tuple[List[OutboxEvent], List[int]]:
+        """
+        欠番の手前までに絞る（欠番が一定時間埋まらなければ飛ばす）
+
+        :return: (配信するイベント, 飛ばした欠番)
+        """
+        expected = last_id + 1
+        gap_ids: List[int] = []
+        for i, row in enumerate(rows):
+            if row.id != expected:
+                missing_id, first_seen = self._gaps.get(gap_key, (None, 0.0))
+                if missing_id != expected:
+                    missing_id, first_seen = expected, time.monotonic()
+                    self._gaps[gap_key] = (missing_id, first_seen)
+                if time.monotonic() - first_seen < self._gap_timeout:
+                    return rows[:i], gap_ids
+                gap_ids.extend(range(expected, row.id))
+            expected = row.id + 1
+        self._gaps.pop(gap_key, None)
+        return rows, gap_ids
+
+    def _prune(self) -> None:
+        for shard, session_factory in self._session_factories.items():
+            self._prune_shard(shard, session_factory)
+
+    def _prune_shard(self, shard: str, session_factory: Callable[[], Session]) -> None:
+        """全コンシューマーが処理済みで、保持期間を過ぎたイベントを削除する"""
+        db = session_factory()
+        try:
+            query = db.query(OutboxEvent).filter(
+                OutboxEvent.created_at < datetime.utcnow() - timedelta(days=self._retention_days)
+            )
+            if self._consumers:
+                min_offset = (
+                    db.query(func.min(OutboxConsumerOffset.last_event_id))
+                    .filter(OutboxConsumerOffset.consumer.in_(list(self._consumers)))
+                    .scalar()
+                ) or 0
+                query = query.filter(OutboxEvent.id <= min_offset)
+            deleted = query.delete(synchronize_session=False)
+            db.commit()
+            if deleted:
+                print(f"配信済みの変更イベントを削除しました（シャード {shard}）: {deleted}件")
+        except Exception as e:
+            print(f"変更イベントの削除エラー（シャード {shard}）: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def run_once(self) -> None:
+        # 配信できた場合はまだ残りがある可能性があるため、続けて配信する
+        while self.dispatch() and not self.stopping:
+            pass
+        if time.monotonic() - self._last_pruned >= PRUNE_INTERVAL_SECONDS:
+            self._last_pruned = time.monotonic()
+            self._prune()
+
+
+# アプリ全体で共有するディスパッチャー
+outbox_dispatcher = OutboxDispatcher(
+    poll_interval=settings.OUTBOX_POLL_INTERVAL_SECONDS,
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    gap_timeout=settings.OUTBOX_GAP_TIMEOUT_SECONDS,
+    gap_rescan=settings.OUTBOX_GAP_RESCAN_SECONDS,
+    retention_days=settings.OUTBOX_RETENTION_DAYS,
+)
+
+
+def _notify_after_commit(session: Session) -> None:
+    # イベントを含むトランザクションがコミットされたら配信スレッドを起こす
+    if session.info.pop(_PENDING, False):
+        outbox_dispatcher.notify()
+
+
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING, None)
+
+
+for _session_factory in shard_registry.session_factories().values():
+    event.listen(_session_factory, "after_commit", _notify_after_commit)
+    event.listen(_session_factory, "after_rollback", _discard_after_rollback)
@@ -0,0 +1,62 @@
+# app/services/periodic.py
+"""
+一定間隔で処理を実行するバックグラウンドスレッドの共通部分
+
+サブクラスで run_once() を実装する。notify() で間隔を待たずに実行させることができる。
+run_once() で発生した例外はログに出力して次回に持ち越す（スレッドは止めない）
+"""
+import threading
+from typing import Optional
+
+
+class PeriodicWorker:
+    """一定間隔で run_once() を実行するワーカースレッド"""
+
+    def __init__(self, name: str, interval: float, run_on_start: bool = False):
+        self._name = name
+        self._interval = interval
+        self._run_on_start = run_on_start
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """ワーカースレッドを起動する"""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        if self._run_on_start:
+            self._wake.set()
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """ワーカースレッドを停止する（実行中の run_once() の終了を待つ）"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+
+    def notify(self) -> None:
+        """間隔を待たずに次の run_once() を実行させる"""
+        self._wake.set()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def run_once(self) -> None:
+        raise NotImplementedError
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"バックグラウンド処理 '{self._name}' のエラー: {str(e)}")
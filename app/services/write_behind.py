@@ -0,0 +1,368 @@
+# app/services/write_behind.py
+"""
+リクエスト処理から切り離して書き込むバックグラウンドキュー（write-behind）
+
+- 最終ログイン時刻やポイント加算など「すぐに反映されなくてよい」書き込みを対象とする
+- (種別, キー) 単位で値をまとめ（合成）、一定間隔またはバッチサイズ到達時に
+  種別ごとのハンドラーで一括 UPDATE する
+- 投入された書き込みはローカルの SQLite ファイル（スプール）にも記録し、
+  再起動時にスプールから復元するため、未反映の書き込みは失われない
+- 失敗したバッチは指数バックオフで再試行し、上限回数を超えたら破棄する
+
+スプールはプロセスごとのファイル（WRITE_BEHIND_SPOOL_PATH の拡張子の前にプロセスIDを付けたもの）を使い、
+使用中は対応するロックファイルを排他ロックしておく。起動時には、ロックを取得できた
+（＝所有していたプロセスが停止した）他のスプールの行を自分のスプールに移してから削除するため、
+動作中の他のプロセスのスプールを復元・削除することはない
+"""
+import fcntl
+import glob
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.database import SessionLocal
+
+# ハンドラー: (DBセッション, {キー: 合成済みの値}) を受け取り一括で書き込む（コミットは呼び出し側）
+Handler = Callable[[Session, Dict[Hashable, Any]], None]
+# 合成関数: (既存の値, 新しい値) → 合成後の値
+Merge = Callable[[Any, Any], Any]
+
+
+def merge_latest(old: Any, new: Any) -> Any:
+    """後から来た値で上書きする"""
+    return new
+
+
+def merge_max(old: Any, new: Any) -> Any:
+    """大きい方の値を残す（時刻など）"""
+    return new if new > old else old
+
+
+def merge_sum(old: Any, new: Any) -> Any:
+    """値を加算する（カウンターなど）"""
+    return old + new
+
+
+class WriteBehindQueue:
+    """合成・バッチ化・再試行・スプールを備えた書き込みキュー"""
+
+    def __init__(
+        self,
+        spool_path: str,
+        flush_interval: float = 2.0,
+        batch_size: int = 500,
+        max_pending: int = 10000,
+        max_retries: int = 5,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ):
+        self._spool_base_path = spool_path
+        self._spool_path: Optional[str] = None
+        self._flush_interval = flush_interval
+        self._batch_size = batch_size
+        self._max_pending = max_pending
+        self._max_retries = max_retries
+        self._session_factory = session_factory
+
+        self._handlers: Dict[str, Tuple[Handler, Merge]] = {}
+        self._pending: Dict[str, Dict[Hashable, Any]] = {}
+        self._pending_count = 0
+        self._retries: Dict[str, int] = {}
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._spool: Optional[sqlite3.Connection] = None
+        self._spool_lock_fd: Optional[int] = None
+
+    # ───────── ハンドラー登録 ─────────
+    def register(self, kind: str, handler: Handler, merge: Merge = merge_latest) -> None:
+        """書き込み種別とそのハンドラー・合成関数を登録する"""
+        self._handlers[kind] = (handler, merge)
+
+    # ───────── 投入 ─────────
+    def enqueue(self, kind: str, key: Hashable, value: Any) -> bool:
+        """
+        書き込みをキューに投入する
+
+        :return: 投入できた場合は True。キューが停止中・満杯・未登録の種別の場合は False
+                 （呼び出し側で同期的に書き込むこと）
+        """
+        if self._thread is None or kind not in self._handlers:
+            return False
+
+        _, merge = self._handlers[kind]
+        with self._lock:
+            items = self._pending.setdefault(kind, {})
+            is_new_key = key not in items
+            if is_new_key and self._pending_count >= self._max_pending:
+                self._wake.set()
+                return False
+
+            try:
+                self._spool.execute(
+                    "INSERT INTO spool (kind, key, value) VALUES (?, ?, ?)",
+                    (kind, json.dumps(key), json.dumps(value)),
+                )
+                self._spool.commit()
+            except sqlite3.Error as e:
+                print(f"スプールへの書き込みエラー: {str(e)}")
+                return False
+
+            if is_new_key:
+                items[key] = value
+                self._pending_count += 1
+            else:
+                items[key] = merge(items[key], value)
+            should_wake = self._pending_count >= self._batch_size
+
+        if should_wake:
+            self._wake.set()
+        return True
+
+    # ───────── 起動・停止 ─────────
+    def start(self) -> None:
+        """スプールを開いて未反映の書き込みを復元し、ワーカースレッドを起動する"""
+        if self._thread is not None:
+            return
+        # 他のプロセスに引き取られないよう、スプールを開く前にロックする（フォーク後に起動されるためここで決める）
+        self._spool_path = self._process_spool_path(self._spool_base_path, os.getpid())
+        self._spool_lock_fd = self._lock_spool(self._spool_path, blocking=True)
+        self._spool = sqlite3.connect(self._spool_path, check_same_thread=False)
+        self._spool.execute("PRAGMA journal_mode=WAL")
+        self._spool.execute("PRAGMA synchronous=NORMAL")
+        self._spool.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL)"
+        )
+        self._spool.commit()
+        adopted = self._adopt_orphaned_spools()
+        if adopted:
+            print(f"停止したプロセスのスプールを引き継ぎました: {adopted}件")
+        restored = self._restore_from_spool()
+        if restored:
+            print(f"スプールから未反映の書き込みを復元しました: {restored}件")
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """ワーカースレッドを停止し、残っている書き込みを反映する"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        self.flush()
+        remaining = self._spool.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        self._spool.close()
+        self._spool = None
+        # すべて反映できた場合はファイルを残さない（残った場合は次に起動したプロセスが引き継ぐ）
+        if remaining == 0:
+            self._remove_spool(self._spool_path)
+        os.close(self._spool_lock_fd)
+        self._spool_lock_fd = None
+
+    # ───────── 反映 ─────────
+    def flush(self) -> int:
+        """
+        保留中の書き込みを種別ごとに一括反映する
+
+        :return: 反映したキーの数
+        """
+        with self._flush_lock:
+            with self._lock:
+                snapshot = self._pending
+                self._pending = {}
+                self._pending_count = 0
+                max_spool_id = self._spool.execute("SELECT MAX(id) FROM spool").fetchone()[0] or 0
+
+            applied = 0
+            for kind, items in snapshot.items():
+                if not items:
+                    continue
+                if kind not in self._handlers:
+                    # ハンドラー未登録の種別は登録されるまで保持する
+                    self._requeue(kind, items)
+                    continue
+                handler, _ = self._handlers[kind]
+                db = self._session_factory()
+                try:
+                    for batch in self._chunks(items):
+                        handler(db, batch)
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    self._handle_failure(kind, items, e, max_spool_id)
+                    continue
+                finally:
+                    db.close()
+
+                self._retries.pop(kind, None)
+                self._delete_spooled(kind, max_spool_id)
+                applied += len(items)
+            return applied
+
+    # ───────── 内部処理 ─────────
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self._current_interval())
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"バックグラウンド書き込みエラー: {str(e)}")
+
+    def _current_interval(self) -> float:
+        """再試行中の種別がある場合は指数バックオフした待ち時間を返す"""
+        if not self._retries:
+            return self._flush_interval
+        return self._flush_interval * (2 ** max(self._retries.values()))
+
+    def _chunks(self, items: Dict[Hashable, Any]) -> List[Dict[Hashable, Any]]:
+        keys = list(items)
+        return [
+            {key: items[key] for key in keys[i:i + self._batch_size]}
+            for i in range(0, len(keys), self._batch_size)
+        ]
+
+    def _handle_failure(self, kind: str, items: Dict[Hashable, Any], error: Exception, max_spool_id: int) -> None:
+        retries = self._retries.get(kind, 0) + 1
+        if retries > self._max_retries:
+            print(f"書き込み '{kind}' が{self._max_retries}回失敗したため破棄します（{len(items)}件）: {str(error)}")
+            self._retries.pop(kind, None)
+            self._delete_spooled(kind, max_spool_id)
+            return
+        print(f"書き込み '{kind}' の反映に失敗しました（再試行 {retries}/{self._max_retries}）: {str(error)}")
+        self._retries[kind] = retries
+        self._requeue(kind, items)
+
+    def _requeue(self, kind: str, items: Dict[Hashable, Any]) -> None:
+        """反映できなかった値を保留中の値と合成して戻す（古い値を先に適用する）"""
+        merge = self._handlers[kind][1] if kind in self._handlers else merge_latest
+        with self._lock:
+            current = self._pending.setdefault(kind, {})
+            for key, value in items.items():
+                if key in current:
+                    current[key] = merge(value, current[key])
+                else:
+                    current[key] = value
+                    self._pending_count += 1
+
+    def _delete_spooled(self, kind: str, max_spool_id: int) -> None:
+        """反映済み（または破棄した）スプールの行を削除する"""
+        with self._lock:
+            self._spool.execute("DELETE FROM spool WHERE kind = ? AND id <= ?", (kind, max_spool_id))
+            self._spool.commit()
+
+    @staticmethod
+    def _process_spool_path(base_path: str, pid: int) -> str:
+        root, ext = os.path.splitext(base_path)
+        return f"{root}.{pid}{ext or '.db'}"
+
+    @staticmethod
+    def _lock_spool(spool_path: str, blocking: bool) -> Optional[int]:
+        """
+        スプールのロックファイルを排他ロックし、ファイル記述子を返す（blocking=False で取得できない場合は None）
+        ロック中に他のプロセスがロックファイルを削除した場合は作り直したものをロックし直す
+        """
+        lock_path = spool_path + ".lock"
+        while True:
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return None
+            try:
+                if os.stat(lock_path).st_ino == os.fstat(fd).st_ino:
+                    return fd
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+
+    @staticmethod
+    def _remove_spool(spool_path: str) -> None:
+        """スプールのファイル（WAL・ロックファイルを含む）を削除する（ロックを保持した状態で呼ぶ）"""
+        for suffix in ("", "-wal", "-shm", ".lock"):
+            if os.path.exists(spool_path + suffix):
+                os.remove(spool_path + suffix)
+
+    def _adopt_orphaned_spools(self) -> int:
+        """
+        停止したプロセスのスプール（ロックを取得できたもの）の行を自分のスプールに移し、元のファイルを削除する
+        移した行のコミットとファイルの削除の間で停止した場合に限り、次回の起動で同じ行が二重に引き継がれる
+
+        :return: 引き継いだ行数
+        """
+        root, ext = os.path.splitext(self._spool_base_path)
+        # 以前の版が使っていたプロセスIDの無いスプールも引き継ぐ
+        candidates = set(glob.glob(f"{glob.escape(root)}.*{ext or '.db'}")) | {self._spool_base_path}
+        candidates.discard(self._spool_path)
+        adopted = 0
+        for path in sorted(candidates):
+            if not os.path.exists(path):
+                continue
+            fd = self._lock_spool(path, blocking=False)
+            if fd is None:
+                continue  # 動作中のプロセスのスプール
+            try:
+                if not os.path.exists(path):
+                    continue  # 先に他のプロセスが引き継いだ
+                orphan = sqlite3.connect(path)
+                try:
+                    rows = orphan.execute("SELECT kind, key, value FROM spool ORDER BY id").fetchall()
+                except sqlite3.OperationalError:
+                    rows = []  # スプールのテーブルを作成する前に停止した
+                finally:
+                    orphan.close()
+                with self._lock:
+                    self._spool.executemany("INSERT INTO spool (kind, key, value) VALUES (?, ?, ?)", rows)
+                    self._spool.commit()
+                self._remove_spool(path)
+                adopted += len(rows)
+            finally:
+                os.close(fd)
+        return adopted
+
+    def _restore_from_spool(self) -> int:
+        rows = self._spool.execute("SELECT kind, key, value FROM spool ORDER BY id").fetchall()
+        with self._lock:
+            for kind, key, value in rows:
+                key = self._to_hashable(json.loads(key))
+                value = json.loads(value)
+                merge = self._handlers[kind][1] if kind in self._handlers else merge_latest
+                items = self._pending.setdefault(kind, {})
+                if key in items:
+                    items[key] = merge(items[key], value)
+                else:
+                    items[key] = value
+                    self._pending_count += 1
+        return len(rows)
+
+    @staticmethod
+    def _to_hashable(value: Any) -> Hashable:
+        """JSON から復元したリストをタプルに戻す（複合キー用）"""
+        if isinstance(value, list):
+            return tuple(WriteBehindQueue._to_hashable(v) for v in value)
+        return value
+
+
+# アプリ全体で共有するキュー
+write_behind = WriteBehindQueue(
+    spool_path=settings.WRITE_BEHIND_SPOOL_PATH,
+    flush_interval=settings.WRITE_BEHIND_FLUSH_INTERVAL_SECONDS,
+    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+    max_pending=settings.WRITE_BEHIND_MAX_PENDING,
+    max_retries=settings.WRITE_BEHIND_MAX_RETRIES,
+)
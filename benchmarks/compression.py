@@ -0,0 +1,114 @@
+"""
+レスポンス圧縮（app/core/compression.py）のベンチマーク
+
+一覧 API に近い JSON（日本語のタイトル・説明を含むプロジェクトの配列）をサイズごとに作成し、
+利用可能な方式（gzip / brotli / zstd）とレベルごとに compress_body の CPU 時間と削減バイト数を計測する。
+
+- 圧縮時間: 1回の圧縮にかかった時間の中央値
+- 削減率・削減バイト数: 圧縮によって減ったバイト数
+- 損益: 削減バイト数を --bandwidth-mbps の回線で送る時間から圧縮時間を引いた値（正なら圧縮した方が速い）
+  サイズが小さい行で損益が負になる場合は COMPRESSION_MIN_SIZE を引き上げる目安になる
+
+    python benchmarks/compression.py
+    python benchmarks/compression.py --sizes 512 1024 4096 65536 --bandwidth-mbps 50 --runs 200
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Dict, List, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from app.core.config import settings  # noqa: E402
+from app.core.compression import available_encodings, compress_body  # noqa: E402
+
+# 方式ごとの計測するレベルと、レベルを設定する settings の属性
+LEVELS: Dict[str, Tuple[str, List[int]]] = {
+    "gzip": ("COMPRESSION_GZIP_LEVEL", [1, 6, 9]),
+    "br": ("COMPRESSION_BROTLI_QUALITY", [1, 4, 6, 11]),
+    "zstd": ("COMPRESSION_ZSTD_LEVEL", [1, 3, 9, 19]),
+}
+
+CATEGORIES = ["テクノロジー", "デザイン", "マーケティング", "ビジネス", "教育", "コミュニティ"]
+WORDS = ["ゲーム", "共同制作", "イベント", "企画", "メンバー募集", "開発", "アプリ", "地域", "学生", "デザイン", "音楽", "映像"]
+
+
+def make_payload(size: int, seed: int = 42) -> bytes:
+    """size バイト以上になるまでプロジェクトを並べた一覧の JSON（FastAPI と同じく ensure_ascii=False で UTF-8 にする）"""
+    rng = random.Random(seed)
+    projects = []
+    body = b"[]"
+    while len(body) < size:
+        project_id = len(projects) + 1
+        projects.append({
+            "id": project_id,
+            "title": "".join(rng.choice(WORDS) for _ in range(3)),
+            "description": "、".join(rng.choice(WORDS) for _ in range(rng.randint(5, 20))) + "のプロジェクトです。",
+            "category": rng.choice(CATEGORIES),
+            "author_id": rng.randint(1, 10000),
+            "author": f"user{rng.randint(1, 10000)}",
+            "created_at": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00",
+            "likes": rng.randint(0, 500),
+            "comments": rng.randint(0, 100),
+            "is_favorite": rng.random() < 0.1,
+        })
+        body = json.dumps({"projects": projects, "total": 10000}, ensure_ascii=False).encode()
+    return body
+
+
+def measure(body: bytes, encoding: str, runs: int) -> Tuple[float, int]:
+    """(圧縮時間の中央値（マイクロ秒）, 圧縮後のバイト数)"""
+    durations = []
+    compressed = b""
+    for _ in range(runs):
+        started = time.perf_counter()
+        compressed = compress_body(body, encoding)
+        durations.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(durations), len(compressed)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="圧縮方式・レベル・サイズごとの CPU 時間と削減バイト数を計測する")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 512, 1024, 2048, 8192, 65536, 262144])
+    parser.add_argument("--encodings", nargs="+", default=available_encodings())
+    parser.add_argument("--bandwidth-mbps", type=float, default=10.0, help="損益の計算に使う回線速度")
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    bytes_per_us = args.bandwidth_mbps * 1e6 / 8 / 1e6
+    print(f"方式: {', '.join(available_encodings())} / 現在の最小サイズ {settings.COMPRESSION_MIN_SIZE:,}バイト"
+          f" / 回線 {args.bandwidth_mbps:g}Mbps\n")
+    print(f"{'方式':<6}{'レベル':>6}{'サイズ':>10}{'圧縮後':>10}{'削減率':>8}{'圧縮時間':>12}{'削減/ms':>12}{'損益':>12}")
+
+    payloads = {size: make_payload(size) for size in args.sizes}
+    for encoding in args.encodings:
+        if encoding not in available_encodings():
+            print(f"{encoding}: パッケージがインストールされていないため省略します")
+            continue
+        attribute, levels = LEVELS[encoding]
+        default_level = getattr(settings, attribute)
+        try:
+            for level in levels:
+                setattr(settings, attribute, level)
+                for size, body in payloads.items():
+                    elapsed_us, compressed = measure(body, encoding, args.runs)
+                    saved = len(body) - compressed
+                    per_ms = saved / (elapsed_us / 1000) if elapsed_us else 0.0
+                    net_us = saved / bytes_per_us - elapsed_us
+                    mark = "*" if level == default_level else " "
+                    print(f"{encoding:<6}{level:>5}{mark}{len(body):>10,}{compressed:>10,}{saved / len(body):>8.1%}"
+                          f"{elapsed_us:>10.1f}us{per_ms:>12,.0f}{net_us:>10.1f}us")
+                print()
+        finally:
+            setattr(settings, attribute, default_level)
+    print("* は現在の設定のレベル")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+起動時間（main のインポート時間）のベンチマーク
+
+python -X importtime で main を別プロセスで複数回インポートし、中央値が予算を超えていれば終了コード 1 を返す。
+スケールアウト時のコールドスタートが遅くならないよう、CI などで定期的に実行する。
+
+    python benchmarks/import_time.py                    # 予算は IMPORT_TIME_BUDGET_MS（既定 1500ms）
+    python benchmarks/import_time.py --budget-ms 1200 --runs 7
+    python benchmarks/import_time.py --output benchmarks/import_time.jsonl   # 結果を1行の JSON で追記して推移を記録する
+
+API_ROUTERS など起動に影響する環境変数はそのまま引き継ぐ（DATABASE_URL 未指定の場合はメモリ上の SQLite を使う）
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_once(env: Dict[str, str]) -> Tuple[int, Dict[str, Tuple[int, int]]]:
+    """
+    main を1回インポートし、合計時間とモジュールごとの (自身の時間, 累計時間) をマイクロ秒で返す
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=PROJECT_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"main のインポートに失敗しました:\n{result.stderr[-2000:]}")
+
+    modules: Dict[str, Tuple[int, int]] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    if "main" not in modules:
+        raise RuntimeError("importtime の出力に main がありません")
+    return modules["main"][1], modules
+
+
+def top_modules(modules: Dict[str, Tuple[int, int]], prefix: str, count: int) -> List[Tuple[str, float]]:
+    """prefix で始まるモジュールを自身の時間の長い順に返す（ミリ秒）"""
+    selected = [(name, self_us) for name, (self_us, _) in modules.items() if name == prefix or name.startswith(prefix + ".")]
+    selected.sort(key=lambda item: item[1], reverse=True)
+    return [(name, self_us / 1000) for name, self_us in selected[:count]]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="main のインポート時間を計測する")
+    parser.add_argument("--runs", type=int, default=5, help="計測回数（中央値で判定する）")
+    parser.add_argument(
+        "--budget-ms", type=float,
+        default=float(os.getenv("IMPORT_TIME_BUDGET_MS", 1500)),
+        help="インポート時間の予算（ミリ秒）",
+    )
+    parser.add_argument("--top", type=int, default=10, help="表示するモジュール数")
+    parser.add_argument("--output", help="結果を JSON Lines で追記するファイル")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite://")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [PROJECT_ROOT, env.get("PYTHONPATH")]))
+
+    totals = []
+    modules: Dict[str, Tuple[int, int]] = {}
+    for _ in range(args.runs):
+        total_us, modules = measure_once(env)
+        totals.append(total_us / 1000)
+    median_ms = statistics.median(totals)
+
+    print(f"main のインポート時間: 中央値 {median_ms:.1f}ms（{args.runs}回: {', '.join(f'{t:.0f}' for t in totals)}ms）")
+    print(f"予算: {args.budget_ms:.0f}ms")
+    print("\nアプリのモジュール（自身の時間、最後の計測）:")
+    for name, ms in top_modules(modules, "app", args.top):
+        print(f"  {ms:8.1f}ms  {name}")
+    print("\nトップレベルのパッケージ（累計時間、最後の計測）:")
+    packages = sorted(
+        ((name, cumulative_us / 1000) for name, (_, cumulative_us) in modules.items() if "." not in name and name != "main"),
+        key=lambda item: item[1], reverse=True,
+    )
+    for name, ms in packages[:args.top]:
+        print(f"  {ms:8.1f}ms  {name}")
+
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "measured_at": datetime.utcnow().isoformat(),
+                "median_ms": round(median_ms, 1),
+                "runs_ms": [round(t, 1) for t in totals],
+                "budget_ms": args.budget_ms,
+                "api_routers": env.get("API_ROUTERS", ""),
+            }, ensure_ascii=False) + "\n")
+
+    if median_ms > args.budget_ms:
+        print(f"\n予算を超えています（{median_ms - args.budget_ms:.1f}ms 超過）")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
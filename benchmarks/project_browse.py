@@ -0,0 +1,172 @@
+"""
+プロジェクト一覧（/api/projects/browse）のベンチマーク
+
+SQLite のファイルに大量のプロジェクト（既定 100万件）を作成し、並び順・絞り込みごとに
+browse_projects の1ページ目・深いページ（キーセット）と、同じ位置を OFFSET で取得した場合の時間を比較する。
+あわせて1ページ目のクエリの実行計画を表示し、インデックスが使われているかを確認する。
+
+    python benchmarks/project_browse.py                          # 100万件（作成済みのファイルがあれば再利用する）
+    python benchmarks/project_browse.py --projects 200000 --pages 100
+    python benchmarks/project_browse.py --database /tmp/browse.db --rebuild
+
+MySQL で計測する場合は --url に接続URLを指定する（テーブルが空の場合のみデータを作成する）
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, func, insert, text  # noqa: E402
+from sqlalchemy.orm import Session, sessionmaker  # noqa: E402
+
+from app.models.base import Base  # noqa: E402
+from app.api.users.models import User  # noqa: E402
+from app.api.troubles import models as trouble_models  # noqa: E402,F401（リレーションの解決に必要）
+from app.api.messages import models as message_models  # noqa: E402,F401
+from app.api.points import models as point_models  # noqa: E402,F401
+from app.api.projects.models import Project  # noqa: E402
+from app.api.projects.browse import NEWEST, FAVORITES, ACTIVE, SORT_COLUMNS, browse_projects, decode_cursor  # noqa: E402
+
+CATEGORIES = ["テクノロジー", "デザイン", "マーケティング", "ビジネス", "教育", "コミュニティ", "医療", "環境"]
+CREATORS = 10000
+PAGE_SIZE = 20
+
+
+def populate(session: Session, count: int, batch_size: int = 20000) -> None:
+    """プロジェクトを count 件作成する（お気に入り数・活動数は偏りのある乱数）"""
+    rng = random.Random(42)
+    started = datetime(2020, 1, 1)
+    span = (datetime(2026, 1, 1) - started).total_seconds()
+    table = Project.__table__
+    for start in range(0, count, batch_size):
+        rows = []
+        for i in range(start, min(start + batch_size, count)):
+            rows.append({
+                "project_id": i + 1,
+                "title": f"project {i + 1}",
+                "description": "benchmark project",
+                "category": CATEGORIES[rng.randrange(len(CATEGORIES))],
+                "creator_user_id": rng.randrange(1, CREATORS + 1),
+                # project_id の順に作成日時が進むようにする
+                "created_at": started + timedelta(seconds=span * i / count),
+                "favorite_count": int(rng.paretovariate(1.5)) - 1,
+                "activity_count": int(rng.paretovariate(1.2)) - 1,
+            })
+        session.execute(insert(table), rows)
+        session.commit()
+        print(f"\r作成中: {min(start + batch_size, count):,} / {count:,}", end="", flush=True)
+    print()
+
+
+def timed(fn: Callable[[], object], runs: int) -> float:
+    """fn を runs 回実行した中央値（ミリ秒）"""
+    durations = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations)
+
+
+def explain(session: Session, sort: str, **filters) -> List[str]:
+    """1ページ目のクエリの実行計画（SQLite の場合のみ）"""
+    if session.bind.dialect.name != "sqlite":
+        return []
+    column = SORT_COLUMNS[sort]
+    query = session.query(Project.project_id)
+    if filters.get("category") is not None:
+        query = query.filter(Project.category == filters["category"])
+    if filters.get("creator_id") is not None:
+        query = query.filter(Project.creator_user_id == filters["creator_id"])
+    order_by = [Project.project_id.desc()] if sort == NEWEST else [column.desc(), Project.project_id.desc()]
+    statement = query.order_by(*order_by).limit(PAGE_SIZE + 1).statement
+    compiled = statement.compile(session.bind, compile_kwargs={"literal_binds": True})
+    return [row[-1] for row in session.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="プロジェクト一覧のキーセットページングを計測する")
+    parser.add_argument("--projects", type=int, default=1_000_000, help="作成するプロジェクト数")
+    parser.add_argument("--database", default=os.path.join(tempfile.gettempdir(), "collabogames_project_browse.db"))
+    parser.add_argument("--url", help="SQLite のファイルの代わりに使う接続URL")
+    parser.add_argument("--rebuild", action="store_true", help="作成済みのデータを作り直す（SQLite のファイルのみ）")
+    parser.add_argument("--pages", type=int, default=50, help="深いページとして計測するページ番号")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.url is None and args.rebuild and os.path.exists(args.database):
+        os.remove(args.database)
+    engine = create_engine(args.url or f"sqlite:///{args.database}")
+    Base.metadata.create_all(engine, tables=[User.__table__, Project.__table__])
+    session = sessionmaker(bind=engine)()
+
+    existing = session.query(func.count(Project.project_id)).scalar()
+    if existing == 0:
+        populate(session, args.projects)
+        if engine.dialect.name == "sqlite":
+            session.execute(text("ANALYZE"))
+            session.commit()
+    elif existing != args.projects:
+        print(f"既存のデータ（{existing:,}件）を使います。作り直す場合は --rebuild を指定してください")
+    total = session.query(func.count(Project.project_id)).scalar()
+    print(f"プロジェクト数: {total:,} / 1ページ {PAGE_SIZE}件 / {args.pages}ページ目まで辿って比較\n")
+
+    cases = [
+        ("新着", NEWEST, {}),
+        ("新着・カテゴリー", NEWEST, {"category": "デザイン"}),
+        ("新着・作成者", NEWEST, {"creator_id": 1}),
+        ("お気に入り数", FAVORITES, {}),
+        ("お気に入り数・カテゴリー", FAVORITES, {"category": "デザイン"}),
+        ("活動数", ACTIVE, {}),
+        ("活動数・カテゴリー", ACTIVE, {"category": "デザイン"}),
+        ("新着・期間", NEWEST, {"created_from": datetime(2024, 1, 1), "created_to": datetime(2024, 2, 1)}),
+    ]
+    print(f"{'条件':<24}{'1ページ目':>10}{'深いページ':>12}{'OFFSET':>10}  実行計画")
+    for label, sort, filters in cases:
+        first_ms = timed(lambda: browse_projects(session, sort, limit=PAGE_SIZE, **filters), args.runs)
+
+        # 深いページのカーソルまで辿る
+        cursor = None
+        depth = 0
+        for depth in range(1, args.pages):
+            _, cursor = browse_projects(
+                session, sort, limit=PAGE_SIZE, after=decode_cursor(sort, cursor) if cursor else None, **filters
+            )
+            if cursor is None:
+                break
+        after = decode_cursor(sort, cursor) if cursor else None
+        deep_ms = timed(lambda: browse_projects(session, sort, limit=PAGE_SIZE, after=after, **filters), args.runs)
+
+        # 同じ位置を OFFSET で取得した場合
+        def offset_page():
+            column = SORT_COLUMNS[sort]
+            query = session.query(Project)
+            if filters.get("category") is not None:
+                query = query.filter(Project.category == filters["category"])
+            if filters.get("creator_id") is not None:
+                query = query.filter(Project.creator_user_id == filters["creator_id"])
+            if filters.get("created_from") is not None:
+                query = query.filter(Project.created_at >= filters["created_from"], Project.created_at < filters["created_to"])
+            order_by = [Project.project_id.desc()] if sort == NEWEST else [column.desc(), Project.project_id.desc()]
+            return query.order_by(*order_by).offset(depth * PAGE_SIZE).limit(PAGE_SIZE).all()
+
+        offset_ms = timed(offset_page, args.runs)
+        plan = "; ".join(explain(session, sort, **filters))
+        print(f"{label:<24}{first_ms:>8.2f}ms{deep_ms:>10.2f}ms{offset_ms:>8.2f}ms  {plan}")
+        session.expunge_all()
+
+    session.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
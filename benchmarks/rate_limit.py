@@ -0,0 +1,113 @@
+"""
+レート制限（app/core/rate_limit.py）のベンチマーク
+
+- バックエンド: InMemoryRateLimitBackend の consume + acquire + release の1回あたりの時間を、
+  キー数（同じユーザーが続けて送る場合・多数のユーザー／IP が混ざる場合）とスレッド数ごとに計測する
+  キー数が RATE_LIMIT_MAX_KEYS を超える場合は満タンのバケットの破棄（_prune）の時間も含まれる
+- リクエスト: TestClient で / を呼び出し、レート制限の有効・無効と認証の有無（JWT の検証を含むか）で
+  1リクエストあたりの時間を比較する
+
+    python benchmarks/rate_limit.py
+    python benchmarks/rate_limit.py --calls 500000 --threads 1 4 8 --requests 5000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from typing import Callable, Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+BENCH_DIR = tempfile.mkdtemp(prefix="collabogames_rate_limit_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(BENCH_DIR, 'bench.db')}")
+os.environ.setdefault("WRITE_BEHIND_SPOOL_PATH", os.path.join(BENCH_DIR, "write_behind_spool.db"))
+os.environ.setdefault("OUTBOX_DISPATCH_ENABLED", "false")
+
+from app.core.config import settings  # noqa: E402
+from app.core.rate_limit import InMemoryRateLimitBackend  # noqa: E402
+
+
+def bench_backend(keys: int, threads: int, calls: int, max_keys: int) -> float:
+    """1回の consume + acquire + release にかかる時間（マイクロ秒、全スレッドの合計時間 / 回数）"""
+    backend = InMemoryRateLimitBackend(max_keys=max_keys)
+    capacity = settings.RATE_LIMIT_CAPACITY
+    # 計測中に 429 にならないよう十分な補充量にする（拒否された場合の分岐も時間はほぼ同じ）
+    refill_rate = 1e9
+    per_thread = calls // threads
+    names = [f"user:{i}" for i in range(keys)]
+
+    def worker(offset: int) -> None:
+        for i in range(per_thread):
+            key = names[(offset + i) % keys]
+            backend.consume(key, 1, capacity, refill_rate)
+            if backend.acquire(key, settings.RATE_LIMIT_MAX_CONCURRENCY):
+                backend.release(key)
+
+    workers = [threading.Thread(target=worker, args=(n * per_thread,)) for n in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return (time.perf_counter() - started) / (per_thread * threads) * 1e6
+
+
+def timed_requests(call: Callable[[], object], count: int) -> Dict[str, float]:
+    """count 回のリクエストの中央値と p99（ミリ秒）"""
+    durations: List[float] = []
+    for _ in range(count):
+        started = time.perf_counter()
+        call()
+        durations.append((time.perf_counter() - started) * 1000)
+    durations.sort()
+    return {"median": statistics.median(durations), "p99": durations[int(len(durations) * 0.99) - 1]}
+
+
+def bench_requests(count: int) -> None:
+    from fastapi.testclient import TestClient
+
+    import main
+    from app.api.auth.jwt import create_access_token
+
+    token = create_access_token({"sub": "1"}, expires_delta=timedelta(hours=1))
+    authorized = {"Authorization": f"Bearer {token}"}
+    # 残量が無くならないようにする
+    settings.RATE_LIMIT_CAPACITY = count * 10
+    with TestClient(main.app) as client:
+        print(f"\n{'リクエスト（GET /）':<28}{'中央値':>10}{'p99':>10}")
+        for enabled in (False, True):
+            settings.RATE_LIMIT_ENABLED = enabled
+            for label, headers in (("IP", {}), ("JWT", authorized)):
+                client.get("/", headers=headers)
+                result = timed_requests(lambda: client.get("/", headers=headers), count)
+                name = f"{'有効' if enabled else '無効'}・{label}"
+                print(f"{name:<28}{result['median']:>8.3f}ms{result['p99']:>8.3f}ms")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="レート制限のバックエンドとリクエストあたりの時間を計測する")
+    parser.add_argument("--calls", type=int, default=200_000, help="バックエンドの呼び出し回数")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--max-keys", type=int, default=settings.RATE_LIMIT_MAX_KEYS)
+    parser.add_argument("--requests", type=int, default=2000, help="リクエストの計測回数（0 で省略）")
+    args = parser.parse_args()
+
+    print(f"バックエンド: {args.calls:,}回 / キー数の上限 {args.max_keys:,}\n")
+    print(f"{'キー数':<12}" + "".join(f"{f'{threads}スレッド':>14}" for threads in args.threads))
+    for keys in (1, 1000, args.max_keys * 2):
+        row = "".join(
+            f"{bench_backend(keys, threads, args.calls, args.max_keys):>12.2f}us" for threads in args.threads
+        )
+        print(f"{keys:<12,}{row}")
+
+    if args.requests:
+        bench_requests(args.requests)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+お困りごとの削除（app/api/troubles/deletion.py）のベンチマーク
+
+SQLite のファイルにメッセージの多いスレッド（既定 10万件）を作成し、削除の経路ごとに時間を比較する。
+
+- 1文の DELETE: メッセージを1回の DELETE で削除する場合（比較用。ロックを長く保持する）
+- チャンク削除: TROUBLE_SOFT_DELETE_ENABLED が無効な場合の delete_trouble（リクエスト内でチャンクごとにコミット）
+- 論理削除: 有効な場合の delete_trouble の応答時間と、その後の TroublePurger による物理削除の時間
+  （最長トランザクションは、1チャンクの削除とコミットにかかった時間の最大値）
+
+    python benchmarks/trouble_deletion.py                       # 10万件
+    python benchmarks/trouble_deletion.py --messages 200000 --chunk-size 2000
+
+MySQL で計測する場合は DATABASE_URL に接続URLを指定する（テーブルは作成され、作成したデータは削除される）
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Callable
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+DEFAULT_DATABASE = os.path.join(tempfile.gettempdir(), "collabogames_trouble_deletion.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DEFAULT_DATABASE}")
+
+from sqlalchemy import delete, event, func, insert  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.core.database import DEFAULT_SHARD, Base, SessionLocal, engine  # noqa: E402
+from app.api.users.models import User  # noqa: E402
+from app.api.projects.models import Project  # noqa: E402
+from app.api.points import models as point_models  # noqa: E402,F401（リレーションの解決に必要）
+from app.api.troubles import deletion  # noqa: E402
+from app.api.troubles.models import Trouble  # noqa: E402
+from app.api.messages.models import Message, TroubleReadMarker  # noqa: E402
+from app.models import outbox as outbox_models  # noqa: E402,F401
+
+READERS = 50
+
+
+def create_thread(db: Session, messages: int, batch_size: int = 20000) -> Trouble:
+    """messages 件のメッセージと READERS 人分の既読位置を持つお困りごとを作成する"""
+    if db.get(User, 1) is None:
+        db.execute(insert(User.__table__), [
+            {"user_id": user_id, "name": f"bench{user_id}", "password": "x"} for user_id in range(1, READERS + 1)
+        ])
+        db.execute(insert(Project.__table__), [{"title": "bench", "description": "benchmark", "creator_user_id": 1}])
+    project_id = db.query(func.min(Project.project_id)).scalar()
+    trouble = Trouble(title="long thread", description="benchmark", category="IT", project_id=project_id, author_id=1)
+    db.add(trouble)
+    db.flush()
+    for start in range(0, messages, batch_size):
+        db.execute(insert(Message.__table__), [
+            {"content": f"message {i}", "user_id": i % READERS + 1, "trouble_id": trouble.id}
+            for i in range(start, min(start + batch_size, messages))
+        ])
+    db.execute(insert(TroubleReadMarker.__table__), [
+        {"user_id": user_id, "trouble_id": trouble.id, "last_read_message_id": 0, "read_count": 0}
+        for user_id in range(1, READERS + 1)
+    ])
+    db.commit()
+    return trouble
+
+
+class CommitTimer:
+    """コミット間隔（＝1トランザクションの長さ）の最大値を記録する"""
+
+    def __init__(self):
+        self.longest = 0.0
+        self._started = time.perf_counter()
+
+    def __enter__(self):
+        event.listen(engine, "commit", self._on_commit)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        event.remove(engine, "commit", self._on_commit)
+
+    def _on_commit(self, conn):
+        now = time.perf_counter()
+        self.longest = max(self.longest, now - self._started)
+        self._started = now
+
+
+def report(label: str, elapsed: float, longest: float, left: int) -> None:
+    print(f"{label:<20}{elapsed * 1000:>10.1f}ms{longest * 1000:>14.1f}ms{left:>8}")
+
+
+def remaining(db: Session, trouble_id: int) -> int:
+    return db.query(func.count(Message.id)).filter(Message.trouble_id == trouble_id).scalar()
+
+
+def measure(label: str, db: Session, trouble_id: int, run: Callable[[], None]) -> None:
+    """run の時間と最長トランザクションを計測し、残ったメッセージ数とあわせて表示する"""
+    with CommitTimer() as timer:
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+    report(label, elapsed, timer.longest, remaining(db, trouble_id))
+    db.expunge_all()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="お困りごとの削除の時間を経路ごとに計測する")
+    parser.add_argument("--messages", type=int, default=100_000, help="スレッドのメッセージ数")
+    parser.add_argument("--chunk-size", type=int, default=settings.TROUBLE_DELETE_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(engine)
+    settings.TROUBLE_DELETE_CHUNK_SIZE = args.chunk_size
+    purger = deletion.TroublePurger(chunk_size=args.chunk_size, session_factories={DEFAULT_SHARD: SessionLocal})
+    print(f"メッセージ {args.messages:,}件 / チャンク {args.chunk_size:,}件 / 既読位置 {READERS}件\n")
+    print(f"{'経路':<20}{'時間':>12}{'最長トランザクション':>10}{'残り':>6}")
+
+    db = SessionLocal()
+    try:
+        # 比較用: メッセージを1回の DELETE で削除する
+        trouble = create_thread(db, args.messages)
+
+        def single_statement() -> None:
+            db.execute(delete(Message.__table__).where(Message.trouble_id == trouble.id))
+            db.execute(delete(TroubleReadMarker.__table__).where(TroubleReadMarker.trouble_id == trouble.id))
+            db.execute(delete(Trouble.__table__).where(Trouble.id == trouble.id))
+            db.commit()
+
+        measure("1文の DELETE", db, trouble.id, single_statement)
+
+        # リクエスト内でチャンクごとに削除する
+        settings.TROUBLE_SOFT_DELETE_ENABLED = False
+        trouble = create_thread(db, args.messages)
+        payload = {"id": trouble.id, "project_id": trouble.project_id}
+        measure("チャンク削除", db, trouble.id, lambda: deletion.delete_trouble(db, trouble, payload))
+
+        # 論理削除して応答し、バックグラウンドで物理削除する
+        settings.TROUBLE_SOFT_DELETE_ENABLED = True
+        trouble = create_thread(db, args.messages)
+        payload = {"id": trouble.id, "project_id": trouble.project_id}
+        trouble_id = trouble.id
+        measure("論理削除（応答）", db, trouble_id, lambda: deletion.delete_trouble(db, trouble, payload))
+        measure("論理削除（物理削除）", db, trouble_id, purger.purge_pending)
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
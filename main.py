@@ -1,6 +1,6 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
 import sys
 import os
 
@@ -13,28 +13,69 @@ from app.api.projects import models as project_models
 from app.api.users import models as user_models
 from app.api.troubles import models as trouble_models
 from app.api.messages import models as message_models  # メッセージ関連があれば
-
-# ───────── ルーターのインポート ─────────
-try:
-    from app.api.projects.router import router as projects_router
-    from app.api.users.router import router as users_router
-    from app.api.auth.router import router as auth_router
-    from app.api.troubles.router import router as troubles_router
-    from app.api.messages.router import router as messages_router
-except ImportError as e:
-    print(f"インポートエラー: {e}")
-    print(f"現在のパス: {sys.path}")
-    raise
+from app.api.auth import models as auth_models
+from app.api.points import models as point_models
+from app.models import outbox as outbox_models
+from app.models import shard as shard_models
+from app.models import idempotency as idempotency_models
+from app.api.notifications import models as notification_models
+from app.api.analytics import models as analytics_models
 
 # ───────── データベース関連のインポート ─────────
-from app.core.database import engine, Base
+from app.core.database import DEFAULT_SHARD, engine, Base, create_shard_tables, shard_registry, upgrade_tables
+from app.core.rate_limit import RateLimitHeadersMiddleware, rate_limit
+from app.core.compression import CompressionMiddleware, get_compression_stats
+from app.core.idempotency import IdempotencyMiddleware
+from app.core.resilience import (
+    DATABASE_FAILURES, StaleResponseCache, StaleResponseMiddleware, database_error_handler,
+)
+from app.core.profiling import ProfilingMiddleware, install_sql_timeline, profile_store, require_profiling_token
+from app.core.config import settings
+from app.core.token_denylist import token_denylist
+from app.api.auth.jwt import revoked_token_sync
+from app.services.write_behind import write_behind
+from app.services.outbox import outbox_dispatcher
+from app.services.idempotency import idempotency_store, idempotency_pruner
 from sqlalchemy import inspect
+import importlib
 
 app = FastAPI(
     title="CollaboGames Backend API",
     description="コラボゲームズのバックエンドAPIサービス",
-    version="0.1.0"
+    version="0.1.0",
+    dependencies=[Depends(rate_limit)]  # 全エンドポイントにレート制限を適用
+)
+
+# ───────── 冪等性キーミドルウェアの設定 ─────────
+# 最も内側に置き、保存する応答は圧縮前・CORS ヘッダー付与前のものにする
+if settings.IDEMPOTENCY_ENABLED:
+    app.add_middleware(
+        IdempotencyMiddleware,
+        store=idempotency_store,
+        paths=[path.strip() for path in settings.IDEMPOTENCY_PATHS.split(",") if path.strip()],
+        max_body_bytes=settings.IDEMPOTENCY_MAX_BODY_BYTES,
+    )
+
+# ───────── DB 障害時の縮退運転 ─────────
+# 接続断・タイムアウトなどの DB エラーは 503 で返し、参照系の GET はブレーカーが開いている間・503 の場合に前回の応答を返す
+for exception_class in DATABASE_FAILURES:
+    app.add_exception_handler(exception_class, database_error_handler)
+stale_responses = StaleResponseCache(
+    max_entries=settings.DB_STALE_MAX_ENTRIES,
+    max_age_seconds=settings.DB_STALE_MAX_AGE_SECONDS,
+    max_bytes=settings.DB_STALE_MAX_BYTES,
 )
+if settings.DB_BREAKER_ENABLED:
+    app.add_middleware(
+        StaleResponseMiddleware,
+        breaker=shard_registry.breaker(DEFAULT_SHARD),
+        cache=stale_responses,
+        paths=[path.strip() for path in settings.DB_STALE_PATHS.split(",") if path.strip()],
+    )
+
+# ───────── レート制限ヘッダーの付与 ─────────
+# 冪等性キーの保存・縮退運転の応答より外側に置き、再送した応答にも現在の残量を付ける
+app.add_middleware(RateLimitHeadersMiddleware)
 
 # ───────── CORSミドルウェアの設定 ─────────
 app.add_middleware(
@@ -43,8 +84,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # すべてのHTTPメソッドを許可
     allow_headers=["*"],  # すべてのヘッダーを許可
+    # レート制限ヘッダーをフロントエンドから参照できるようにする
+    expose_headers=["RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "Retry-After"],
 )
 
+# ───────── 圧縮ミドルウェアの設定 ─────────
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        cache_max_bytes=settings.COMPRESSION_CACHE_MAX_BYTES,
+    )
+
+# ───────── プロファイリング（DEBUG モードのみ） ─────────
+if settings.DEBUG:
+    for shard_name in shard_registry.names():
+        install_sql_timeline(shard_registry.engine(shard_name))
+    app.add_middleware(
+        ProfilingMiddleware,
+        interval_ms=settings.PROFILING_SAMPLE_INTERVAL_MS,
+        token=settings.PROFILING_TOKEN,
+    )
+
 # ───────── Startup イベント：テーブル自動生成 ─────────
 @app.on_event("startup")
 async def startup_event():
@@ -54,7 +115,58 @@ async def startup_event():
         print("テーブル 'user_project_favorites' が存在しません。テーブルを作成します。")
         Base.metadata.create_all(bind=engine)
     else:
-        print("テーブルは既に存在しています。スキーマ変更は行いません。")
+        # 後から追加されたテーブルを作成し、既存のテーブルには後から追加した列・インデックスだけを追加する
+        missing_tables = [t for t in Base.metadata.sorted_tables if not inspector.has_table(t.name)]
+        if missing_tables:
+            print(f"不足しているテーブルを作成します: {[t.name for t in missing_tables]}")
+            Base.metadata.create_all(bind=engine, tables=missing_tables)
+        else:
+            print("テーブルは既に存在しています。")
+        upgrade_tables(engine, Base.metadata)
+
+    # 既定以外のシャードにはお困りごと・メッセージ関連のテーブルだけを作成する
+    create_shard_tables()
+
+    # 失効済みトークンをデナイリストに復元
+    from app.core.database import SessionLocal
+    from app.api.auth.jwt import load_revoked_tokens
+    db = SessionLocal()
+    try:
+        load_revoked_tokens(db)
+        print(f"失効済みトークンを読み込みました: {len(token_denylist)}件")
+    except Exception as e:
+        print(f"失効済みトークンの読み込みエラー: {str(e)}")
+        db.rollback()
+    finally:
+        db.close()
+    # 以降に他のプロセスで失効させたトークンを定期的に取り込む
+    revoked_token_sync.start()
+
+    # バックグラウンド書き込みキューを起動（スプールに残った書き込みも復元される）
+    if settings.WRITE_BEHIND_ENABLED:
+        write_behind.start()
+
+    # 変更イベント（アウトボックス）の配信スレッドを起動
+    if settings.OUTBOX_DISPATCH_ENABLED:
+        outbox_dispatcher.start()
+
+    # 保存期間を過ぎた冪等性キーを削除するスレッドを起動
+    if settings.IDEMPOTENCY_ENABLED:
+        idempotency_pruner.start()
+
+    # 有効なルーターのバックグラウンド処理を起動（WORKERS）
+    for worker in workers:
+        worker.start()
+
+# ───────── Shutdown イベント：未反映の書き込みを反映 ─────────
+@app.on_event("shutdown")
+async def shutdown_event():
+    for worker in reversed(workers):
+        worker.stop()
+    idempotency_pruner.stop()
+    outbox_dispatcher.stop()
+    revoked_token_sync.stop()
+    write_behind.stop()
 
 async def startup_db_client():
     try:
@@ -70,15 +182,121 @@ async def startup_db_client():
         traceback.print_exc()
 
 # ───────── 各種ルーターの追加 ─────────
-app.include_router(auth_router, prefix="/api/auth", tags=["認証"])
-app.include_router(users_router, prefix="/api/users", tags=["ユーザー"])
-app.include_router(projects_router, prefix="/api/projects", tags=["プロジェクト"])
-app.include_router(troubles_router, prefix="/api/troubles", tags=["お困りごと"])
-app.include_router(messages_router, prefix="/api/messages", tags=["メッセージ"])
+# (名前, モジュール, プレフィックス, タグ)。API_ROUTERS で指定したルーターのモジュールだけをインポートして登録する
+# （用途別にインスタンスを分ける場合、使わないルーターとその依存モジュールの読み込みを省いて起動を速くする）
+ROUTERS = [
+    ("auth", "app.api.auth.router", "/api/auth", "認証"),
+    ("users", "app.api.users.router", "/api/users", "ユーザー"),
+    ("projects", "app.api.projects.router", "/api/projects", "プロジェクト"),
+    ("troubles", "app.api.troubles.router", "/api/troubles", "お困りごと"),
+    ("messages", "app.api.messages.router", "/api/messages", "メッセージ"),
+    ("points", "app.api.points.router", "/api/points", "ポイント"),
+    ("batch", "app.api.batch.router", "/api/batch", "一括取得"),
+    ("notifications", "app.api.notifications.router", "/api/notifications", "通知"),
+    ("analytics", "app.api.analytics.router", "/api/analytics", "分析"),
+]
+
+# ルーターごとのバックグラウンド処理 (ルーター名, モジュール, 変数名, 起動する設定名。None の場合は常に起動)
+# ルーターが有効な場合だけインポートし（インポート時にアウトボックスのコンシューマーが登録されるものを含む）、
+# 設定が有効なものを startup で上から順に起動する
+WORKERS = [
+    # 論理削除済みのお困りごとを物理削除する（削除途中のものがあれば再開される）
+    ("troubles", "app.api.troubles.deletion", "trouble_purger", None),
+    # 書き込みの止まったスレッドのメッセージを定期的にアーカイブ
+    ("messages", "app.api.messages.archive", "message_archiver", "MESSAGE_ARCHIVE_ENABLED"),
+    # 類似お困りごとのシグネチャ作成（既存データ分）と重複レポートの更新
+    ("troubles", "app.api.troubles.similarity", "duplicate_reporter", "TROUBLE_SIMILARITY_ENABLED"),
+    # お気に入りの共起によるプロジェクトのおすすめを計算し、変化があれば定期的に作り直す
+    ("projects", "app.api.projects.recommendations", "recommendation_refresher", "RECOMMENDATIONS_ENABLED"),
+    # プロジェクト一覧の並び替え用の集計値（カテゴリーの移し替え・お気に入り数）の更新
+    ("projects", "app.api.projects.stats", "project_stats_refresher", "PROJECT_STATS_ENABLED"),
+    # 通知のダイジェスト作成・配信（通知の記録はアウトボックスの配信スレッドで行う）
+    ("notifications", "app.api.notifications.service", "notification_digester", "NOTIFICATIONS_ENABLED"),
+    # 分析用の集計（前回の位置から差分だけ集計テーブルに反映する）
+    ("analytics", "app.api.analytics.rollup", "analytics_rollup", "ANALYTICS_ROLLUP_ENABLED"),
+]
+
+def enabled_routers(names: str) -> set:
+    """API_ROUTERS で指定されたルーター名（空の場合はすべて）"""
+    enabled = {name.strip() for name in names.split(",") if name.strip()}
+    unknown = enabled - {name for name, _, _, _ in ROUTERS}
+    if unknown:
+        print(f"API_ROUTERS に不明なルーターが指定されています: {sorted(unknown)}")
+    return enabled or {name for name, _, _, _ in ROUTERS}
+
+def import_module(module_name: str):
+    try:
+        return importlib.import_module(module_name)
+    except ImportError as e:
+        print(f"インポートエラー: {e}")
+        print(f"現在のパス: {sys.path}")
+        raise
+
+def include_routers(app: FastAPI, enabled: set) -> None:
+    """有効なルーターをインポートして登録する"""
+    for name, module_name, prefix, tag in ROUTERS:
+        if name in enabled:
+            app.include_router(import_module(module_name).router, prefix=prefix, tags=[tag])
+
+def load_workers(enabled: set) -> list:
+    """有効なルーターのバックグラウンド処理をインポートし、起動するものを返す"""
+    loaded = []
+    for router_name, module_name, attribute, setting_name in WORKERS:
+        if router_name not in enabled:
+            continue
+        worker = getattr(import_module(module_name), attribute)
+        if setting_name is None or getattr(settings, setting_name):
+            loaded.append(worker)
+    return loaded
+
+routers = enabled_routers(settings.API_ROUTERS)
+include_routers(app, routers)
+workers = load_workers(routers)
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to CollaboGames Backend API"}
 
+# ───────── デバッグ用エンドポイント ─────────
+if settings.DEBUG:
+    @app.get("/debug/compression-stats", include_in_schema=False)
+    def compression_stats():
+        """ルートごとの圧縮統計（CPU 時間と削減バイト数）"""
+        return get_compression_stats()
+
+    @app.get("/debug/db-health", include_in_schema=False)
+    def db_health():
+        """シャードごとのサーキットブレーカーの状態と、古い応答の保持状況"""
+        return {
+            "breakers": {name: shard_registry.breaker(name).stats() for name in shard_registry.names()},
+            "stale_responses": stale_responses.stats(),
+        }
+
+    @app.get("/debug/profiles", include_in_schema=False, dependencies=[Depends(require_profiling_token)])
+    def list_profiles():
+        """記録済みのプロファイル一覧（新しい順）"""
+        return profile_store.list()
+
+    @app.get("/debug/profiles/{profile_id}", include_in_schema=False, dependencies=[Depends(require_profiling_token)])
+    def get_profile(profile_id: str):
+        """プロファイルのレポート（関数ごとのサンプル数と SQL タイムライン）"""
+        profile = profile_store.get(profile_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="プロファイルが見つかりません")
+        return profile.report()
+
+    @app.get("/debug/profiles/{profile_id}/flamegraph", include_in_schema=False, dependencies=[Depends(require_profiling_token)])
+    def get_profile_flamegraph(profile_id: str):
+        """フレームグラフ用の collapsed stack 形式でダウンロードする"""
+        profile = profile_store.get(profile_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="プロファイルが見つかりません")
+        return PlainTextResponse(
+            profile.collapsed_stacks(),
+            headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'},
+        )
+
 if __name__ == "__main__":
+    # サーバーとして起動する場合だけ必要なため、ここでインポートする
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
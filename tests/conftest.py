@@ -0,0 +1,60 @@
+"""
+テスト共通の設定
+
+アプリのモジュールは読み込み時に接続先を決めるため、インポートより前に
+一時ディレクトリの SQLite ファイルを使うよう環境変数を設定する
+（既定のデータベースのほかに shard1・shard2 の2つのシャードを設定する。新規プロジェクトは既定のデータベースに置かれる）
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+TEST_DIR = tempfile.mkdtemp(prefix="collabogames_test_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEST_DIR, 'default.db')}"
+os.environ["SHARD_DATABASE_URLS"] = ",".join(
+    f"{name}=sqlite:///{os.path.join(TEST_DIR, name + '.db')}" for name in ("shard1", "shard2")
+)
+os.environ["WRITE_BEHIND_SPOOL_PATH"] = os.path.join(TEST_DIR, "write_behind_spool.db")
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+from sqlalchemy import delete  # noqa: E402
+
+from app.core.database import Base, engine, create_shard_tables, shard_metadata, shard_registry, DEFAULT_SHARD  # noqa: E402
+from app.core.query_cache import query_cache  # noqa: E402
+# 全モデルを Base.metadata に登録する（main.py と同じ）
+from app.api.projects import models as project_models  # noqa: E402,F401
+from app.api.users import models as user_models  # noqa: E402,F401
+from app.api.troubles import models as trouble_models  # noqa: E402,F401
+from app.api.messages import models as message_models  # noqa: E402,F401
+from app.api.auth import models as auth_models  # noqa: E402,F401
+from app.api.points import models as point_models  # noqa: E402,F401
+from app.models import outbox as outbox_models  # noqa: E402,F401
+from app.models import shard as shard_models  # noqa: E402,F401
+from app.models import idempotency as idempotency_models  # noqa: E402,F401
+from app.api.notifications import models as notification_models  # noqa: E402,F401
+from app.api.analytics import models as analytics_models  # noqa: E402,F401
+
+
+@pytest.fixture(scope="session", autouse=True)
+def tables():
+    """既定のデータベースとシャードにテーブルを作成する"""
+    Base.metadata.create_all(bind=engine)
+    create_shard_tables()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def clean_tables(tables):
+    """テストごとに全シャードの行とクエリ結果キャッシュを削除する（採番の位置はそのまま）"""
+    yield
+    for name in shard_registry.names():
+        metadata = Base.metadata if name == DEFAULT_SHARD else shard_metadata()
+        with shard_registry.engine(name).begin() as conn:
+            for table in reversed(metadata.sorted_tables):
+                conn.execute(delete(table))
+    query_cache.clear()
@@ -0,0 +1,94 @@
+"""
+変更イベントの配信（app/services/outbox.py）の欠番の扱いのテスト
+
+欠番を待つ時間を過ぎて先へ進んだ後も、飛ばした欠番が遅れてコミットされた場合は
+探す期間内であれば配信されることと、期間を過ぎた欠番は記録から外れることを確認する
+"""
+import json
+
+from app.core.database import DEFAULT_SHARD, SessionLocal
+from app.models.outbox import OutboxConsumerOffset, OutboxEvent
+from app.services.outbox import OutboxDispatcher
+
+CONSUMER = "test-consumer"
+
+
+def make_dispatcher(delivered: list, gap_timeout: float = 0.0, gap_rescan: float = 600.0) -> OutboxDispatcher:
+    dispatcher = OutboxDispatcher(gap_timeout=gap_timeout, gap_rescan=gap_rescan,
+                                  session_factories={DEFAULT_SHARD: SessionLocal})
+    dispatcher.register(CONSUMER, lambda db, events: delivered.extend(event.id for event in events))
+    return dispatcher
+
+
+def add_events(*event_ids: int) -> None:
+    db = SessionLocal()
+    try:
+        db.add_all([
+            OutboxEvent(id=event_id, aggregate_type="trouble", aggregate_id=event_id, event_type="created", payload="{}")
+            for event_id in event_ids
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def consumer_offset() -> tuple:
+    db = SessionLocal()
+    try:
+        offset = db.get(OutboxConsumerOffset, CONSUMER)
+        return offset.last_event_id, sorted(int(event_id) for event_id in json.loads(offset.skipped_ids or "{}"))
+    finally:
+        db.close()
+
+
+def test_dispatch_stops_before_gap_until_timeout():
+    delivered = []
+    dispatcher = make_dispatcher(delivered, gap_timeout=60)
+    add_events(1, 2, 4)
+
+    assert dispatcher.dispatch() == 2
+    assert dispatcher.dispatch() == 0
+    assert delivered == [1, 2]
+    assert consumer_offset() == (2, [])
+
+    # 欠番が埋まれば続きを配信する
+    add_events(3)
+    assert dispatcher.dispatch() == 2
+    assert delivered == [1, 2, 3, 4]
+    assert consumer_offset() == (4, [])
+
+
+def test_skipped_event_committed_late_is_delivered():
+    delivered = []
+    dispatcher = make_dispatcher(delivered)
+    add_events(1, 4, 5)
+
+    assert dispatcher.dispatch() == 3
+    assert delivered == [1, 4, 5]
+    assert consumer_offset() == (5, [2, 3])
+
+    # 欠番のトランザクションが遅れてコミットされた
+    add_events(3, 6)
+    assert dispatcher.dispatch() == 2
+    assert delivered == [1, 4, 5, 3, 6]
+    assert consumer_offset() == (6, [2])
+
+    # 同じイベントは再配信しない
+    assert dispatcher.dispatch() == 0
+    assert delivered == [1, 4, 5, 3, 6]
+
+
+def test_skipped_ids_expire_after_rescan_window():
+    delivered = []
+    dispatcher = make_dispatcher(delivered, gap_rescan=0.0)
+    add_events(1, 3)
+
+    assert dispatcher.dispatch() == 2
+    assert consumer_offset() == (3, [2])
+
+    # 探す期間を過ぎた欠番は記録から外れ、その後コミットされても配信しない
+    dispatcher.dispatch()
+    assert consumer_offset() == (3, [])
+    add_events(2)
+    assert dispatcher.dispatch() == 0
+    assert delivered == [1, 3]
@@ -0,0 +1,65 @@
+"""
+おすすめ（app/api/projects/recommendations.py）の favorites_fingerprint のテスト
+
+お気に入りの組み合わせだけが入れ替わった変更（件数・user_id と project_id の合計が変わらない変更）でも
+フィンガープリントが変わり、おすすめとお気に入り数が作り直されることを確認する
+"""
+import pytest
+from sqlalchemy import delete, insert
+
+from app.core.database import SessionLocal
+from app.api.users.models import User
+from app.api.projects.models import Project, UserFavoriteProject
+from app.api.projects.recommendations import favorites_fingerprint
+
+favorites_table = UserFavoriteProject.__table__
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    session.execute(insert(User.__table__), [
+        {"user_id": user_id, "name": f"user{user_id}", "password": "x"} for user_id in (1, 2, 3)
+    ])
+    session.execute(insert(Project.__table__), [
+        {"project_id": project_id, "title": f"P{project_id}", "description": "project", "creator_user_id": 1}
+        for project_id in (1, 2, 3)
+    ])
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def replace_favorites(db, removed, added) -> None:
+    for user_id, project_id in removed:
+        db.execute(delete(favorites_table).where(
+            favorites_table.c.user_id == user_id, favorites_table.c.project_id == project_id,
+        ))
+    if added:
+        db.execute(insert(favorites_table), [{"user_id": u, "project_id": p} for u, p in added])
+    db.commit()
+
+
+def test_fingerprint_changes_when_pairs_are_swapped(db):
+    replace_favorites(db, [], [(1, 2), (3, 3)])
+    before = favorites_fingerprint(db)
+
+    # (1, 2) を外して (2, 1) を追加する（件数・user_id と project_id の合計は同じ）
+    replace_favorites(db, [(1, 2)], [(2, 1)])
+    after = favorites_fingerprint(db)
+    assert after[0] == before[0]
+    assert after != before
+
+    # 2組の project_id を入れ替える
+    replace_favorites(db, [(2, 1), (3, 3)], [(2, 3), (3, 1)])
+    assert favorites_fingerprint(db) != after
+
+    # 元に戻せば同じ値になる
+    replace_favorites(db, [(2, 3), (3, 1)], [(1, 2), (3, 3)])
+    assert favorites_fingerprint(db) == before
+
+
+def test_fingerprint_of_no_favorites(db):
+    assert favorites_fingerprint(db) == (0, 0, 0)
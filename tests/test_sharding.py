@@ -0,0 +1,193 @@
+"""
+シャーディング（app/core/database.py）のテスト
+
+conftest.py で設定した2つの SQLite シャード（shard1・shard2）を使い、ID の採番範囲・
+ID とプロジェクトからの保存先の解決・全シャード横断のページングとシャードのテーブル作成を確認する
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import inspect, text
+
+from app.core.database import (
+    DEFAULT_SHARD, SHARD_ID_SPACE, SHARDED_TABLES, SessionLocal, ShardSessions,
+    create_shard_tables, fan_out_page, parse_shard_urls, shard_registry,
+)
+from app.api.users.models import User
+from app.api.projects.models import Project
+from app.api.troubles.models import Trouble
+from app.api.messages.models import Message
+from app.models.shard import ProjectShard
+
+SHARDS = ["shard1", "shard2"]
+
+
+@pytest.fixture
+def shards():
+    db = SessionLocal()
+    db.add(User(user_id=1, name="user1", password="x"))
+    db.add_all([
+        Project(project_id=project_id, title=f"P{project_id}", description="project", creator_user_id=1)
+        for project_id in (1, 2, 3)
+    ])
+    db.commit()
+    sessions = ShardSessions(db)
+    try:
+        yield sessions
+    finally:
+        sessions.close()
+        db.close()
+
+
+def add_trouble(sdb, project_id: int, created_at: datetime, title: str = "trouble") -> Trouble:
+    trouble = Trouble(title=title, description="help", category="IT", project_id=project_id, author_id=1,
+                      created_at=created_at)
+    sdb.add(trouble)
+    sdb.commit()
+    return trouble
+
+
+def test_registry_lists_shards_in_configured_order():
+    assert shard_registry.is_sharded
+    assert shard_registry.names() == [DEFAULT_SHARD] + SHARDS
+    assert [shard_registry.id_range_start(name) for name in shard_registry.names()] == [
+        0, SHARD_ID_SPACE, 2 * SHARD_ID_SPACE,
+    ]
+
+
+def test_parse_shard_urls_rejects_duplicates():
+    assert parse_shard_urls(" a=sqlite:///a.db , b=sqlite:///b.db ") == [("a", "sqlite:///a.db"), ("b", "sqlite:///b.db")]
+    with pytest.raises(ValueError):
+        parse_shard_urls("a=sqlite:///a.db,a=sqlite:///b.db")
+    with pytest.raises(ValueError):
+        parse_shard_urls(f"{DEFAULT_SHARD}=sqlite:///a.db")
+    with pytest.raises(ValueError):
+        parse_shard_urls("sqlite:///a.db")
+
+
+def test_ids_are_allocated_from_each_shard_range(shards):
+    now = datetime.utcnow()
+    for index, name in enumerate([DEFAULT_SHARD] + SHARDS):
+        sdb = shards.get(name)
+        first = add_trouble(sdb, 1, now)
+        second = add_trouble(sdb, 1, now)
+        message = Message(content="hello", user_id=1, trouble_id=first.id)
+        sdb.add(message)
+        sdb.commit()
+
+        start = index * SHARD_ID_SPACE
+        assert start < first.id < second.id < start + SHARD_ID_SPACE
+        assert start < message.id < start + SHARD_ID_SPACE
+        for entity_id in (first.id, second.id, message.id):
+            assert shard_registry.shard_for_id(entity_id) == name
+
+
+def test_for_id_routes_to_the_shard_that_stored_the_row(shards):
+    now = datetime.utcnow()
+    stored = {name: add_trouble(shards.get(name), 1, now, title=name).id for name in SHARDS}
+
+    for name, trouble_id in stored.items():
+        sdb = shards.for_id(trouble_id)
+        assert sdb is shards.get(name)
+        assert sdb.query(Trouble.title).filter(Trouble.id == trouble_id).scalar() == name
+
+    # 採番範囲に対応するシャードが無い ID・0 以下の ID
+    assert shards.for_id(len(shard_registry.names()) * SHARD_ID_SPACE + 1) is None
+    assert shards.for_id(0) is None
+
+    groups = {
+        sdb.info["shard"]: ids
+        for sdb, ids in shards.group_by_id([stored["shard2"], 5, stored["shard1"], stored["shard2"] + 1])
+    }
+    assert groups == {
+        "shard2": [stored["shard2"], stored["shard2"] + 1],
+        DEFAULT_SHARD: [5],
+        "shard1": [stored["shard1"]],
+    }
+
+
+def test_projects_are_assigned_and_resolved_through_the_mapping_table(shards, monkeypatch):
+    monkeypatch.setattr(shard_registry, "_new_project_shards", list(SHARDS))
+    db = shards.db
+    assigned = {project_id: shard_registry.assign_new_project(db, project_id) for project_id in (1, 2)}
+    db.commit()
+
+    # プロジェクトIDで振り分ける（2 → shard1, 1 → shard2）
+    assert assigned == {1: "shard2", 2: "shard1"}
+    assert dict(db.query(ProjectShard.project_id, ProjectShard.shard).all()) == assigned
+    for project_id, name in assigned.items():
+        assert shards.for_project(project_id) is shards.get(name)
+    # 対応表に無いプロジェクトは既定のデータベース
+    assert shards.for_project(3) is shards.db
+
+    groups = {sdb.info["shard"]: ids for sdb, ids in shards.group_by_project([1, 2, 3])}
+    assert groups == {"shard2": [1], "shard1": [2], DEFAULT_SHARD: [3]}
+
+
+def test_unknown_new_project_shard_is_rejected():
+    with pytest.raises(ValueError):
+        shard_registry.set_new_project_shards(["missing"])
+
+
+def test_fan_out_page_merges_shards_by_created_at(shards):
+    started = datetime(2024, 1, 1)
+    # 作成日時がシャードをまたいで交互になるように作成する
+    expected = []
+    for i in range(15):
+        name = ([DEFAULT_SHARD] + SHARDS)[i % 3 if i % 5 else 1]
+        trouble = add_trouble(shards.get(name), 1, started + timedelta(minutes=i), title=f"t{i}")
+        expected.append(trouble.id)
+    expected.reverse()
+
+    def build_query(sdb):
+        return sdb.query(Trouble).order_by(Trouble.created_at.desc())
+
+    sessions = shards.all()
+    seen = []
+    for skip in range(0, 20, 4):
+        page, total = fan_out_page(sessions, build_query, lambda t: t.created_at, skip, 4)
+        assert total == 15
+        assert [t.created_at for t in page] == sorted((t.created_at for t in page), reverse=True)
+        seen.extend(t.id for t in page)
+
+    # ページを続けて取得すると、全シャードの行が作成日時の降順に重複・欠落なく1回ずつ現れる
+    assert seen == expected
+
+    # 1ページで全件を取得した場合と、各シャードが1件しか返さない位置のページ
+    everything, _ = fan_out_page(sessions, build_query, lambda t: t.created_at, 0, 100)
+    assert [t.id for t in everything] == expected
+    last, _ = fan_out_page(sessions, build_query, lambda t: t.created_at, 14, 5)
+    assert [t.id for t in last] == expected[14:]
+
+
+def test_fan_out_page_with_one_shard_uses_offset(shards):
+    sdb = shards.get("shard1")
+    ids = [add_trouble(sdb, 1, datetime(2024, 1, 1) + timedelta(minutes=i)).id for i in range(5)]
+
+    page, total = fan_out_page([sdb], lambda s: s.query(Trouble).order_by(Trouble.created_at.desc()),
+                               lambda t: t.created_at, 1, 2)
+
+    assert total == 5
+    assert [t.id for t in page] == [ids[3], ids[2]]
+
+
+def test_create_shard_tables_creates_only_sharded_tables_without_foreign_keys():
+    for name in SHARDS:
+        inspector = inspect(shard_registry.engine(name))
+        tables = set(inspector.get_table_names()) - {"sqlite_sequence"}
+        assert tables == set(SHARDED_TABLES)
+        for table in SHARDED_TABLES:
+            for foreign_key in inspector.get_foreign_keys(table):
+                assert foreign_key["referred_table"] in SHARDED_TABLES
+
+
+def test_create_shard_tables_is_idempotent_and_keeps_id_ranges(shards):
+    create_shard_tables()
+
+    for index, name in enumerate(SHARDS, start=1):
+        with shard_registry.engine(name).connect() as conn:
+            sequences = dict(conn.execute(text("SELECT name, seq FROM sqlite_sequence")).all())
+        assert sequences["troubles"] >= index * SHARD_ID_SPACE
+        assert sequences["messages"] >= index * SHARD_ID_SPACE
+        trouble = add_trouble(shards.get(name), 1, datetime.utcnow())
+        assert shard_registry.shard_for_id(trouble.id) == name
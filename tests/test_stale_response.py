@@ -0,0 +1,113 @@
+"""
+DB 障害時の古い応答での代替（app/core/resilience.py の StaleResponseMiddleware）のテスト
+
+1回で送られた上限以下の 200 だけを保持し、認証付きの応答はトークンではなくユーザーIDごとに保持すること、
+ストリーミング・大きな応答はそのまま流すこと、保持する応答の合計バイト数に上限があることを確認する
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core.resilience import STALE_HEADER, StaleResponseCache, StaleResponseMiddleware
+from app.core.security import create_access_token
+
+MAX_BODY_BYTES = 1024
+
+
+class Breaker:
+    """開閉をテストから切り替えるブレーカー"""
+
+    def __init__(self):
+        self.open = False
+
+    def is_open(self) -> bool:
+        return self.open
+
+
+@pytest.fixture
+def server():
+    state = {"status": 200, "calls": 0}
+    breaker = Breaker()
+    cache = StaleResponseCache(max_entries=100, max_bytes=4096)
+    app = FastAPI()
+
+    @app.get("/items")
+    def items():
+        state["calls"] += 1
+        if state["status"] == 503:
+            return JSONResponse({"detail": "unavailable"}, status_code=503)
+        return JSONResponse({"version": state["calls"]})
+
+    @app.get("/large")
+    def large():
+        return PlainTextResponse("x" * (MAX_BODY_BYTES + 1))
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([b"first,", b"second"]), media_type="text/plain")
+
+    app.add_middleware(StaleResponseMiddleware, breaker=breaker, cache=cache,
+                       paths=["/items", "/large", "/stream"], max_body_bytes=MAX_BODY_BYTES)
+    return TestClient(app), state, breaker, cache
+
+
+def bearer(user_id: int) -> dict:
+    return {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+
+
+def test_successful_response_is_served_while_breaker_is_open(server):
+    client, state, breaker, cache = server
+    assert client.get("/items").json() == {"version": 1}
+
+    breaker.open = True
+    response = client.get("/items")
+    assert response.json() == {"version": 1}
+    assert response.headers[STALE_HEADER] == "true"
+    assert state["calls"] == 1
+
+    # DB エラーの 503 も保持している応答に差し替える
+    breaker.open = False
+    state["status"] = 503
+    response = client.get("/items")
+    assert response.status_code == 200
+    assert response.json() == {"version": 1}
+
+
+def test_authenticated_responses_are_kept_per_user_not_per_token(server):
+    client, state, breaker, cache = server
+    first_token = bearer(1)
+    client.get("/items", headers=first_token)
+    client.get("/items", headers=bearer(2))
+    client.get("/items", headers=bearer(1))
+    assert cache.stats()["entries"] == 2
+
+    breaker.open = True
+    # 同じユーザーの別のトークンでも、そのユーザーの最新の応答を返す
+    assert client.get("/items", headers=first_token).json() == {"version": 3}
+    assert client.get("/items", headers=bearer(2)).json() == {"version": 2}
+
+    # 検証できないトークンには返さない
+    breaker.open = False
+    state["status"] = 503
+    assert client.get("/items", headers={"Authorization": "Bearer invalid"}).status_code == 503
+
+
+def test_streamed_and_large_responses_are_passed_through(server):
+    client, state, breaker, cache = server
+    assert client.get("/stream").text == "first,second"
+    assert client.get("/large").text == "x" * (MAX_BODY_BYTES + 1)
+    assert cache.stats()["entries"] == 0
+
+
+def test_cache_is_bounded_by_total_bytes():
+    cache = StaleResponseCache(max_entries=100, max_bytes=1000)
+    for i in range(5):
+        cache.put(str(i), 200, [], b"x" * 300)
+    assert cache.stats()["entries"] == 3
+    assert cache.stats()["bytes"] == 900
+    assert cache.get("0") is None and cache.get("4") is not None
+
+    # 上限より大きい応答は保持しない
+    cache.put("big", 200, [], b"x" * 1001)
+    assert cache.get("big") is None
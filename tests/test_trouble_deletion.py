@@ -0,0 +1,154 @@
+"""
+お困りごとの削除（app/api/troubles/deletion.py）のテスト
+
+メッセージの多いスレッドを作成し、即時削除・チャンク削除・論理削除＋TroublePurger の
+いずれの経路でも、メッセージ・既読位置・シグネチャ・アーカイブの行が残らないことを確認する
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, insert
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.api.users.models import User
+from app.api.projects.models import Project
+from app.api.troubles import deletion
+from app.api.troubles.models import Trouble, TroubleDuplicate, TroubleLshBucket, TroubleSignature
+from app.api.messages.models import Message, MessageArchive, TroubleReadMarker
+
+READERS = 5
+CHUNK_SIZE = 500
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def create_thread(db, messages: int) -> Trouble:
+    """messages 件のメッセージと、既読位置・シグネチャ・重複レポート・アーカイブを持つお困りごとを作成する"""
+    db.execute(insert(User.__table__), [
+        {"user_id": user_id, "name": f"user{user_id}", "password": "x"} for user_id in range(1, READERS + 1)
+    ])
+    db.execute(insert(Project.__table__), [{"project_id": 1, "title": "P", "description": "project", "creator_user_id": 1}])
+    other = Trouble(title="other", description="other", category="IT", project_id=1, author_id=1)
+    trouble = Trouble(title="long thread", description="many messages", category="IT", project_id=1, author_id=1)
+    db.add_all([other, trouble])
+    db.flush()
+
+    db.execute(insert(Message.__table__), [
+        {"content": f"message {i}", "user_id": i % READERS + 1, "trouble_id": trouble.id} for i in range(messages)
+    ])
+    db.execute(insert(Message.__table__), [{"content": "keep", "user_id": 1, "trouble_id": other.id}])
+    db.execute(insert(MessageArchive.__table__), [
+        {"trouble_id": trouble.id, "page_no": page, "first_message_id": 0, "last_message_id": 0,
+         "message_count": 100, "payload": b"x"}
+        for page in range(3)
+    ])
+    db.execute(insert(TroubleReadMarker.__table__), [
+        {"user_id": user_id, "trouble_id": trouble_id, "last_read_message_id": 1, "read_count": 1}
+        for user_id in range(1, READERS + 1) for trouble_id in (trouble.id, other.id)
+    ])
+    db.add_all([
+        TroubleSignature(trouble_id=trouble.id, project_id=1, signature=b"\0" * 8),
+        TroubleLshBucket(project_id=1, band=0, bucket=1, trouble_id=trouble.id),
+        TroubleDuplicate(trouble_id=trouble.id, duplicate_of_id=other.id, project_id=1, similarity=0.9),
+    ])
+    db.commit()
+    return trouble
+
+
+def remaining_rows(db, trouble_id: int) -> dict:
+    """削除したお困りごとに関係する行の残り件数"""
+    def count(model, *conditions):
+        return db.query(func.count()).select_from(model).filter(*conditions).scalar()
+
+    return {
+        "troubles": count(Trouble, Trouble.id == trouble_id),
+        "messages": count(Message, Message.trouble_id == trouble_id),
+        "archives": count(MessageArchive, MessageArchive.trouble_id == trouble_id),
+        "read_markers": count(TroubleReadMarker, TroubleReadMarker.trouble_id == trouble_id),
+        "signatures": count(TroubleSignature, TroubleSignature.trouble_id == trouble_id),
+        "buckets": count(TroubleLshBucket, TroubleLshBucket.trouble_id == trouble_id),
+        "duplicates": count(TroubleDuplicate, TroubleDuplicate.trouble_id == trouble_id),
+    }
+
+
+NOTHING_LEFT = {name: 0 for name in
+                ("troubles", "messages", "archives", "read_markers", "signatures", "buckets", "duplicates")}
+
+
+def assert_other_thread_kept(db):
+    assert db.query(func.count(Trouble.id)).scalar() == 1
+    assert db.query(func.count(Message.id)).scalar() == 1
+    assert db.query(func.count()).select_from(TroubleReadMarker).scalar() == READERS
+
+
+def test_short_thread_is_deleted_in_one_transaction(db, monkeypatch):
+    monkeypatch.setattr(settings, "TROUBLE_DELETE_CHUNK_SIZE", CHUNK_SIZE)
+    trouble = create_thread(db, CHUNK_SIZE - 1)
+    trouble_id = trouble.id
+
+    deletion.delete_trouble(db, trouble, {"id": trouble_id, "project_id": 1})
+
+    assert remaining_rows(db, trouble_id) == NOTHING_LEFT
+    assert_other_thread_kept(db)
+
+
+def test_long_thread_is_deleted_in_chunks(db, monkeypatch):
+    monkeypatch.setattr(settings, "TROUBLE_DELETE_CHUNK_SIZE", CHUNK_SIZE)
+    monkeypatch.setattr(settings, "TROUBLE_SOFT_DELETE_ENABLED", False)
+    trouble = create_thread(db, CHUNK_SIZE * 10 + 1)
+    trouble_id = trouble.id
+
+    deleted = deletion.delete_messages_in_chunks(db, trouble_id, CHUNK_SIZE)
+    assert deleted == CHUNK_SIZE * 10 + 1
+    assert remaining_rows(db, trouble_id)["messages"] == 0
+
+    deletion.delete_trouble(db, trouble, {"id": trouble_id, "project_id": 1})
+
+    assert remaining_rows(db, trouble_id) == NOTHING_LEFT
+    assert_other_thread_kept(db)
+
+
+def test_long_thread_is_soft_deleted_and_purged(db, monkeypatch):
+    monkeypatch.setattr(settings, "TROUBLE_DELETE_CHUNK_SIZE", CHUNK_SIZE)
+    monkeypatch.setattr(settings, "TROUBLE_SOFT_DELETE_ENABLED", True)
+    trouble = create_thread(db, CHUNK_SIZE * 10 + 1)
+    trouble_id = trouble.id
+
+    deletion.delete_trouble(db, trouble, {"id": trouble_id, "project_id": 1})
+
+    # 論理削除の時点では子データは残っている
+    db.expire_all()
+    assert db.query(Trouble.deleted_at).filter(Trouble.id == trouble_id).scalar() is not None
+    assert remaining_rows(db, trouble_id)["messages"] == CHUNK_SIZE * 10 + 1
+
+    purged = deletion.TroublePurger(chunk_size=CHUNK_SIZE).purge_pending()
+
+    assert purged == 1
+    assert remaining_rows(db, trouble_id) == NOTHING_LEFT
+    assert_other_thread_kept(db)
+
+
+def test_purger_resumes_partially_deleted_thread(db):
+    trouble = create_thread(db, CHUNK_SIZE * 3)
+    trouble_id = trouble.id
+    trouble.deleted_at = datetime.utcnow()
+    db.commit()
+    # 前回の削除が途中で止まった状態（先頭のチャンクだけ削除済み）
+    first_chunk = [
+        message_id for (message_id,) in
+        db.query(Message.id).filter(Message.trouble_id == trouble_id).order_by(Message.id).limit(CHUNK_SIZE)
+    ]
+    db.query(Message).filter(Message.id.in_(first_chunk)).delete(synchronize_session=False)
+    db.commit()
+
+    assert deletion.TroublePurger(chunk_size=CHUNK_SIZE).purge_pending() == 1
+    assert remaining_rows(db, trouble_id) == NOTHING_LEFT
+    assert_other_thread_kept(db)
@@ -0,0 +1,82 @@
+"""
+お困りごとのフィード（app/api/troubles/feed.py）のキーとカーソルのテスト
+
+キーは作成日時（タイムゾーン無しは UTC）のエポックからのマイクロ秒の整数で、
+サーバーのタイムゾーンに関係なく同じ値になり、カーソルで辿ると重複・欠落なく全件を返すことを確認する
+"""
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core.database import SessionLocal
+from app.api.troubles.feed import _feed_key, decode_cursor, encode_cursor, query_recent_keys
+from app.api.troubles.models import Trouble
+
+
+@pytest.fixture
+def local_timezone():
+    """サーバーのローカルタイムゾーンを切り替える"""
+    original = os.environ.get("TZ")
+
+    def switch(name: str) -> None:
+        os.environ["TZ"] = name
+        time.tzset()
+
+    yield switch
+    if original is None:
+        os.environ.pop("TZ", None)
+    else:
+        os.environ["TZ"] = original
+    time.tzset()
+
+
+def test_key_does_not_depend_on_local_timezone(local_timezone):
+    created_at = datetime(2024, 3, 10, 2, 30, 0, 123456)
+    keys = set()
+    for name in ("UTC", "Asia/Tokyo", "America/New_York"):
+        local_timezone(name)
+        keys.add(_feed_key(created_at, 7))
+    assert keys == {(-1710037800123456, -7)}
+
+    # タイムゾーン付きの日時は UTC に換算する
+    aware = datetime(2024, 3, 10, 11, 30, 0, 123456, tzinfo=timezone(timedelta(hours=9)))
+    assert _feed_key(aware, 7) == (-1710037800123456, -7)
+
+
+def test_cursor_round_trip():
+    key = _feed_key(datetime(2024, 1, 1, 0, 0, 0, 1), 42)
+    assert encode_cursor(key) == "1704067200000001_42"
+    assert decode_cursor(encode_cursor(key)) == key
+    assert decode_cursor("1704067200.000001_42") is None
+    assert decode_cursor("abc") is None
+
+
+def test_paging_with_cursor_returns_every_trouble_once(local_timezone):
+    local_timezone("Asia/Tokyo")
+    db = SessionLocal()
+    try:
+        started = datetime(2024, 1, 1)
+        # 同じ作成日時のお困りごとと、マイクロ秒だけ異なるお困りごとを混ぜる
+        created = [started + timedelta(microseconds=i // 2) for i in range(9)]
+        troubles = [
+            Trouble(title=f"t{i}", description="help", category="IT", project_id=1, author_id=1, created_at=created_at)
+            for i, created_at in enumerate(created)
+        ]
+        db.add_all(troubles)
+        db.commit()
+        expected = sorted(((t.created_at, t.id) for t in troubles), reverse=True)
+
+        seen = []
+        after = None
+        while True:
+            keys = query_recent_keys([db], "IT", after, 2)
+            seen.extend(-trouble_id for _, trouble_id in keys)
+            if len(keys) < 2:
+                break
+            after = decode_cursor(encode_cursor(keys[-1]))
+
+        assert seen == [trouble_id for _, trouble_id in expected]
+    finally:
+        db.close()
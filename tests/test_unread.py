@@ -0,0 +1,55 @@
+"""
+未読管理（app/api/messages/unread.py）のテスト
+
+インデックスの値が古い場合（別のプロセスでメッセージが投稿された場合）でも、
+record が DB の件数を返すことを確認する
+"""
+import pytest
+from sqlalchemy import insert
+
+from app.core.database import SessionLocal
+from app.api.users.models import User
+from app.api.projects.models import Project
+from app.api.troubles.models import Trouble
+from app.api.messages.models import Message
+from app.api.messages.unread import LatestMessageIndex, ThreadHead
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def add_message(db, trouble_id: int) -> int:
+    message = Message(content="hello", user_id=1, trouble_id=trouble_id)
+    db.add(message)
+    db.commit()
+    return message.id
+
+
+def test_record_reloads_stale_head_from_database(db):
+    db.execute(insert(User.__table__), [{"user_id": 1, "name": "user1", "password": "x"}])
+    db.execute(insert(Project.__table__), [{"project_id": 1, "title": "P", "description": "project", "creator_user_id": 1}])
+    trouble = Trouble(title="thread", description="help", category="IT", project_id=1, author_id=1)
+    db.add(trouble)
+    db.commit()
+    index = LatestMessageIndex()
+
+    first = add_message(db, trouble.id)
+    assert index.get_many(db, [trouble.id]) == {trouble.id: ThreadHead(first, 1)}
+
+    # 別のプロセスで投稿され、このプロセスのインデックスには反映されていないメッセージ
+    add_message(db, trouble.id)
+    add_message(db, trouble.id)
+
+    latest = add_message(db, trouble.id)
+    assert index.record(db, trouble.id, latest) == ThreadHead(latest, 4)
+    assert index.get_many(db, [trouble.id]) == {trouble.id: ThreadHead(latest, 4)}
+
+    # 古い位置の record でインデックスが後退しない
+    assert index.record(db, trouble.id, first) == ThreadHead(latest, 4)
+    assert index.get_many(db, [trouble.id]) == {trouble.id: ThreadHead(latest, 4)}